@@ -0,0 +1,79 @@
+import argparse
+import copy
+import time
+
+import numpy as np
+
+from source2converter.mdl.v49 import update_mesh_for_lod
+from source2converter.model import Mesh, ShapeKey
+
+
+def legacy_update_mesh_for_lod(mesh: Mesh):
+    # np.unique/np.isin implementation update_mesh_for_lod replaced, kept as the reference to compare against
+    all_used_indices = np.unique(np.concatenate([strip[1] for strip in mesh.strips]))
+    index_mapping = np.full(np.max(all_used_indices) + 1, -1, dtype=int)
+    index_mapping[all_used_indices] = np.arange(all_used_indices.size)
+    mesh.strips = [(mat_idx, index_mapping[indices]) for mat_idx, indices in mesh.strips]
+    for shape_key in mesh.shape_keys:
+        valid_indices_mask = np.isin(shape_key.indices, all_used_indices)
+        shape_key.indices = index_mapping[shape_key.indices[valid_indices_mask]]
+        for attr, deltas in shape_key.delta_attributes.items():
+            shape_key.delta_attributes[attr] = deltas[valid_indices_mask]
+    mesh.vertex_indices = all_used_indices
+
+
+def make_mesh(vertex_count: int, strip_count: int, shape_key_count: int, lod_ratio: float,
+              rng: np.random.Generator) -> Mesh:
+    # A LOD that uses roughly lod_ratio of the pool, split over strip_count materials
+    lod_vertices = rng.choice(vertex_count, int(vertex_count * lod_ratio), replace=False).astype(np.uint32)
+    triangles = rng.choice(lod_vertices, lod_vertices.size * 6)
+    strips = [(n, chunk) for n, chunk in enumerate(np.array_split(triangles, strip_count))]
+    shape_keys = []
+    for n in range(shape_key_count):
+        indices = np.sort(rng.choice(vertex_count, max(1, vertex_count // 20), replace=False)).astype(np.uint32)
+        shape_keys.append(ShapeKey(f"flex_{n}", indices, {
+            "positions": rng.random((indices.size, 3), dtype=np.float32),
+            "normals": rng.random((indices.size, 3), dtype=np.float32),
+        }))
+    vertex_attributes = {"positions": rng.random((vertex_count, 3), dtype=np.float32)}
+    return Mesh("bench", strips, vertex_attributes, shape_keys)
+
+
+def measure(func, mesh: Mesh, repeats: int) -> tuple[float, Mesh]:
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        work_mesh = copy.deepcopy(mesh)
+        start = time.perf_counter()
+        func(work_mesh)
+        best = min(best, time.perf_counter() - start)
+        result = work_mesh
+    return best, result
+
+
+def check_equal(legacy: Mesh, current: Mesh):
+    assert np.array_equal(legacy.vertex_indices, current.vertex_indices)
+    for (_, legacy_strip), (_, strip) in zip(legacy.strips, current.strips):
+        assert np.array_equal(legacy_strip, strip)
+    for legacy_key, shape_key in zip(legacy.shape_keys, current.shape_keys):
+        assert np.array_equal(legacy_key.indices, shape_key.indices)
+        for attr, deltas in legacy_key.delta_attributes.items():
+            assert np.array_equal(deltas, shape_key.delta_attributes[attr])
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Compare update_mesh_for_lod against the np.unique/np.isin version')
+    args.add_argument('--vertices', type=int, default=200_000)
+    args.add_argument('--strips', type=int, default=8)
+    args.add_argument('--shape-keys', type=int, default=200, dest='shape_keys')
+    args.add_argument('--lod-ratio', type=float, default=0.5, dest='lod_ratio')
+    args.add_argument('--repeats', type=int, default=3)
+    args = args.parse_args()
+
+    source_mesh = make_mesh(args.vertices, args.strips, args.shape_keys, args.lod_ratio, np.random.default_rng(0))
+    legacy_time, legacy_mesh = measure(legacy_update_mesh_for_lod, source_mesh, args.repeats)
+    current_time, current_mesh = measure(update_mesh_for_lod, source_mesh, args.repeats)
+    check_equal(legacy_mesh, current_mesh)
+    print(f"{args.vertices} vertices, {args.shape_keys} shape keys, {args.lod_ratio:.0%} of the pool in the LOD")
+    print(f"np.unique/np.isin: {legacy_time * 1000:9.2f} ms")
+    print(f"presence mask:     {current_time * 1000:9.2f} ms ({legacy_time / current_time:.1f}x)")
@@ -0,0 +1,395 @@
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from source2converter.model import Mesh, ShapeKey
+
+MDL_VERSION = 49
+CHECKSUM = 0x5EED
+MAX_BONE_WEIGHTS = 3
+
+VVD_VERTEX_DTYPE = np.dtype([
+    ("weight", "<f4", (3,)), ("bone_id", "u1", (3,)), ("bone_count", "u1"),
+    ("vertex", "<f4", (3,)), ("normal", "<f4", (3,)), ("uv", "<f4", (2,)),
+])
+VTX_VERTEX_DTYPE = np.dtype([
+    ("bone_weight_index", "u1", (3,)), ("bone_count", "u1"), ("original_mesh_vertex_index", "<u2"),
+    ("bone_id", "i1", (3,)),
+])
+VERTEX_ANIM_DTYPE = np.dtype([
+    ("index", "<u2"), ("speed", "u1"), ("side", "u1"), ("vertex_delta", "<f2", (3,)), ("normal_delta", "<f2", (3,)),
+])
+
+# studiohdr_t of MDL v49, in file order. Every field not set by write_mdl is zero.
+_MDL_HEADER_FIELDS = (
+    ("id", "4s"), ("version", "i"), ("checksum", "i"), ("name", "64s"), ("length", "i"),
+    ("eye_position", "3f"), ("illum_position", "3f"), ("hull_min", "3f"), ("hull_max", "3f"),
+    ("view_bbmin", "3f"), ("view_bbmax", "3f"), ("flags", "i"),
+    ("bone_count", "i"), ("bone_offset", "i"), ("bone_controller_count", "i"), ("bone_controller_offset", "i"),
+    ("hitbox_set_count", "i"), ("hitbox_set_offset", "i"), ("local_anim_count", "i"), ("local_anim_offset", "i"),
+    ("local_seq_count", "i"), ("local_seq_offset", "i"), ("activity_list_version", "i"), ("events_indexed", "i"),
+    ("texture_count", "i"), ("texture_offset", "i"), ("texture_path_count", "i"), ("texture_path_offset", "i"),
+    ("skin_reference_count", "i"), ("skin_family_count", "i"), ("skin_offset", "i"),
+    ("body_part_count", "i"), ("body_part_offset", "i"),
+    ("local_attachment_count", "i"), ("local_attachment_offset", "i"),
+    ("local_node_count", "i"), ("local_node_index", "i"), ("local_node_name_index", "i"),
+    ("flex_desc_count", "i"), ("flex_desc_index", "i"), ("flex_controller_count", "i"),
+    ("flex_controller_index", "i"), ("flex_rules_count", "i"), ("flex_rules_index", "i"),
+    ("ik_chain_count", "i"), ("ik_chain_index", "i"), ("mouths_count", "i"), ("mouths_index", "i"),
+    ("local_pose_param_count", "i"), ("local_pose_param_index", "i"), ("surface_prop_index", "i"),
+    ("key_value_index", "i"), ("key_value_count", "i"),
+    ("local_ik_autoplay_lock_count", "i"), ("local_ik_autoplay_lock_index", "i"),
+    ("mass", "f"), ("contents", "i"), ("include_model_count", "i"), ("include_model_index", "i"),
+    ("virtual_model", "i"), ("anim_blocks_name_index", "i"), ("anim_blocks_count", "i"),
+    ("anim_blocks_index", "i"), ("anim_block_model", "i"), ("bone_table_by_name_index", "i"),
+    ("vertex_base", "i"), ("index_base", "i"), ("directional_light_dot", "B"), ("root_lod", "B"),
+    ("allowed_root_lod_count", "B"), ("unused", "B"), ("unused4", "i"),
+    ("flex_controller_ui_count", "i"), ("flex_controller_ui_index", "i"),
+    ("vert_anim_fixed_point_scale", "f"), ("unused3", "i"), ("studiohdr2_index", "i"), ("unused2", "i"),
+)
+_MDL_HEADER_FORMAT = "<" + "".join(fmt for _, fmt in _MDL_HEADER_FIELDS)
+MDL_HEADER_SIZE = struct.calcsize(_MDL_HEADER_FORMAT)
+STUDIOHDR2_SIZE = 256
+
+
+@dataclass
+class FixtureSpec:
+    vertices: int = 20_000
+    lods: int = 3
+    bodygroups: int = 2
+    materials: int = 2
+    flexes: int = 20
+    texture_size: int = 512
+    seed: int = 0
+
+    def validate(self):
+        if self.vertices // self.materials > 0xFFFF:
+            raise ValueError("VTX indices are 16 bit, use more materials or fewer vertices per model")
+        if min(self.vertices, self.lods, self.bodygroups, self.materials) < 1 or self.vertices < 3 * self.materials:
+            raise ValueError(f"Invalid fixture spec {self}")
+
+
+@dataclass
+class SyntheticFlex:
+    name: str
+    desc_index: int
+    mesh_index: int
+    # Pool (model) relative vertex indices
+    indices: np.ndarray = field(repr=False)
+    positions: np.ndarray = field(repr=False)
+    normals: np.ndarray = field(repr=False)
+
+
+@dataclass
+class SyntheticSubModel:
+    name: str
+    # (start, count) of every mesh in the model vertex pool, one mesh per material
+    mesh_ranges: list[tuple[int, int]]
+    vertices: np.ndarray = field(repr=False)
+    # lod -> mesh -> (strip group vertex list, triangle indices into it)
+    lod_strips: list[list[tuple[np.ndarray, np.ndarray]]] = field(repr=False)
+    flexes: list[SyntheticFlex] = field(repr=False)
+
+    def lod_mesh(self, lod: int) -> Mesh:
+        # Same Mesh convert_mdl_v49 builds for this LOD, before update_mesh_for_lod runs
+        strips = []
+        for mesh_index, (strip_vertices, indices) in enumerate(self.lod_strips[lod]):
+            start, _ = self.mesh_ranges[mesh_index]
+            strips.append((mesh_index, strip_vertices[indices].astype(np.uint32) + start))
+        attributes = {
+            "positions": self.vertices["vertex"],
+            "normals": self.vertices["normal"],
+            "uv0": self.vertices["uv"],
+            "blend_weights": self.vertices["weight"],
+            "blend_indices": self.vertices["bone_id"],
+        }
+        shape_keys = [ShapeKey(flex.name, flex.indices, {"positions": flex.positions, "normals": flex.normals})
+                      for flex in self.flexes]
+        return Mesh(self.name, strips, attributes, shape_keys)
+
+
+@dataclass
+class SyntheticAssets:
+    root: Path
+    model_path: Path
+    material_paths: list[Path]
+    texture_paths: list[Path]
+    sub_models: list[SyntheticSubModel] = field(repr=False)
+
+
+class _Blob:
+    def __init__(self):
+        self.data = bytearray()
+        self._strings: list[tuple[int, int, str]] = []
+
+    def tell(self) -> int:
+        return len(self.data)
+
+    def write(self, fmt: str, *values) -> int:
+        offset = len(self.data)
+        self.data += struct.pack("<" + fmt, *values)
+        return offset
+
+    def write_bytes(self, data: bytes) -> int:
+        offset = len(self.data)
+        self.data += data
+        return offset
+
+    def reserve(self, size: int) -> int:
+        return self.write_bytes(bytes(size))
+
+    def patch(self, offset: int, fmt: str, *values):
+        struct.pack_into("<" + fmt, self.data, offset, *values)
+
+    def align(self, alignment: int):
+        self.data += bytes(-len(self.data) % alignment)
+
+    def string(self, field_offset: int, base_offset: int, value: str):
+        # Patched in finish(), string offsets are relative to base_offset
+        self._strings.append((field_offset, base_offset, value))
+
+    def finish(self) -> bytes:
+        placed = {}
+        for field_offset, base_offset, value in self._strings:
+            if value not in placed:
+                placed[value] = self.write_bytes(value.encode("ascii") + b"\0")
+            self.patch(field_offset, "i", placed[value] - base_offset)
+        return bytes(self.data)
+
+
+def _make_sub_model(name: str, spec: FixtureSpec, rng: np.random.Generator) -> SyntheticSubModel:
+    vertices = np.zeros(spec.vertices, VVD_VERTEX_DTYPE)
+    vertices["vertex"] = rng.uniform(-32, 32, (spec.vertices, 3))
+    normals = rng.normal(size=(spec.vertices, 3))
+    vertices["normal"] = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+    vertices["uv"] = rng.random((spec.vertices, 2))
+    vertices["weight"][:, 0] = 1
+    vertices["bone_id"][:, 0] = rng.integers(0, 2, spec.vertices)
+    vertices["bone_count"] = 1
+
+    mesh_sizes = np.diff(np.linspace(0, spec.vertices, spec.materials + 1).astype(int))
+    mesh_ranges = [(int(start), int(size)) for start, size in zip(np.cumsum(mesh_sizes) - mesh_sizes, mesh_sizes)]
+
+    lod_strips = []
+    for lod in range(spec.lods):
+        meshes = []
+        for _, size in mesh_ranges:
+            # Every LOD halves the vertices a mesh uses, roughly two triangles per used vertex
+            used = np.sort(rng.choice(size, max(3, size >> lod), replace=False)).astype(np.uint16)
+            indices = rng.integers(0, used.size, used.size * 6).astype(np.uint16)
+            meshes.append((used, indices))
+        lod_strips.append(meshes)
+
+    flexes = []
+    for flex_index in range(spec.flexes):
+        mesh_index = flex_index % spec.materials
+        start, size = mesh_ranges[mesh_index]
+        count = max(1, size // 20)
+        flexes.append(SyntheticFlex(
+            f"flex_{flex_index}", flex_index, mesh_index,
+            np.sort(rng.choice(size, count, replace=False)).astype(np.uint32) + start,
+            rng.uniform(-1, 1, (count, 3)).astype(np.float16).astype(np.float32),
+            rng.uniform(-1, 1, (count, 3)).astype(np.float16).astype(np.float32),
+        ))
+    return SyntheticSubModel(name, mesh_ranges, vertices, lod_strips, flexes)
+
+
+def write_mdl(path: Path, name: str, material_names: list[str], material_folder: str,
+              sub_models: list[SyntheticSubModel], flex_count: int):
+    blob = _Blob()
+    header = {field_name: (0.0,) * int(fmt[0]) if fmt[0].isdigit() and fmt[-1] == "f" else 0
+              for field_name, fmt in _MDL_HEADER_FIELDS}
+    blob.reserve(MDL_HEADER_SIZE)
+    # studiohdr2_t, only its name (sznameindex) is set
+    header_2 = blob.reserve(STUDIOHDR2_SIZE)
+    blob.string(header_2 + 20, header_2, name)
+    header["studiohdr2_index"] = header_2
+
+    bone_names = ["root", "child"]
+    header["bone_count"] = len(bone_names)
+    header["bone_offset"] = blob.tell()
+    for bone_index, bone_name in enumerate(bone_names):
+        height = bone_index * 8.0
+        # mstudiobone_t: name, parent, controllers, pos, quat, rot, pos/rot scale, pose to bone, alignment, ...
+        bone = blob.write("ii6i", 0, bone_index - 1, *[-1] * 6)
+        blob.write("3f4f3f3f3f", 0, 0, height, 0, 0, 0, 1, 0, 0, 0, 1, 1, 1, 1, 1, 1)
+        blob.write("12f", 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, -height)
+        blob.write("4f6i8i", 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, *[0] * 8)
+        blob.string(bone, bone, bone_name)
+        blob.string(bone + 176, bone, "default")
+    header["bone_table_by_name_index"] = blob.write_bytes(bytes(range(len(bone_names))))
+    blob.align(4)
+
+    header["texture_count"] = len(material_names)
+    header["texture_offset"] = blob.tell()
+    for material_name in material_names:
+        texture = blob.write("6i10i", *[0] * 16)
+        blob.string(texture, texture, material_name)
+    header["texture_path_count"] = 1
+    header["texture_path_offset"] = blob.write("i", 0)
+    # cdtextures are absolute offsets
+    blob.string(header["texture_path_offset"], 0, material_folder)
+    header["skin_reference_count"] = len(material_names)
+    header["skin_family_count"] = 1
+    header["skin_offset"] = blob.write(f"{len(material_names)}h", *range(len(material_names)))
+    blob.align(4)
+
+    header["flex_desc_count"] = flex_count
+    header["flex_desc_index"] = blob.tell()
+    for flex_index in range(flex_count):
+        flex_desc = blob.write("i", 0)
+        blob.string(flex_desc, flex_desc, f"flex_{flex_index}")
+
+    header["body_part_count"] = len(sub_models)
+    header["body_part_offset"] = blob.reserve(16 * len(sub_models))
+    vertex_start = 0
+    for part_index, sub_model in enumerate(sub_models):
+        body_part = header["body_part_offset"] + part_index * 16
+        model = blob.reserve(148)
+        blob.patch(body_part + 4, "iii", 1, 1, model - body_part)
+        blob.string(body_part, body_part, f"body_{part_index}")
+        meshes = blob.reserve(116 * len(sub_model.mesh_ranges))
+        blob.patch(model, "64sif", sub_model.name.encode("ascii"), 0, 64.0)
+        blob.patch(model + 72, "iiiii", len(sub_model.mesh_ranges), meshes - model, len(sub_model.vertices),
+                   vertex_start * VVD_VERTEX_DTYPE.itemsize, vertex_start * 16)
+        for mesh_index, (start, size) in enumerate(sub_model.mesh_ranges):
+            mesh = meshes + mesh_index * 116
+            mesh_flexes = [flex for flex in sub_model.flexes if flex.mesh_index == mesh_index]
+            flexes = blob.reserve(60 * len(mesh_flexes))
+            blob.patch(mesh, "iiiiiiiii", mesh_index, model - mesh, size, start, len(mesh_flexes), flexes - mesh,
+                       0, 0, mesh_index)
+            blob.patch(mesh + 52, "8i", *[size] * 8)
+            for flex_number, flex in enumerate(mesh_flexes):
+                flex_offset = flexes + flex_number * 60
+                vertex_anims = np.zeros(len(flex.indices), VERTEX_ANIM_DTYPE)
+                vertex_anims["index"] = flex.indices - start
+                vertex_anims["speed"] = 255
+                vertex_anims["vertex_delta"] = flex.positions
+                vertex_anims["normal_delta"] = flex.normals
+                anims = blob.write_bytes(vertex_anims.tobytes())
+                blob.patch(flex_offset, "i4fiii", flex.desc_index, 0, 1, 1, 1,
+                           len(vertex_anims), anims - flex_offset, 0)
+        vertex_start += len(sub_model.vertices)
+        blob.align(4)
+
+    header.update(id=b"IDST", version=MDL_VERSION, checksum=CHECKSUM, name=name.encode("ascii"),
+                  hull_min=(-32, -32, -32), hull_max=(32, 32, 32), mass=1.0)
+    data = bytearray(blob.finish())
+    header["length"] = len(data)
+    values = []
+    for field_name, _ in _MDL_HEADER_FIELDS:
+        value = header[field_name]
+        values.extend(value) if isinstance(value, tuple) else values.append(value)
+    struct.pack_into(_MDL_HEADER_FORMAT, data, 0, *values)
+    path.write_bytes(data)
+
+
+def write_vvd(path: Path, sub_models: list[SyntheticSubModel], lod_count: int):
+    vertices = np.concatenate([sub_model.vertices for sub_model in sub_models])
+    tangents = np.zeros((len(vertices), 4), np.float32)
+    tangents[:, 0] = 1
+    tangents[:, 3] = 1
+    header_size = 64
+    vertex_data_start = header_size
+    tangent_data_start = vertex_data_start + vertices.nbytes
+    header = struct.pack("<4siii8iiiii", b"IDSV", 4, CHECKSUM, lod_count, *[len(vertices)] * 8,
+                         0, 0, vertex_data_start, tangent_data_start)
+    path.write_bytes(header + vertices.tobytes() + tangents.tobytes())
+
+
+def write_vtx(path: Path, sub_models: list[SyntheticSubModel], lod_count: int):
+    blob = _Blob()
+    header = blob.write("iiHHiiiiii", 7, 24, 53, 9, MAX_BONE_WEIGHTS, CHECKSUM, lod_count, 0, len(sub_models), 0)
+    body_parts = blob.reserve(8 * len(sub_models))
+    blob.patch(header + 32, "i", body_parts - header)
+    for part_index, sub_model in enumerate(sub_models):
+        body_part = body_parts + part_index * 8
+        model = blob.reserve(8)
+        blob.patch(body_part, "ii", 1, model - body_part)
+        lods = blob.reserve(12 * lod_count)
+        blob.patch(model, "ii", lod_count, lods - model)
+        for lod_index, lod_meshes in enumerate(sub_model.lod_strips):
+            lod = lods + lod_index * 12
+            meshes = blob.reserve(9 * len(lod_meshes))
+            blob.patch(lod, "iif", len(lod_meshes), meshes - lod, float(lod_index * 10))
+            for mesh_index, (strip_vertices, indices) in enumerate(lod_meshes):
+                mesh = meshes + mesh_index * 9
+                strip_group = blob.reserve(25)
+                blob.patch(mesh, "iiB", 1, strip_group - mesh, 0)
+                vertexes = np.zeros(len(strip_vertices), VTX_VERTEX_DTYPE)
+                vertexes["bone_weight_index"] = (0, 1, 2)
+                vertexes["bone_count"] = 1
+                vertexes["original_mesh_vertex_index"] = strip_vertices
+                vertex_offset = blob.write_bytes(vertexes.tobytes())
+                index_offset = blob.write_bytes(indices.astype("<u2").tobytes())
+                strip = blob.write("iiiihBii", len(indices), 0, len(strip_vertices), 0, 1, 1, 0, 0)
+                blob.patch(strip_group, "iiiiiiB", len(strip_vertices), vertex_offset - strip_group,
+                           len(indices), index_offset - strip_group, 1, strip - strip_group, 0)
+    material_replacements = blob.reserve(8 * lod_count)
+    blob.patch(header + 24, "i", material_replacements - header)
+    path.write_bytes(blob.finish())
+
+
+def write_vtf(path: Path, size: int, rng: np.random.Generator, normal_map: bool = False):
+    # VTF 7.2, a single RGBA8888 mip and no low res thumbnail
+    if normal_map:
+        normals = rng.normal((0, 0, 4), 1, (size, size, 3))
+        normals /= np.linalg.norm(normals, axis=2, keepdims=True)
+        rgb = (normals * 127.5 + 127.5).astype(np.uint8)
+    else:
+        gradient = np.linspace(0, 255, size, dtype=np.float32)
+        rgb = np.stack(np.broadcast_arrays(gradient[None, :], gradient[:, None], rng.uniform(0, 255, (size, size))),
+                       axis=2).astype(np.uint8)
+    alpha = rng.integers(0, 256, (size, size, 1), dtype=np.uint8)
+    pixels = np.concatenate([rgb, alpha], axis=2)
+    header = struct.pack("<4s2IIHHIHH4x3f4xfIBIBBH", b"VTF\0", 7, 2, 80, size, size, 0, 1, 0,
+                         0.5, 0.5, 0.5, 1.0, 0, 1, 0xFFFFFFFF, 0, 0, 1)
+    path.write_bytes(header.ljust(80, b"\0") + pixels.tobytes())
+
+
+def write_vmt(path: Path, texture_folder: str, material_name: str, flexed: bool):
+    lines = ['"VertexLitGeneric"', "{",
+             f'\t"$basetexture" "{texture_folder}/{material_name}_color"',
+             f'\t"$bumpmap" "{texture_folder}/{material_name}_normal"',
+             f'\t"$phongexponenttexture" "{texture_folder}/{material_name}_exponent"',
+             '\t"$phong" "1"',
+             '\t"$basemapalphaphongmask" "1"']
+    if flexed:
+        lines.append('\t"$blendtintbybasealpha" "1"')
+    lines.append("}")
+    path.write_text("\n".join(lines) + "\n", encoding="utf8")
+
+
+def generate_fixtures(root: Path, spec: FixtureSpec) -> SyntheticAssets:
+    """Writes a synthetic model with its materials and textures as a loose Source1 content folder under root."""
+    spec.validate()
+    rng = np.random.default_rng(spec.seed)
+    model_folder = "models/bench"
+    material_folder = f"{model_folder}/"
+    (root / model_folder).mkdir(parents=True, exist_ok=True)
+    (root / "materials" / model_folder).mkdir(parents=True, exist_ok=True)
+    (root / "gameinfo.txt").write_text('"GameInfo"\n{\n\tgame "Source2Converter benchmark"\n\tFileSystem\n\t{\n'
+                                       '\t\tSearchPaths\n\t\t{\n\t\t\tGame |gameinfo_path|.\n\t\t}\n\t}\n}\n',
+                                       encoding="utf8")
+
+    material_names = [f"bench_mat_{index}" for index in range(spec.materials)]
+    material_paths = []
+    texture_paths = []
+    for material_name in material_names:
+        material_path = Path("materials", model_folder, material_name + ".vmt")
+        write_vmt(root / material_path, model_folder, material_name, spec.flexes > 0)
+        material_paths.append(material_path)
+        for suffix in ("color", "normal", "exponent"):
+            texture_path = Path("materials", model_folder, f"{material_name}_{suffix}.vtf")
+            write_vtf(root / texture_path, spec.texture_size, rng, suffix == "normal")
+            texture_paths.append(texture_path)
+
+    sub_models = [_make_sub_model(f"body_{index}_model", spec, rng) for index in range(spec.bodygroups)]
+    model_path = Path(model_folder, "bench_model.mdl")
+    # The MDL name is relative to the models folder
+    write_mdl(root / model_path, model_path.relative_to("models").as_posix(), material_names, material_folder, sub_models, spec.flexes)
+    write_vvd(root / model_path.with_suffix(".vvd"), sub_models, spec.lods)
+    write_vtx(root / model_path.with_suffix(".dx90.vtx"), sub_models, spec.lods)
+    return SyntheticAssets(root, model_path, material_paths, texture_paths, sub_models)
@@ -0,0 +1,163 @@
+import argparse
+import copy
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from benchmarks.fixtures import FixtureSpec, SyntheticAssets, generate_fixtures
+from source2converter.dmx import save_dmx, save_dmx_jobs
+from source2converter.materials.source1.vertex_lit_generic import convert_vertex_lit_generic_flexed
+from source2converter.materials.texture_cache import get_texture_cache
+from source2converter.materials.texture_writer import get_texture_writer
+from source2converter.mdl.v49 import convert_mdl_v49, update_mesh_for_lod
+from source2converter.pipeline import build_vmdl
+
+RESULTS_VERSION = 1
+
+
+def measure(func: Callable[[], object], repeats: int, setup: Callable[[], object] = None) -> dict:
+    runs = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {"best": min(runs), "mean": statistics.fmean(runs), "runs": runs}
+
+
+def run_suite(assets: SyntheticAssets, output_path: Path, repeats: int) -> dict[str, dict]:
+    content_manager = ContentManager()
+    content_manager.scan_for_content(assets.root)
+    model_path = assets.model_path
+    stages = {}
+
+    def convert():
+        return convert_mdl_v49(model_path, content_manager.find_file(model_path), content_manager)
+
+    stages["convert_mdl_v49"] = measure(convert, repeats)
+
+    lod_meshes = [sub_model.lod_mesh(lod) for sub_model in assets.sub_models
+                  for lod in range(len(sub_model.lod_strips))]
+    work_meshes = []
+
+    def copy_meshes():
+        work_meshes[:] = [copy.copy(mesh) for mesh in lod_meshes]
+        for mesh in work_meshes:
+            mesh.shape_keys = [copy.copy(shape_key) for shape_key in mesh.shape_keys]
+            for shape_key in mesh.shape_keys:
+                shape_key.delta_attributes = dict(shape_key.delta_attributes)
+
+    def update_lods():
+        for mesh in work_meshes:
+            update_mesh_for_lod(mesh)
+
+    stages["update_mesh_for_lod"] = measure(update_lods, repeats, copy_meshes)
+
+    model = convert()
+    vmdl, dmx_jobs = build_vmdl(model, model_path, output_path)
+    for job in dmx_jobs:
+        job.output_path.parent.mkdir(parents=True, exist_ok=True)
+    stages["export_dmx"] = measure(lambda: save_dmx_jobs(dmx_jobs, 1, "datamodel"), repeats)
+    # Not in DMX_WRITERS yet, so save_dmx_jobs does not take it
+    stages["export_dmx_stream"] = measure(lambda: [save_dmx(job, "stream") for job in dmx_jobs], repeats)
+    stages["vmdl_write"] = measure(vmdl.write, repeats)
+
+    def convert_materials():
+        for material_path in assets.material_paths:
+            # Converters get the path relative to the materials folder, like in pipeline.convert_material
+            convert_vertex_lit_generic_flexed(material_path.relative_to("materials"),
+                                              content_manager.find_file(material_path), content_manager)
+
+    # Decoding the VTFs is part of the stage, start every run with a cold texture cache
+    stages["convert_vertex_lit_generic_flexed"] = measure(convert_materials, repeats, get_texture_cache().clear)
+
+    textures = [texture for material_path in assets.material_paths
+                for texture in convert_vertex_lit_generic_flexed(material_path.relative_to("materials"),
+                                                                 content_manager.find_file(material_path),
+                                                                 content_manager)[1]]
+    texture_writer = get_texture_writer()
+
+    def write_textures():
+        for texture in textures:
+            texture_writer.submit(texture.image, output_path / texture.filepath)
+        texture_writer.flush()
+
+    stages["texture_write"] = measure(write_textures, repeats)
+    return stages
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    if results["fixture"] != baseline["fixture"]:
+        print("Warning: the baseline was recorded with a different fixture spec, numbers are not comparable")
+    for stage, timing in results["stages"].items():
+        baseline_timing = baseline["stages"].get(stage)
+        if baseline_timing is None:
+            print(f"{stage:<36} {timing['best'] * 1000:10.2f} ms  (not in baseline)")
+            continue
+        ratio = timing["best"] / baseline_timing["best"]
+        regressed = ratio > 1 + tolerance
+        print(f"{stage:<36} {timing['best'] * 1000:10.2f} ms  baseline {baseline_timing['best'] * 1000:10.2f} ms"
+              f"  {ratio:5.2f}x{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(stage)
+    return regressions
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Time the conversion stages on synthetic Source1 assets')
+    args.add_argument('--vertices', type=int, default=FixtureSpec.vertices, help='Vertices per bodygroup model')
+    args.add_argument('--lods', type=int, default=FixtureSpec.lods)
+    args.add_argument('--bodygroups', type=int, default=FixtureSpec.bodygroups)
+    args.add_argument('--materials', type=int, default=FixtureSpec.materials, help='Materials (and meshes) per model')
+    args.add_argument('--flexes', type=int, default=FixtureSpec.flexes)
+    args.add_argument('--texture-size', type=int, default=FixtureSpec.texture_size, dest='texture_size')
+    args.add_argument('--seed', type=int, default=FixtureSpec.seed)
+    args.add_argument('--repeats', type=int, default=3)
+    args.add_argument('-o', '--output', type=str, dest='output', help='Write results to this JSON file')
+    args.add_argument('-b', '--baseline', type=str, dest='baseline', help='Compare against this results file')
+    args.add_argument('--tolerance', type=float, default=0.25,
+                      help='Allowed slowdown of the best time against the baseline, 0.25 = 25%%')
+    args.add_argument('--keep', type=str, dest='keep', help='Generate fixtures and outputs here and keep them')
+    args = args.parse_args()
+
+    spec = FixtureSpec(args.vertices, args.lods, args.bodygroups, args.materials, args.flexes, args.texture_size,
+                       args.seed)
+    work_path = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix="s2c_bench_"))
+    try:
+        synthetic_assets = generate_fixtures(work_path / "source1", spec)
+        stage_results = run_suite(synthetic_assets, work_path / "source2", args.repeats)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    bench_results = {
+        "version": RESULTS_VERSION,
+        "fixture": asdict(spec),
+        "repeats": args.repeats,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "stages": stage_results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(bench_results, indent=2), encoding="utf8")
+
+    if args.baseline:
+        baseline_results = json.loads(Path(args.baseline).read_text(encoding="utf8"))
+        failed_stages = compare(bench_results, baseline_results, args.tolerance)
+        if failed_stages:
+            print(f"{len(failed_stages)} stage(s) slower than the baseline: {', '.join(failed_stages)}")
+            sys.exit(1)
+    else:
+        for stage_name, stage_timing in stage_results.items():
+            print(f"{stage_name:<36} {stage_timing['best'] * 1000:10.2f} ms"
+                  f"  (mean {stage_timing['mean'] * 1000:.2f} ms)")
@@ -18,6 +18,8 @@ from SourceIO.library.utils import FileBuffer, datamodel
 from SourceIO.library.utils.common import get_slice
 from SourceIO.library.utils.path_utilities import find_vtx_cm
 from material_converter import convert_material, Material, GameType
+from source2converter.materials.registry import MaterialRegistry
+from source2converter.output_writer import get_output_writer
 
 from pathlib import Path
 import argparse
@@ -130,46 +132,46 @@ def _convert_model(mdl: MdlV49, vvd: Vvd, model: Model, vtx_model: VtxModel, s2_
                 if mdl_flex.partner_index != 0:
                     flex_name = flex_name[:-1]
                 if flex_name not in delta_states:
-                    vertex_delta_data = delta_states[flex_name] = \
-                        dm_model.mesh_add_delta_state(dm_mesh, flex_name)
-                    vertex_delta_data[attribute_names['pos']] = datamodel.make_array([], datamodel.Vector3)
-                    vertex_delta_data[attribute_names['pos'] + "Indices"] = datamodel.make_array([], int)
-                    vertex_delta_data[attribute_names['norm']] = datamodel.make_array([], datamodel.Vector3)
-                    vertex_delta_data[attribute_names['norm'] + "Indices"] = datamodel.make_array([], int)
-
-                    if mdl_flex.vertex_anim_type == VertexAminationType.WRINKLE:
-                        vertex_delta_data["vertexFormat"].append(attribute_names["wrinkle"])
-                        vertex_delta_data[attribute_names["wrinkle"]] = datamodel.make_array([], float)
-                        vertex_delta_data[attribute_names["wrinkle"] + "Indices"] = datamodel.make_array([], int)
-
-        for mesh in model.meshes:
-            for mdl_flex in mesh.flexes:
-                flex_name = mdl.flex_names[mdl_flex.flex_desc_index]
-                if mdl_flex.partner_index != 0:
-                    flex_name = flex_name[:-1]
-                vertex_delta_data = delta_states[flex_name]
-                flex_indices = mdl_flex.vertex_animations["index"] + mesh.vertex_index_start
-                vertex_delta_data[attribute_names['pos']].extend(
-                    map(datamodel.Vector3, mdl_flex.vertex_animations["vertex_delta"]))
-                vertex_delta_data[attribute_names['pos'] + "Indices"].extend(flex_indices.ravel())
-
-                vertex_delta_data[attribute_names['norm']].extend(
-                    map(datamodel.Vector3, mdl_flex.vertex_animations["normal_delta"]))
-                vertex_delta_data[attribute_names['norm'] + "Indices"].extend(flex_indices.ravel())
-
+                    delta_states[flex_name] = {"indices": [], "pos": [], "norm": [], "wrinkle": [],
+                                               "wrinkle_indices": []}
+                # Collect numpy chunks per flex, the datamodel arrays are built once below
+                delta_chunks = delta_states[flex_name]
+                flex_indices = mdl_flex.vertex_animations["index"].astype(np.uint32) + mesh.vertex_index_start
+                delta_chunks["indices"].append(flex_indices.ravel())
+                delta_chunks["pos"].append(mdl_flex.vertex_animations["vertex_delta"])
+                delta_chunks["norm"].append(mdl_flex.vertex_animations["normal_delta"])
                 if mdl_flex.vertex_anim_type == VertexAminationType.WRINKLE:
-                    vertex_delta_data[attribute_names["wrinkle"]].extend(
-                        mdl_flex.vertex_animations["wrinkle_delta"].ravel())
-                    vertex_delta_data[attribute_names["wrinkle"] + "Indices"].extend(flex_indices.ravel())
-
-    dm_model.save(s2_output_path / output_path, "keyvalues2", 1)
+                    delta_chunks["wrinkle"].append(mdl_flex.vertex_animations["wrinkle_delta"].ravel())
+                    delta_chunks["wrinkle_indices"].append(flex_indices.ravel())
+
+        for flex_name, delta_chunks in delta_states.items():
+            vertex_delta_data = dm_model.mesh_add_delta_state(dm_mesh, flex_name)
+            flex_indices = np.concatenate(delta_chunks["indices"]).tolist()
+            vertex_delta_data[attribute_names['pos']] = datamodel.make_array(
+                np.concatenate(delta_chunks["pos"]).tolist(), datamodel.Vector3)
+            vertex_delta_data[attribute_names['pos'] + "Indices"] = datamodel.make_array(flex_indices, int)
+            vertex_delta_data[attribute_names['norm']] = datamodel.make_array(
+                np.concatenate(delta_chunks["norm"]).tolist(), datamodel.Vector3)
+            vertex_delta_data[attribute_names['norm'] + "Indices"] = datamodel.make_array(flex_indices, int)
+
+            if delta_chunks["wrinkle"]:
+                vertex_delta_data["vertexFormat"].append(attribute_names["wrinkle"])
+                vertex_delta_data[attribute_names["wrinkle"]] = datamodel.make_array(
+                    np.concatenate(delta_chunks["wrinkle"]).tolist(), float)
+                vertex_delta_data[attribute_names["wrinkle"] + "Indices"] = datamodel.make_array(
+                    np.concatenate(delta_chunks["wrinkle_indices"]).tolist(), int)
+
+    get_output_writer().submit(s2_output_path / output_path, lambda path: dm_model.save(path, "keyvalues2", 1))
 
     return output_path
 
 
-def convert_mdl(mdl_path: Path, s2_output_path: Path, game: GameType = GameType.CS2):
-    cm = ContentManager()
-    cm.scan_for_content(mdl_path)
+def convert_mdl(mdl_path: Path, s2_output_path: Path, game: GameType = GameType.CS2,
+                registry: Optional[MaterialRegistry] = None, cm: Optional[ContentManager] = None):
+    # Pass a content manager that already scanned the model's game when converting more than one model
+    if cm is None:
+        cm = ContentManager()
+        cm.scan_for_content(mdl_path)
     with FileBuffer(mdl_path) as f:
         mdl = MdlV49.from_buffer(f)
     with cm.find_file(mdl_path.with_suffix('.vvd')) as f:
@@ -225,19 +227,20 @@ def convert_mdl(mdl_path: Path, s2_output_path: Path, game: GameType = GameType.
             vmdl.add_bodygroup_choice(bodygroup, sanitize_name(mesh.name))
 
     s2_vmodel = (s2_output_path / rel_model_path.with_suffix('.vmdl'))
-    with s2_vmodel.open('w') as f:
-        f.write(vmdl.dump())
+    get_output_writer().write_text(s2_vmodel, vmdl.dump())
 
     print('\033[94mConverting materials\033[0m')
     for mat in s1_materials:
         mat_name = normalize_path(mat[0])
         print('\t\033[94mConverting \033[92m"{}"\033[0m'.format(mat_name))
-        result, error_message = convert_material(mat, s2_output_path, game)
+        result, error_message = convert_material(mat, s2_output_path, game, registry)
         if result:
             pass
         else:
             print(f'\033[91m{error_message}\033[0m')
 
+    # Meshes and the vmdl were written in the background, resourcecompiler needs them on disk
+    get_output_writer().flush()
     return s2_vmodel
 
 
@@ -283,17 +286,23 @@ if __name__ == '__main__':
     else:
         SourceLogMan().set_logging_level(INFO)
 
+    # Materials shared between the converted models are only written once per run
+    material_registry = MaterialRegistry()
     for file in files:
         file = Path(file)
+        # Scanned once per argument, every model of a folder shares the same search paths
+        content_manager = ContentManager()
+        content_manager.scan_for_content(file)
         if file.is_dir():
             for glob_file in file.rglob('*.mdl'):
                 if not glob_file.with_suffix('.vvd').exists():
                     print(f'\033[91mSkipping {glob_file.relative_to(file)} because of missing .vvd file\033[0m')
                     continue
-                vmdl_file = convert_mdl(glob_file, output_folder, GameType(args.game))
+                vmdl_file = convert_mdl(glob_file, output_folder, GameType(args.game), material_registry,
+                                        content_manager)
                 if args.auto_compile:
                     compile_model(vmdl_file, output_folder)
         elif file.is_file() and file.exists():
-            vmdl_file = convert_mdl(file, output_folder, GameType(args.game))
+            vmdl_file = convert_mdl(file, output_folder, GameType(args.game), material_registry, content_manager)
             if args.auto_compile:
                 compile_model(vmdl_file, output_folder)
@@ -1,6 +1,6 @@
 import sys
 from pathlib import Path
-from typing import Tuple, TypeVar, Type
+from typing import Optional, Tuple, TypeVar, Type
 
 from SourceIO.library.source1.vmt import VMT
 from shader_converters.eyerefract import EyeRefract
@@ -8,6 +8,8 @@ from shader_converters.lightmappedgeneric import LightmappedGeneric
 from shader_converters.shader_base import ShaderBase, GameType
 from shader_converters.unlitgeneric import UnlitGeneric
 from shader_converters.vertexlitgeneric import VertexLitGeneric
+from source2converter.materials.registry import MaterialRegistry, ConvertedMaterial
+from source2converter.output_writer import get_output_writer
 from utils import normalize_path
 
 MaterialName = TypeVar('MaterialName', str, str)
@@ -25,14 +27,31 @@ s1_to_s2_shader = {
     "eyerefract": EyeRefract,
 }
 
-def convert_material(material: Material, s2_output_path: Path, game: GameType = GameType.CS2):
+def convert_material(material: Material, s2_output_path: Path, game: GameType = GameType.CS2,
+                     registry: Optional[MaterialRegistry] = None):
     if not (material[0] and material[2]):
         return False, f"Failed to open file {material[0]}"
+    material_path = Path(material[1]) / material[0]
+    if registry is not None and not registry.claim(material_path, game):
+        return True, "Already converted"
+    converted = None
+    try:
+        result, converted = _convert_material(material, s2_output_path, game)
+    finally:
+        # Unsupported or failed materials give their claim back, another model may still get them converted
+        if registry is not None:
+            if converted is None:
+                registry.release(material_path, game)
+            else:
+                registry.complete(material_path, game, converted)
+    return result
+
+def _convert_material(material: Material, s2_output_path: Path, game: GameType):
     vmt = VMT(material[2], material[0])
     shader_converter: Type[ShaderBase] = s1_to_s2_shader.get(vmt.shader, None)
     if shader_converter is None:
         # sys.stderr.write(f'Unsupported shader: "{vmt.shader}"\n')
-        return False, f'Unsupported Source1 shader {vmt.shader}!'
+        return (False, f'Unsupported Source1 shader {vmt.shader}!'), None
 
     mat_path = normalize_path(Path(material[1]) / material[0])
     mat_name = mat_path.stem
@@ -43,4 +62,9 @@ def convert_material(material: Material, s2_output_path: Path, game: GameType =
     except Exception as ex:
         print(f'Failed to convert {material[2]} due to {ex}')
     converter.write_vmat()
-    return True, vmt.shader
+    try:
+        # Only this material's textures and vmat, the model's DMX and VMDL writes are left to convert_mdl's flush
+        get_output_writer().wait(converter.pending_writes)
+    except Exception as ex:
+        return (False, f'Failed to write textures of {material[2]} due to {ex}'), None
+    return (True, vmt.shader), ConvertedMaterial(Path(mat_path, f'{mat_name}.vmat'), converter.written_textures)
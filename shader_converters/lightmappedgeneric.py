@@ -1,5 +1,3 @@
-from PIL import ImageOps
-
 from .shader_base import ShaderBase
 
 
@@ -24,7 +22,7 @@ class LightmappedGeneric(ShaderBase):
 
         base_texture_param = material.get_string('$basetexture', None)
         if base_texture_param is not None:
-            base_texture = self._textures['color_map'] = self.load_texture(base_texture_param)
+            base_texture = self._textures['color_map'] = self.lazy_texture(base_texture_param)
 
             if material.get_int('$basemapalphaphongmask', 0):
                 self._textures['phong_map'] = base_texture.getchannel('A')
@@ -44,7 +42,7 @@ class LightmappedGeneric(ShaderBase):
         if normal_texture_param is None:
             normal_texture_param = material.get_string('$normalmap', None)
         if normal_texture_param is not None:
-            normal_texture = self._textures['normal_map'] = self.load_texture(normal_texture_param)
+            normal_texture = self._textures['normal_map'] = self.lazy_texture(normal_texture_param)
             if material.get_int('$basemapalphaphongmask', 0):
                 self._textures['phong_map'] = normal_texture.getchannel('A')
             if material.get_int('$normalmapalphaenvmapmask', 0):
@@ -52,21 +50,21 @@ class LightmappedGeneric(ShaderBase):
 
         env_mask_texture_param = material.get_string('$envmapmask', None)
         if material.get_string("$envmap", None) is not None and env_mask_texture_param is not None:
-            self._textures['env_map'] = self.load_texture(env_mask_texture_param)
+            self._textures['env_map'] = self.lazy_texture(env_mask_texture_param)
 
         phong_exp_texture_param = material.get_string('$phongexponenttexture', None)
         if phong_exp_texture_param is not None:
-            self._textures['phong_exp_map'] = self.load_texture(phong_exp_texture_param)
+            self._textures['phong_exp_map'] = self.lazy_texture(phong_exp_texture_param)
 
         selfillum_mask_texture_param = material.get_string('$selfillummask', None)
         if selfillum_mask_texture_param is not None and material.get_int('$selfillum', 0):
-            self._textures['illum_mask'] = self.load_texture(selfillum_mask_texture_param)
+            self._textures['illum_mask'] = self.lazy_texture(selfillum_mask_texture_param)
 
         ao_texture_param = material.get_string('$ambientoccltexture', None)
         if ao_texture_param is None:
             ao_texture_param = material.get_string('$ambientocclusiontexture', None)
         if ao_texture_param is not None:
-            self._textures['ao_map'] = self.load_texture(ao_texture_param)
+            self._textures['ao_map'] = self.lazy_texture(ao_texture_param)
 
         if 'color_map' in self._textures:
             vmat_params['TextureColor'] = self.write_texture(self._textures['color_map'].convert("RGB"), 'color')
@@ -89,8 +87,7 @@ class LightmappedGeneric(ShaderBase):
         if material.get_int('$phong', 0):
             vmat_params['F_SPECULAR'] = 1
             if 'phong_exp_map' in self._textures:
-                phong_exp_map_flip = self._textures['phong_exp_map'].convert('RGB')
-                phong_exp_map_flip = ImageOps.invert(phong_exp_map_flip)
+                phong_exp_map_flip = self._textures['phong_exp_map'].invert().convert('RGB')
                 vmat_params['TextureRoughness'] = self.write_texture(phong_exp_map_flip, 'rough')
             elif material.get_int('$phongexponent', 0):
                 spec_value = material.get_int('$phongexponent', 0)
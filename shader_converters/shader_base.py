@@ -1,17 +1,18 @@
-import os
+import io
+from concurrent.futures import Future
 from pathlib import Path
 from typing import Dict
 from enum import Enum
 
-import numpy as np
-from PIL import Image
-
 from SourceIO.library.source1.vmt import VMT
 from SourceIO.library.shared.content_providers.content_manager import ContentManager
-from SourceIO.library.source1.vtf import load_texture
 from SourceIO.library.utils.s1_keyvalues import KVWriter
 
 from SourceIO.library.utils.logging_stub import BPYLoggingManager
+from source2converter.materials.source1.common import load_texture as load_cached_texture, lazy_texture, \
+    resolve_texture, TextureLike
+from source2converter.materials.texture_writer import get_texture_writer, TextureOutputSettings, TextureCodec
+from source2converter.output_writer import get_output_writer
 
 log_manager = BPYLoggingManager()
 
@@ -35,8 +36,11 @@ class ShaderBase:
         self.sub_path = sub_path
         self._vmt = vmt
         self._output_path = output_path
-        self._textures: Dict[str, Image.Image] = {}
+        self._textures: Dict[str, TextureLike] = {}
         self._vmat_params = {'shader': shader_names[game], 'F_MORPH_SUPPORTED': 1}
+        self.written_textures: list[Path] = []
+        # Writes queued on the output writer, the caller waits for these before trusting the material
+        self.pending_writes: list[Future] = []
 
         self.logger = log_manager.get_logger(self.__class__.__name__)
 
@@ -49,39 +53,39 @@ class ShaderBase:
 
     def write_vmat(self):
         save_path = self._output_path / self.sub_path / f'{self.name}.vmat'
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        with save_path.open('w') as file:
-            file.write('// Generated by Source2Converter\r\n')
-            writer = KVWriter(file)
-            writer.write(('Layer0', self._vmat_params), 1, True)
+        file = io.StringIO()
+        file.write('// Generated by Source2Converter\r\n')
+        writer = KVWriter(file)
+        writer.write(('Layer0', self._vmat_params), 1, True)
+        self.pending_writes.append(get_output_writer().write_text(save_path, file.getvalue()))
 
     def load_texture(self, texture_path):
-        content_manager = ContentManager()
-        self.logger.info(f"Loading texture {texture_path}")
-        texture_data = content_manager.find_texture(texture_path)
-        if texture_path:
-            texture_data, width, height = load_texture(texture_data)
-            texture_data = np.flipud(texture_data)
-            texture = Image.frombytes("RGBA", (height, width), (texture_data * 255).astype(np.uint8))
-            return texture
-        else:
-            self.logger.error(f"Texture {texture_path} not found!")
-        return None
+        return load_cached_texture(texture_path, ContentManager())
+
+    def lazy_texture(self, texture_path):
+        return lazy_texture(texture_path, ContentManager())
 
     @staticmethod
-    def _write_settings(filename: Path, props: dict):
-        with filename.open('w') as settings:
-            settings.write('"settings"\n{\n')
-            for _key, _value in props.items():
-                settings.write(f'\t"{_key}"\t{_value}\n')
-            settings.write('}\n')
-
-    def write_texture(self, image: Image.Image, suffix='unk', settings=None):
-        save_path = self._output_path / 'materials' / self.sub_path
-        os.makedirs(save_path, exist_ok=True)
-        save_path /= f'{self.name}_{suffix}.tga'
-        self.logger.info(f'Wrote texture to {save_path}')
-        image.save(save_path)
+    def texture_settings():
+        return TextureOutputSettings(TextureCodec.TGA, get_texture_writer().settings.compress_level)
+
+    def _write_settings(self, filename: Path, props: dict):
+        settings = io.StringIO()
+        settings.write('"settings"\n{\n')
+        for _key, _value in props.items():
+            settings.write(f'\t"{_key}"\t{_value}\n')
+        settings.write('}\n')
+        self.pending_writes.append(get_output_writer().write_text(filename, settings.getvalue()))
+
+    def write_texture(self, image: TextureLike, suffix='unk', settings=None):
+        image = resolve_texture(image)
+        if image is None:
+            raise ValueError(f'Texture {self.name}_{suffix} could not be loaded')
+        save_path = self._output_path / 'materials' / self.sub_path / f'{self.name}_{suffix}.tga'
+        self.logger.info(f'Writing texture to {save_path}')
+        # Legacy converters always wrote uncompressed TGAs, RLE only when a compression level was set explicitly
+        self.pending_writes.append(get_texture_writer().submit(image, save_path, self.texture_settings()))
+        self.written_textures.append(save_path.relative_to(self._output_path))
         if settings is not None and isinstance(settings, dict):
             self._write_settings(save_path.with_suffix('.txt'), settings)
         return str(save_path.relative_to(self._output_path))
@@ -0,0 +1,305 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import traceback
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from graphlib import TopologicalSorter
+from pathlib import Path
+from typing import Iterable, Optional
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.logger import SourceLogMan
+from source2converter.cache import ConversionManifest, ManifestEntry
+from source2converter.content_index import ContentIndex, INDEX_NAME
+from source2converter.dependency_graph import DependencyGraph, model_node, material_node
+from source2converter.materials.material_converter_tags import GameType
+from source2converter.materials.registry import MaterialRegistry
+from source2converter.materials.texture_cache import get_texture_cache, DEFAULT_MEMORY_BUDGET
+from source2converter.materials.texture_writer import get_texture_writer, TextureOutputSettings, TextureCodec
+from source2converter.mdl.mapped import set_mapped_vvd
+from source2converter.output_writer import get_output_writer, DEFAULT_MAX_PENDING
+from source2converter.memory import MemoryRecord, get_memory_recorder
+from source2converter.pipeline import convert_model, convert_standalone_material, ConversionStatus
+from source2converter.timing import TimingRecord, get_timing_recorder
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('Batch')
+
+
+@dataclass
+class BatchResult:
+    asset_path: str
+    status: ConversionStatus
+    elapsed: float
+    error: Optional[str] = None
+    manifest_updates: dict[str, ManifestEntry] = field(default_factory=dict)
+    timings: list[TimingRecord] = field(default_factory=list)
+    memory_records: list[MemoryRecord] = field(default_factory=list)
+    memory_counts: dict[str, dict[str, int]] = field(default_factory=dict)
+
+    @property
+    def success(self):
+        return self.status != ConversionStatus.FAILED
+
+
+@dataclass
+class _WorkerState:
+    content_manager: ContentManager
+    content_path: Path
+    game: GameType
+    manifest: Optional[ConversionManifest]
+    registry: MaterialRegistry
+    content_index: Optional[ContentIndex]
+
+
+# Set once per worker process by _init_worker, so the content index stays warm between jobs.
+_worker_state: Optional[_WorkerState] = None
+
+
+def read_manifest(manifest_path: Path) -> list[Path]:
+    # Either a JSON list of paths or a plain text file with one path per line, "#" starts a comment.
+    text = manifest_path.read_text(encoding="utf8")
+    if manifest_path.suffix.lower() == ".json":
+        return [Path(item) for item in json.loads(text)]
+    model_paths = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            model_paths.append(Path(line))
+    return model_paths
+
+
+def _init_worker(content_roots: list[str], content_path: str, run_path: str, game: GameType, incremental: bool,
+                 texture_cache_budget: int, record_timings: bool, trace_memory: bool,
+                 texture_settings: TextureOutputSettings, output_threads: int, output_queue: int,
+                 content_index: bool, mapped_vvd: bool):
+    global _worker_state
+    set_mapped_vvd(mapped_vvd)
+    get_output_writer().configure(output_threads, output_queue)
+    get_texture_cache().set_memory_budget(texture_cache_budget)
+    get_texture_writer().configure(texture_settings)
+    get_timing_recorder().enabled = record_timings
+    if trace_memory:
+        get_memory_recorder().start()
+    content_manager = ContentManager()
+    for content_root in content_roots:
+        content_manager.scan_for_content(content_root)
+    # Workers only read the manifest, new entries travel back with the results and the parent saves them.
+    manifest = ConversionManifest(Path(content_path)) if incremental else None
+    # The parent already checked the index against the content roots, see run_batch
+    index = ContentIndex(content_manager, Path(content_path) / INDEX_NAME) if content_index else None
+    _worker_state = _WorkerState(index or content_manager, Path(content_path), game, manifest,
+                                 MaterialRegistry(Path(run_path)), index)
+
+
+def _convert_one(asset_path: str, is_material: bool = False) -> BatchResult:
+    start = time.perf_counter()
+    manifest = _worker_state.manifest
+    try:
+        if is_material:
+            status = convert_standalone_material(asset_path, _worker_state.content_manager,
+                                                 _worker_state.content_path, _worker_state.game, manifest,
+                                                 _worker_state.registry)
+        else:
+            # DMX export stays inline, worker processes are daemonic and the pool already uses every core.
+            status = convert_model(Path(asset_path), _worker_state.content_manager, _worker_state.content_path,
+                                   _worker_state.game, export_workers=1, manifest=manifest,
+                                   registry=_worker_state.registry)
+    except Exception:
+        error = traceback.format_exc()
+        status = ConversionStatus.FAILED
+    else:
+        error = f"{'Material' if is_material else 'Model'} could not be converted" \
+            if status == ConversionStatus.FAILED else None
+    updates = manifest.take_updates() if manifest is not None else {}
+    if _worker_state.content_index is not None:
+        _worker_state.content_index.save()
+    memory_records, memory_counts = get_memory_recorder().take()
+    return BatchResult(asset_path, status, time.perf_counter() - start, error, updates,
+                       get_timing_recorder().take(), memory_records, memory_counts)
+
+
+def run_batch(model_paths: Iterable[Path], content_roots: list[Path], content_path: Path,
+              game: GameType = GameType.CS2, workers: int = os.cpu_count() or 1,
+              incremental: bool = True, texture_cache_budget: int = DEFAULT_MEMORY_BUDGET,
+              report_path: Optional[Path] = None,
+              memory_report_path: Optional[Path] = None,
+              texture_settings: TextureOutputSettings = TextureOutputSettings(),
+              output_threads: int = 2, content_index: bool = True,
+              material_paths: Iterable[str] = (),
+              dependency_graph: Optional[DependencyGraph] = None, mapped_vvd: bool = True,
+              output_queue: int = DEFAULT_MAX_PENDING, rescan_content: bool = False) -> list[BatchResult]:
+    # Materials (relative to materials/, without extension) are for assets no model references, like map brushes.
+    # With a dependency graph every job waits for the jobs it depends on, models start once their materials are done
+    # and find them in the MaterialRegistry instead of racing other workers for them.
+    jobs = {}
+    for model_path in model_paths:
+        model_path = Path(model_path).as_posix()
+        jobs[model_node(model_path) if dependency_graph is not None else (model_path, False)] = (model_path, False)
+    for material_path in material_paths:
+        jobs[material_node(material_path) if dependency_graph is not None else (material_path, True)] = \
+            (material_path, True)
+    order = dependency_graph.sorter(jobs) if dependency_graph is not None else \
+        TopologicalSorter(dict.fromkeys(jobs, ()))
+    # Materials shared between models are claimed through files in this folder, see MaterialRegistry.
+    run_path = content_path / ".source2converter_runs" / uuid.uuid4().hex
+    init_args = ([str(root) for root in content_roots], str(content_path), str(run_path), game, incremental,
+                 texture_cache_budget, report_path is not None, memory_report_path is not None,
+                 texture_settings, output_threads, output_queue, content_index, mapped_vvd)
+    if content_index:
+        ContentIndex.prepare(content_path / INDEX_NAME, content_roots, rescan_content)
+    manifest = ConversionManifest(content_path) if incremental else None
+    # Worker records are merged here, the in-process case records into the same recorder directly
+    recorder = get_timing_recorder()
+    recorder.clear()
+    memory_recorder = get_memory_recorder()
+    memory_recorder.clear()
+    results = []
+    try:
+        if workers <= 1:
+            _init_worker(*init_args)
+            for node in order.static_order():
+                results.append(_collect_result(_convert_one(*jobs[node]), manifest, len(results), len(jobs)))
+            return results
+
+        order.prepare()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args)
+        try:
+            futures = {}
+            # Only as many jobs as workers are handed to the pool, a dying worker takes the queued jobs down with it
+            ready = deque()
+            retried = set()
+            while order.is_active():
+                ready.extend(order.get_ready())
+                while ready and len(futures) < workers:
+                    node = ready.popleft()
+                    try:
+                        future = executor.submit(_convert_one, *jobs[node])
+                    except BrokenProcessPool:
+                        # Broke after the last wait, its jobs are collected below
+                        executor = _replace_pool(executor, workers, init_args)
+                        future = executor.submit(_convert_one, *jobs[node])
+                    futures[future] = (node, executor, time.perf_counter())
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    node, job_executor, submitted = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        # A worker died (killed for memory, crashed in native code) and every running job failed
+                        # with it. Each is tried once more on new workers, the one that killed it fails again.
+                        broken = broken or job_executor is executor
+                        if node not in retried:
+                            retried.add(node)
+                            ready.append(node)
+                            continue
+                        result = BatchResult(jobs[node][0], ConversionStatus.FAILED, time.perf_counter() - submitted,
+                                             "A worker process died while this job was running")
+                    except Exception:
+                        result = BatchResult(jobs[node][0], ConversionStatus.FAILED, time.perf_counter() - submitted,
+                                             traceback.format_exc())
+                    # Failed jobs release their dependents as well, a model converts a material it is missing itself
+                    order.done(node)
+                    results.append(_collect_result(result, manifest, len(results), len(jobs)))
+                if broken:
+                    executor = _replace_pool(executor, workers, init_args)
+        finally:
+            executor.shutdown()
+        return results
+    finally:
+        if manifest is not None:
+            manifest.save()
+        if report_path is not None:
+            recorder.write_report(report_path)
+            logger.info(f"Wrote timing report to {report_path}")
+        recorder.enabled = False
+        if memory_report_path is not None:
+            memory_recorder.write_report(memory_report_path)
+            logger.info(f"Wrote memory report to {memory_report_path}")
+        memory_recorder.stop()
+        shutil.rmtree(run_path, ignore_errors=True)
+
+
+def _replace_pool(executor: ProcessPoolExecutor, workers: int, init_args: tuple) -> ProcessPoolExecutor:
+    logger.warn("A worker process died, starting new workers for the remaining jobs")
+    executor.shutdown(wait=False, cancel_futures=True)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args)
+
+
+def _collect_result(result: BatchResult, manifest: Optional[ConversionManifest], done: int,
+                    total: int) -> BatchResult:
+    if manifest is not None:
+        manifest.merge(result.manifest_updates)
+    get_timing_recorder().merge(result.timings)
+    get_memory_recorder().merge(result.memory_records, result.memory_counts)
+    if result.status == ConversionStatus.SKIPPED:
+        logger.info(f"[{done + 1}/{total}] {result.asset_path} is up to date")
+    elif result.status == ConversionStatus.UNSUPPORTED:
+        logger.warn(f"[{done + 1}/{total}] {result.asset_path} uses a shader without a Source2 converter")
+    elif result.success:
+        logger.info(f"[{done + 1}/{total}] Converted {result.asset_path} in {result.elapsed:.2f}s")
+    else:
+        logger.error(f"[{done + 1}/{total}] Failed to convert {result.asset_path}: {result.error}")
+    return result
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Batch convert Source1 models to Source2')
+    args.add_argument('-c', '--content', type=str, nargs='+', required=True, dest='content_roots',
+                      help='Source1 game/content folders to scan')
+    args.add_argument('-o', '--output', type=str, required=True, dest='content_path',
+                      help='Source2 add-on content folder')
+    args.add_argument('-g', '--game', type=str, default=GameType.CS2.value, dest='game',
+                      help=f"Select a target game, supported: {', '.join(map(lambda a: a.value, list(GameType)))}")
+    args.add_argument('-m', '--manifest', type=str, dest='manifest',
+                      help='Text (one path per line) or JSON list of model paths')
+    args.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, dest='workers',
+                      help='Number of worker processes')
+    args.add_argument('--no-cache', action='store_true', dest='no_cache',
+                      help='Do not read or update the incremental conversion manifest')
+    args.add_argument('--no-content-index', action='store_true', dest='no_content_index',
+                      help='Do not remember failed asset lookups between runs')
+    args.add_argument('--rescan-content', action='store_true', dest='rescan_content',
+                      help='Forget every remembered failed lookup, not only those in changed folders')
+    args.add_argument('--texture-cache-mb', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                      dest='texture_cache_mb', help='Decoded texture cache budget per worker, in megabytes')
+    args.add_argument('--texture-format', type=str, default=TextureCodec.PNG.value,
+                      choices=[codec.value for codec in TextureCodec], dest='texture_format',
+                      help='Output format of converted textures')
+    args.add_argument('--texture-compression', type=int, default=TextureOutputSettings.compress_level,
+                      choices=range(10), dest='texture_compression',
+                      help='PNG zlib level (0-9, 1 is fast, default 6), for TGA 0 writes uncompressed (default) '
+                           'and anything else RLE')
+    args.add_argument('--output-threads', '--texture-threads', type=int, default=2, dest='output_threads',
+                      help='Threads per worker process writing textures, VMATs, DMX and VMDL files')
+    args.add_argument('--output-queue', type=int, default=DEFAULT_MAX_PENDING, dest='output_queue',
+                      help='Files waiting to be written before a worker stops converting and waits for them')
+    args.add_argument('--no-mmap', action='store_true', dest='no_mmap',
+                      help='Read VVD files into memory instead of mapping loose files')
+    args.add_argument('--report', type=str, dest='report',
+                      help='Write a JSON report with per stage and per asset timings to this file')
+    args.add_argument('--memory-report', type=str, dest='memory_report',
+                      help='Trace memory (peak RSS and tracemalloc) per model and stage and write a JSON report')
+    args.add_argument('models', type=str, nargs='*', help='Model paths relative to the content roots')
+    args = args.parse_args()
+
+    paths = [Path(model) for model in args.models]
+    if args.manifest:
+        paths.extend(read_manifest(Path(args.manifest)))
+    batch_results = run_batch(paths, [Path(root) for root in args.content_roots], Path(args.content_path),
+                              GameType(args.game), args.workers, not args.no_cache,
+                              args.texture_cache_mb * 1024 * 1024,
+                              Path(args.report) if args.report else None,
+                              Path(args.memory_report) if args.memory_report else None,
+                              TextureOutputSettings(TextureCodec(args.texture_format), args.texture_compression),
+                              args.output_threads, not args.no_content_index, mapped_vvd=not args.no_mmap,
+                              output_queue=args.output_queue, rescan_content=args.rescan_content)
+    failed = [result for result in batch_results if not result.success]
+    logger.info(f"Converted {len(batch_results) - len(failed)}/{len(batch_results)} models")
@@ -0,0 +1,207 @@
+import hashlib
+import io
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Any, Optional
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.library.utils import Buffer
+from SourceIO.library.utils.path_utilities import find_vtx_cm
+from SourceIO.logger import SourceLogMan
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('Conversion cache')
+
+# Bump whenever converter output changes, every manifest entry written by an older version is treated as stale.
+CONVERTER_VERSION = 3
+MANIFEST_NAME = ".source2converter_manifest.json"
+_MANIFEST_FORMAT = 1
+
+
+def buffer_stat(buffer: Buffer) -> Optional[tuple[int, int]]:
+    # (size, mtime_ns) of loose files, None for VPK entries and other in-memory buffers
+    try:
+        stat = os.fstat(buffer.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def hash_buffer(buffer: Buffer) -> str:
+    offset = buffer.tell()
+    buffer.seek(0)
+    digest = hashlib.blake2b(digest_size=16)
+    while chunk := buffer.read(1 << 20):
+        digest.update(chunk)
+    buffer.seek(offset)
+    return digest.hexdigest()
+
+
+# Input keys are "<kind>:<asset path>", kind tells hash_input how to find the asset again on the next run.
+def file_input(path: Path | str) -> str:
+    return f"file:{Path(path).as_posix()}"
+
+
+def vtx_input(model_path: Path | str) -> str:
+    return f"vtx:{Path(model_path).as_posix()}"
+
+
+def material_input(material_path: str) -> str:
+    # Relative to the materials folder, like Material.full_path
+    return f"vmt:{material_path}"
+
+
+def texture_input(texture_path: str) -> str:
+    return f"vtf:{texture_path}"
+
+
+# Digest of an input that was looked up and not found, the entry is stale once the asset shows up
+MISSING_INPUT = ""
+
+
+def find_input(key: str, content_manager: ContentManager) -> Optional[Buffer]:
+    kind, path = key.split(":", 1)
+    if kind == "file":
+        return content_manager.find_file(path)
+    if kind == "vtx":
+        return find_vtx_cm(Path(path), content_manager)
+    if kind == "vmt":
+        return content_manager.find_material(path[:-len(".vmt")] if path.endswith(".vmt") else path)
+    if kind == "vtf":
+        return content_manager.find_texture(path)
+    raise ValueError(f"Unknown input kind {kind!r} in {key!r}")
+
+
+def hash_input(key: str, content_manager: ContentManager) -> Optional[str]:
+    buffer = find_input(key, content_manager)
+    if buffer is None:
+        return None
+    return _digest(key, buffer)
+
+
+# Size and mtime of every loose input seen when it was hashed, recorded next to the digests so the next run can
+# skip hashing files that were not touched
+_input_stats: dict[str, tuple[int, int]] = {}
+
+
+def _digest(key: str, buffer: Buffer) -> str:
+    stat = buffer_stat(buffer)
+    if stat is not None:
+        _input_stats[key] = stat
+    return hash_buffer(buffer)
+
+
+_input_trackers: list[dict[str, str]] = []
+
+
+@contextmanager
+def track_inputs():
+    inputs: dict[str, str] = {}
+    _input_trackers.append(inputs)
+    try:
+        yield inputs
+    finally:
+        _input_trackers.pop()
+
+
+def record_input(key: str, buffer: Optional[Buffer], digest: Optional[str] = None) -> Optional[str]:
+    # Called by loaders for every asset they decode, only pays for hashing while something is tracking.
+    # A digest known to match the buffer (an unchanged cached texture) is recorded without reading it again.
+    if not _input_trackers or buffer is None:
+        return None
+    if digest is None:
+        digest = _digest(key, buffer)
+    for tracker in _input_trackers:
+        tracker[key] = digest
+    return digest
+
+
+def record_missing_input(key: str):
+    # Called by loaders for assets they could not find, converting again once they exist changes the output
+    for tracker in _input_trackers:
+        tracker[key] = MISSING_INPUT
+
+
+@dataclass
+class ManifestEntry:
+    inputs: dict[str, str]
+    outputs: list[str]
+    converter_version: int = CONVERTER_VERSION
+    extra: dict[str, Any] = field(default_factory=dict)
+    # [size, mtime_ns] of the loose inputs when they were hashed, VPK entries have none and are always hashed
+    stats: dict[str, list[int]] = field(default_factory=dict)
+    # Output options the entry was converted with (texture format and compression), other options mean other files
+    settings: str = ""
+
+
+class ConversionManifest:
+    def __init__(self, content_path: Path):
+        self.content_path = content_path
+        self.path = content_path / MANIFEST_NAME
+        self._entries: dict[str, ManifestEntry] = {}
+        self._updates: dict[str, ManifestEntry] = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf8"))
+            except (OSError, ValueError) as ex:
+                logger.warn(f"Ignoring unreadable conversion manifest {self.path}: {ex}")
+                return
+            if data.get("format") == _MANIFEST_FORMAT:
+                self._entries = {key: ManifestEntry(**value) for key, value in data["entries"].items()}
+
+    def get(self, key: str) -> Optional[ManifestEntry]:
+        return self._entries.get(key)
+
+    def is_up_to_date(self, key: str, content_manager: ContentManager, settings: str = "") -> bool:
+        entry = self._entries.get(key)
+        if entry is None or entry.converter_version != CONVERTER_VERSION or entry.settings != settings:
+            return False
+        for output in entry.outputs:
+            if not (self.content_path / output).exists():
+                return False
+        for input_key, digest in entry.inputs.items():
+            buffer = find_input(input_key, content_manager)
+            if digest == MISSING_INPUT:
+                if buffer is not None:
+                    return False
+                continue
+            if buffer is None:
+                return False
+            stat = buffer_stat(buffer)
+            if stat is not None and entry.stats.get(input_key) == list(stat):
+                continue
+            if _digest(input_key, buffer) != digest:
+                return False
+            if stat is not None:
+                # Touched but unchanged, the new stat is saved so the next run does not hash it again
+                entry.stats[input_key] = list(stat)
+                self._updates[key] = entry
+        return True
+
+    def record(self, key: str, inputs: dict[str, str], outputs: list[Path | str], settings: str = "", **extra):
+        stats = {input_key: list(_input_stats[input_key]) for input_key in inputs if input_key in _input_stats}
+        entry = ManifestEntry(dict(inputs), [Path(output).as_posix() for output in outputs], extra=extra,
+                              stats=stats, settings=settings)
+        self._entries[key] = entry
+        self._updates[key] = entry
+
+    def take_updates(self) -> dict[str, ManifestEntry]:
+        updates, self._updates = self._updates, {}
+        return updates
+
+    def merge(self, updates: dict[str, ManifestEntry]):
+        self._entries.update(updates)
+
+    def save(self):
+        self.content_path.mkdir(parents=True, exist_ok=True)
+        data = {
+            "format": _MANIFEST_FORMAT,
+            "entries": {key: asdict(entry) for key, entry in self._entries.items()}
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
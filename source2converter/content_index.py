@@ -0,0 +1,277 @@
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.library.utils import Buffer
+from SourceIO.logger import SourceLogMan
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('Content index')
+
+INDEX_NAME = ".source2converter_content_index.sqlite"
+_INDEX_FORMAT = 2
+# Bytes of every *_dir.vpk hashed into the fingerprint: header and the start of the directory tree
+_VPK_HEADER_SIZE = 4096
+
+
+def _normalize(path: Path | str) -> str:
+    return str(path).replace("\\", "/").strip("/").lower()
+
+
+_GAMEINFO_PATH = "|gameinfo_path|"
+_ALL_SOURCE_ENGINE_PATHS = "|all_source_engine_paths|"
+
+
+def mounted_search_paths(content_root: Path) -> list[Path]:
+    """The content root and what its gameinfo.txt mounts: folders, "<name>_dir.vpk" files and "<folder>/*" addons."""
+    paths = [content_root]
+    gameinfo_path = content_root / "gameinfo.txt"
+    if not gameinfo_path.is_file():
+        return paths
+    in_search_paths = False
+    depth = 0
+    for line in gameinfo_path.read_text(encoding="utf8", errors="replace").splitlines():
+        tokens = line.split("//", 1)[0].replace('"', " ").split()
+        if not tokens:
+            continue
+        if tokens[0] == "{":
+            depth += 1
+            continue
+        if tokens[0] == "}":
+            depth -= 1
+            in_search_paths = in_search_paths and depth > 0
+            continue
+        if tokens[0].lower() == "searchpaths":
+            in_search_paths = True
+            depth = 0
+            continue
+        if not in_search_paths or len(tokens) < 2:
+            continue
+        value = tokens[1]
+        if value.lower().startswith(_GAMEINFO_PATH):
+            path = content_root / value[len(_GAMEINFO_PATH):]
+        elif value.lower().startswith(_ALL_SOURCE_ENGINE_PATHS):
+            path = content_root.parent / value[len(_ALL_SOURCE_ENGINE_PATHS):]
+        else:
+            path = content_root.parent / value
+        if path.name == "*":
+            paths.extend(sorted(path.parent.iterdir()) if path.parent.is_dir() else [])
+        elif path.suffix.lower() == ".vpk":
+            paths.append(path.with_name(path.stem + "_dir.vpk"))
+        else:
+            paths.append(path)
+    return paths
+
+
+def content_fingerprint(content_roots: Iterable[Path], exclude: Optional[Path] = None,
+                        with_headers: bool = True) -> str:
+    """Digest of everything that decides what the content roots contain.
+
+    Covers the gameinfo.txt of every root and the search paths it mounts: the mtime of every mounted folder and of
+    the folders directly in it (asset folders added or removed), and the size, mtime and header of every VPK
+    directory file in them. Files added deeper inside an existing folder only change that folder, the index checks
+    those per miss (see _FolderStamps). with_headers=False only stats files, for cheap change checks between daemon
+    jobs. The exclude folder (the output, which changes on every run) is skipped.
+    """
+    exclude = Path(exclude).resolve() if exclude is not None else None
+    digest = hashlib.blake2b(digest_size=16)
+    paths = [path for content_root in content_roots for path in mounted_search_paths(Path(content_root))]
+    for path in dict.fromkeys(path.resolve() for path in paths):
+        if path == exclude:
+            continue
+        digest.update(str(path).encode("utf8"))
+        if path.is_file():
+            _hash_file(digest, path, with_headers and path.name.lower().endswith("_dir.vpk"))
+        elif path.is_dir():
+            _hash_folder(digest, path, exclude, with_headers)
+    return digest.hexdigest()
+
+
+def _hash_folder(digest, folder: Path, exclude: Optional[Path], with_headers: bool):
+    digest.update(f"{folder.stat().st_mtime_ns}".encode("utf8"))
+    for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+        lower_name = entry.name.lower()
+        if entry.is_dir():
+            if Path(entry.path) != exclude:
+                digest.update(f"{entry.name}:{entry.stat().st_mtime_ns}".encode("utf8"))
+        elif lower_name == "gameinfo.txt" or lower_name.endswith(".vpk"):
+            _hash_file(digest, Path(entry.path), with_headers and lower_name.endswith("_dir.vpk"))
+
+
+def _hash_file(digest, path: Path, with_header: bool):
+    stat = path.stat()
+    digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf8"))
+    if with_header:
+        with path.open("rb") as f:
+            digest.update(f.read(_VPK_HEADER_SIZE))
+
+
+def _search_folders(content_roots: Iterable[Path], exclude: Path) -> list[Path]:
+    paths = [path for content_root in content_roots for path in mounted_search_paths(Path(content_root))]
+    return [path for path in dict.fromkeys(path.resolve() for path in paths) if path != exclude and path.is_dir()]
+
+
+def _deepest_folder(search_folder: Path, parts: list[str]) -> Path:
+    # Paths are looked up case insensitively, the folders on disk may not be lower case
+    folder = search_folder
+    for part in parts:
+        child = folder / part
+        if not child.is_dir():
+            child = next((Path(entry.path) for entry in os.scandir(folder)
+                          if entry.name.lower() == part and entry.is_dir()), None)
+            if child is None:
+                break
+        folder = child
+    return folder
+
+
+class _FolderStamps:
+    """mtimes of the folders a missed asset would show up in, one per mounted loose folder.
+
+    Adding a file changes the mtime of the folder it is added to. A subfolder that does not exist yet is represented
+    by its deepest existing parent, which changes when the subfolder is created. VPKs are covered by the content
+    fingerprint.
+    """
+
+    def __init__(self, search_folders: list[Path]):
+        self.search_folders = search_folders
+        self._stamps: dict[str, str] = {}
+
+    def __call__(self, kind: str, path: str) -> str:
+        folder = path.rpartition("/")[0]
+        if kind != "find_file":
+            # Materials and textures are looked up relative to the materials folder
+            folder = f"materials/{folder}" if folder else "materials"
+        stamp = self._stamps.get(folder)
+        if stamp is None:
+            parts = folder.split("/")
+            digest = hashlib.blake2b(digest_size=8)
+            for search_folder in self.search_folders:
+                digest.update(f"{_deepest_folder(search_folder, parts).stat().st_mtime_ns};".encode("utf8"))
+            stamp = self._stamps[folder] = digest.hexdigest()
+        return stamp
+
+
+class ContentIndex:
+    """Persistent record of the lookups that found nothing in a ContentManager's content.
+
+    Material name resolution tries every material against every material folder, most of those lookups miss and
+    every miss asks every content provider. Misses are kept in an SQLite file next to the output and answered from
+    memory on the next run, as long as the content fingerprint still matches and the folders the asset would be in are
+    unchanged (see prepare()). Found assets are always opened through the ContentManager. Everything that is not a
+    lookup is forwarded to it as well, so the index can be passed wherever a ContentManager is expected.
+    """
+
+    def __init__(self, content_manager: ContentManager, index_path: Path):
+        self.content_manager = content_manager
+        self.index_path = index_path
+        self.hits = 0
+        # (kind, path) of every miss to the folder stamp it was recorded with
+        self._missing: dict[tuple[str, str], str] = {}
+        self._new_missing: dict[tuple[str, str], str] = {}
+        roots = ""
+        if index_path.exists():
+            with _connect(index_path) as connection:
+                roots = dict(connection.execute("SELECT key, value FROM meta")).get("roots", "")
+                self._missing = {(kind, path): stamp for kind, path, stamp in
+                                 connection.execute("SELECT kind, path, stamp FROM missing")}
+        self._folders = _search_folders([Path(root) for root in roots.splitlines()], index_path.parent.resolve())
+        self._stamps = _FolderStamps(self._folders)
+
+    @staticmethod
+    def prepare(index_path: Path, content_roots: list[Path], reset: bool = False) -> bool:
+        """Checks the index against the content roots, an index of different content (or any, with reset) is emptied.
+
+        Called once per run before workers open the index, returns whether the stored lookups were kept.
+        """
+        start = time.perf_counter()
+        # Created first, a new output folder next to the content would change the fingerprint of the next run
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        fingerprint = content_fingerprint(content_roots, index_path.parent)
+        roots = "\n".join(Path(root).resolve().as_posix() for root in content_roots)
+        stale = []
+        with _connect(index_path) as connection:
+            meta = dict(connection.execute("SELECT key, value FROM meta"))
+            valid = not reset and meta == {"format": str(_INDEX_FORMAT), "roots": roots, "fingerprint": fingerprint}
+            if not valid:
+                # Older formats have other columns
+                connection.execute("DROP TABLE missing")
+                connection.execute(_CREATE_MISSING)
+                connection.execute("DELETE FROM meta")
+                connection.executemany("INSERT INTO meta VALUES (?, ?)",
+                                       (("format", str(_INDEX_FORMAT)), ("roots", roots),
+                                        ("fingerprint", fingerprint)))
+            else:
+                # Once here instead of in every worker, misses whose folders changed may have appeared since
+                stamps = _FolderStamps(_search_folders(content_roots, index_path.parent.resolve()))
+                rows = connection.execute("SELECT kind, path, stamp FROM missing")
+                stale = [(kind, path) for kind, path, stamp in rows if stamps(kind, path) != stamp]
+                connection.executemany("DELETE FROM missing WHERE kind = ? AND path = ?", stale)
+        logger.info(f"Content index {'is up to date' if valid else 'was reset'}"
+                    f"{f', {len(stale)} misses in changed folders dropped' if stale else ''} "
+                    f"({time.perf_counter() - start:.2f}s to fingerprint)")
+        return valid
+
+    def revalidate(self):
+        """Forgets misses whose folders changed since they were recorded, for indexes that outlive a run."""
+        self._stamps = _FolderStamps(self._folders)
+        stale = [key for key, stamp in self._missing.items() if self._stamps(*key) != stamp]
+        for key in stale:
+            del self._missing[key]
+            self._new_missing.pop(key, None)
+        if stale:
+            logger.info(f"{len(stale)} remembered misses are in changed folders, looking them up again")
+
+    def _lookup(self, kind: str, path, *args, **kwargs) -> Optional[Buffer]:
+        if args or kwargs:
+            return getattr(self.content_manager, kind)(path, *args, **kwargs)
+        key = (kind, _normalize(path))
+        if key in self._missing:
+            self.hits += 1
+            return None
+        buffer = getattr(self.content_manager, kind)(path)
+        if buffer is None:
+            self._missing[key] = self._new_missing[key] = self._stamps(*key)
+        return buffer
+
+    def find_file(self, path, *args, **kwargs) -> Optional[Buffer]:
+        return self._lookup("find_file", path, *args, **kwargs)
+
+    def find_material(self, path, *args, **kwargs) -> Optional[Buffer]:
+        return self._lookup("find_material", path, *args, **kwargs)
+
+    def find_texture(self, path, *args, **kwargs) -> Optional[Buffer]:
+        return self._lookup("find_texture", path, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.content_manager, name)
+
+    def save(self):
+        if not self._new_missing:
+            return
+        new_missing, self._new_missing = self._new_missing, {}
+        with _connect(self.index_path) as connection:
+            connection.executemany("INSERT OR REPLACE INTO missing VALUES (?, ?, ?)",
+                                   ((kind, path, stamp) for (kind, path), stamp in new_missing.items()))
+
+
+_CREATE_MISSING = ("CREATE TABLE IF NOT EXISTS missing (kind TEXT, path TEXT, stamp TEXT, PRIMARY KEY (kind, path)) "
+                   "WITHOUT ROWID")
+
+
+@contextmanager
+def _connect(index_path: Path) -> Iterator[sqlite3.Connection]:
+    # Pool workers write their misses to the same file, wait for each other instead of failing
+    connection = sqlite3.connect(index_path, timeout=60)
+    try:
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute(_CREATE_MISSING)
+            yield connection
+    finally:
+        connection.close()
@@ -0,0 +1,63 @@
+import importlib
+from functools import partial
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+from source2converter.utils import get_logger
+
+Tag = TypeVar("Tag")
+Func = TypeVar("Func", bound=Callable)
+
+
+class ConverterRegistry(Generic[Tag, Func]):
+    """Converters by lookup key, their modules are only imported once an asset with one of their keys shows up.
+
+    Keys of the converters shipped with source2converter come from a static index. Installed plugins announce theirs
+    through entry points of entry_point_group: the entry point name is the key (see parse_key), its value the module
+    to import. Importing a module registers its converters through the register_*_converter decorators.
+    """
+
+    def __init__(self, entry_point_group: str, builtin_index: dict[Hashable, list[str]],
+                 parse_key: Callable[[str], Hashable]):
+        self.entry_point_group = entry_point_group
+        self._parse_key = parse_key
+        self._converters: dict[Hashable, list[tuple[Tag, Func]]] = {}
+        self._pending: dict[Hashable, list[Callable[[], object]]] = {
+            key: [partial(importlib.import_module, module) for module in modules]
+            for key, modules in builtin_index.items()
+        }
+        self._entry_points_loaded = False
+
+    def add(self, key: Hashable, tag: Tag, func: Func):
+        self._converters.setdefault(key, []).append((tag, func))
+
+    def lookup(self, key: Hashable) -> list[tuple[Tag, Func]]:
+        # Registration order is kept, shipped converters come before plugins for the same key
+        if not self._entry_points_loaded:
+            self._load_entry_points()
+        for loader in self._pending.pop(key, ()):
+            try:
+                loader()
+            except Exception as ex:
+                get_logger('Converter registry').error(f"Failed to load converter for {key}: {ex}")
+        return self._converters.get(key, [])
+
+    def _load_entry_points(self):
+        # Only names are read here, plugin modules stay unimported until lookup() needs them
+        from importlib.metadata import entry_points
+        self._entry_points_loaded = True
+        for entry_point in entry_points(group=self.entry_point_group):
+            try:
+                key = self._parse_key(entry_point.name)
+            except (KeyError, ValueError):
+                get_logger('Converter registry').warn(
+                    f"Ignoring converter entry point {entry_point.name!r} of {self.entry_point_group}")
+                continue
+            self._pending.setdefault(key, []).append(entry_point.load)
+
+
+def first_match(candidates: list[tuple[Tag, Func]], matches: Callable[[Tag], bool]) -> Optional[Func]:
+    # First preferred candidate, otherwise the first one registered
+    for tag, func in candidates:
+        if matches(tag):
+            return func
+    return candidates[0][1] if candidates else None
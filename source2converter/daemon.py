@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Iterator, Optional, TextIO
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.logger import SourceLogMan
+from source2converter.cache import ConversionManifest
+from source2converter.content_index import ContentIndex, INDEX_NAME, content_fingerprint
+from source2converter.materials.material_converter_tags import GameType
+from source2converter.materials.registry import MaterialRegistry
+from source2converter.materials.texture_cache import get_texture_cache, DEFAULT_MEMORY_BUDGET
+from source2converter.materials.texture_writer import get_texture_writer, TextureOutputSettings, TextureCodec
+from source2converter.pipeline import convert_model, ConversionStatus
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('Daemon')
+
+PROTOCOL_VERSION = 1
+
+
+class ConversionService:
+    """Converts models on request while keeping the content index, texture cache and converters warm.
+
+    Requests and replies are JSON objects, one per line:
+        {"id": 1, "command": "convert", "models": ["models/props/crate.mdl"], "game": "Counter-Strike 2"}
+    answers with one {"event": "result", ...} line per model as soon as it is done, then {"event": "done", ...}.
+    Other commands are "ping", "rescan" (mount the content again and forget remembered misses) and "shutdown". New
+    search paths, VPKs and asset folders are noticed from a stat only fingerprint before each job, loose files added
+    inside existing folders from the folders of the remembered misses. Jobs run one at a time, clients connected at the same time wait for
+    each other.
+    """
+
+    def __init__(self, content_roots: list[Path], content_path: Path, game: GameType = GameType.CS2,
+                 incremental: bool = True, export_workers: int = 1, content_index: bool = True):
+        self.content_roots = content_roots
+        self.content_path = content_path
+        self.game = game
+        self.export_workers = export_workers
+        self.manifest = ConversionManifest(content_path) if incremental else None
+        self.index_path = content_path / INDEX_NAME if content_index else None
+        self.content_manager: Optional[ContentManager | ContentIndex] = None
+        self.shutdown_requested = threading.Event()
+        self._lock = threading.Lock()
+        self._content_stamp: Optional[str] = None
+        self.rescan()
+
+    def rescan(self, reset_index: bool = False):
+        # reset_index drops every remembered miss, not only those in changed folders
+        start = time.perf_counter()
+        content_manager = ContentManager()
+        for content_root in self.content_roots:
+            content_manager.scan_for_content(content_root)
+        if self.index_path is not None:
+            ContentIndex.prepare(self.index_path, self.content_roots, reset_index)
+            content_manager = ContentIndex(content_manager, self.index_path)
+        self.content_manager = content_manager
+        # Decoded VPK textures can not be checked against their source cheaply, loose ones are (see load_texture_array)
+        get_texture_cache().clear()
+        self._content_stamp = self._stamp()
+        logger.info(f"Indexed {len(self.content_roots)} content root(s) in {time.perf_counter() - start:.2f}s")
+
+    def _stamp(self) -> str:
+        return content_fingerprint(self.content_roots, self.content_path, with_headers=False)
+
+    def handle(self, request: dict) -> Iterator[dict]:
+        request_id = request.get("id")
+        command = request.get("command", "convert")
+        with self._lock:
+            if command == "ping":
+                yield {"id": request_id, "event": "pong", "protocol": PROTOCOL_VERSION, "pid": os.getpid()}
+            elif command == "rescan":
+                self.rescan(reset_index=True)
+                yield {"id": request_id, "event": "done"}
+            elif command == "shutdown":
+                self.shutdown_requested.set()
+                yield {"id": request_id, "event": "done"}
+            elif command == "convert":
+                yield from self._convert(request_id, request)
+            else:
+                yield {"id": request_id, "event": "error", "error": f"Unknown command {command!r}"}
+
+    def _convert(self, request_id, request: dict) -> Iterator[dict]:
+        try:
+            model_paths = [Path(model_path) for model_path in request["models"]]
+            game = GameType(request["game"]) if "game" in request else self.game
+        except (KeyError, TypeError, ValueError) as ex:
+            yield {"id": request_id, "event": "error", "error": f"Invalid convert request: {ex!r}"}
+            return
+        if self._stamp() != self._content_stamp:
+            # Search paths, VPKs or asset folders changed since the last job, mount them again
+            logger.info("Content changed, rescanning")
+            self.rescan()
+        elif isinstance(self.content_manager, ContentIndex):
+            self.content_manager.revalidate()
+        # Materials are deduplicated within a request only, the manifest decides what is still up to date
+        registry = MaterialRegistry()
+        start = time.perf_counter()
+        failed = 0
+        try:
+            for model_path in model_paths:
+                model_start = time.perf_counter()
+                try:
+                    status = convert_model(model_path, self.content_manager, self.content_path, game,
+                                           self.export_workers, self.manifest, registry)
+                except Exception:
+                    error = traceback.format_exc()
+                    status = ConversionStatus.FAILED
+                else:
+                    error = "Model could not be converted" if status == ConversionStatus.FAILED else None
+                failed += status == ConversionStatus.FAILED
+                yield {"id": request_id, "event": "result", "model": model_path.as_posix(), "status": status.value,
+                       "elapsed": time.perf_counter() - model_start, "error": error}
+        finally:
+            if self.manifest is not None:
+                self.manifest.save()
+            if isinstance(self.content_manager, ContentIndex):
+                self.content_manager.save()
+        yield {"id": request_id, "event": "done", "models": len(model_paths), "failed": failed,
+               "elapsed": time.perf_counter() - start}
+
+    def serve_stream(self, reader: TextIO, writer: TextIO):
+        for line in reader:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request is not a JSON object")
+            except ValueError as ex:
+                replies = [{"id": None, "event": "error", "error": f"Invalid request: {ex}"}]
+            else:
+                replies = self.handle(request)
+            for reply in replies:
+                writer.write(json.dumps(reply) + "\n")
+                writer.flush()
+            if self.shutdown_requested.is_set():
+                return
+
+    def serve_stdio(self):
+        # Converters and loggers print to stdout, the protocol gets the real stdout to itself
+        protocol_out, sys.stdout = sys.stdout, sys.stderr
+        try:
+            self.serve_stream(sys.stdin, protocol_out)
+        finally:
+            sys.stdout = protocol_out
+
+    def serve_unix(self, socket_path: Path):
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("Unix sockets are not available on this platform, use the stdin protocol instead")
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                service.serve_stream((line.decode("utf8") for line in self.rfile), _SocketWriter(self.wfile))
+                if service.shutdown_requested.is_set():
+                    threading.Thread(target=server.shutdown, daemon=True).start()
+
+        socket_path.unlink(missing_ok=True)
+        with socketserver.ThreadingUnixStreamServer(str(socket_path), Handler) as server:
+            server.daemon_threads = True
+            logger.info(f"Listening on {socket_path}")
+            try:
+                server.serve_forever()
+            finally:
+                socket_path.unlink(missing_ok=True)
+
+
+class _SocketWriter:
+    def __init__(self, wfile):
+        self._wfile = wfile
+
+    def write(self, text: str):
+        self._wfile.write(text.encode("utf8"))
+
+    def flush(self):
+        self._wfile.flush()
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Keep a converter running and convert models on request')
+    args.add_argument('-c', '--content', type=str, nargs='+', required=True, dest='content_roots',
+                      help='Source1 game/content folders to scan')
+    args.add_argument('-o', '--output', type=str, required=True, dest='content_path',
+                      help='Source2 add-on content folder')
+    args.add_argument('-g', '--game', type=str, default=GameType.CS2.value, dest='game',
+                      help=f"Default target game, supported: {', '.join(map(lambda a: a.value, list(GameType)))}")
+    args.add_argument('-s', '--socket', type=str, dest='socket',
+                      help='Listen on this Unix socket instead of reading requests from stdin')
+    args.add_argument('--no-cache', action='store_true', dest='no_cache',
+                      help='Do not read or update the incremental conversion manifest')
+    args.add_argument('--no-content-index', action='store_true', dest='no_content_index',
+                      help='Do not remember failed asset lookups between jobs and runs')
+    args.add_argument('--export-workers', type=int, default=1, dest='export_workers',
+                      help='Processes used to write the DMX files of one model')
+    args.add_argument('--texture-cache-mb', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                      dest='texture_cache_mb', help='Decoded texture cache budget, in megabytes')
+    args.add_argument('--texture-format', type=str, default=TextureCodec.PNG.value,
+                      choices=[codec.value for codec in TextureCodec], dest='texture_format')
+    args.add_argument('--texture-compression', type=int, default=TextureOutputSettings.compress_level,
+                      choices=range(10), dest='texture_compression')
+    args = args.parse_args()
+
+    get_texture_cache().set_memory_budget(args.texture_cache_mb * 1024 * 1024)
+    get_texture_writer().configure(TextureOutputSettings(TextureCodec(args.texture_format),
+                                                         args.texture_compression))
+    conversion_service = ConversionService([Path(root) for root in args.content_roots], Path(args.content_path),
+                                           GameType(args.game), not args.no_cache, args.export_workers,
+                                           not args.no_content_index)
+    if args.socket:
+        conversion_service.serve_unix(Path(args.socket))
+    else:
+        conversion_service.serve_stdio()
@@ -0,0 +1,42 @@
+import argparse
+import json
+import socket
+import sys
+from pathlib import Path
+from typing import Iterator
+
+# Standard library only: the client is started for every button press, it must not pay for the converter imports
+
+
+def send_request(socket_path: Path, request: dict) -> Iterator[dict]:
+    """Sends one request to a running daemon and yields its replies until the final "done" or "error"."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(socket_path))
+        connection.sendall((json.dumps(request) + "\n").encode("utf8"))
+        with connection.makefile("r", encoding="utf8") as replies:
+            for line in replies:
+                reply = json.loads(line)
+                yield reply
+                if reply.get("event") in ("done", "error", "pong"):
+                    return
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Send models to a running source2converter.daemon')
+    args.add_argument('-s', '--socket', type=str, required=True, dest='socket', help='Unix socket of the daemon')
+    args.add_argument('-g', '--game', type=str, dest='game', help='Target game, defaults to the daemon one')
+    args.add_argument('--command', type=str, default="convert", choices=("convert", "ping", "rescan", "shutdown"),
+                      dest='command')
+    args.add_argument('models', type=str, nargs='*', help='Model paths relative to the content roots')
+    args = args.parse_args()
+
+    message = {"id": 1, "command": args.command}
+    if args.command == "convert":
+        message["models"] = args.models
+        if args.game:
+            message["game"] = args.game
+    failed = False
+    for message_reply in send_request(Path(args.socket), message):
+        print(json.dumps(message_reply))
+        failed |= message_reply.get("event") == "error" or message_reply.get("status") == "failed"
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,263 @@
+import json
+import os
+from graphlib import TopologicalSorter
+from pathlib import Path
+from typing import Iterable, Optional
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.library.source1.vmt import VMT
+from SourceIO.library.utils.path_utilities import collect_full_material_names
+from SourceIO.logger import SourceLogMan
+from source2converter.headers import read_mdl_header
+from source2converter.vmf import extract_vmf_dependencies, normalize_model_path, normalize_material_path
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('Dependency graph')
+
+GRAPH_NAME = ".source2converter_dependencies.json"
+_GRAPH_FORMAT = 1
+
+# VMT parameters that name a texture, every other string parameter is ignored
+TEXTURE_PARAMETERS = (
+    "$basetexture", "$basetexture2", "$bumpmap", "$bumpmap2", "$normalmap", "$envmapmask", "$envmapmask2",
+    "$phongexponenttexture", "$phongwarptexture", "$lightwarptexture", "$selfillummask", "$detail", "$detail2",
+    "$blendmodulatetexture", "$ambientoccltexture", "$iris", "$corneatexture", "$tintmasktexture",
+    "$emissiveblendtexture", "$emissiveblendbasetexture", "$emissiveblendflowtexture", "$flowmap", "$normalmap2",
+)
+
+
+# Node keys are "<kind>:<path>" like the conversion manifest input keys. Models are "models/....mdl", materials and
+# textures are relative to the materials folder without extension, everything is lower case.
+def map_node(vmf_path: Path | str) -> str:
+    return f"map:{Path(vmf_path).as_posix()}"
+
+
+def model_node(model_path: Path | str) -> str:
+    return f"model:{normalize_model_path(Path(model_path).as_posix())}"
+
+
+def material_node(material_path: str) -> str:
+    return f"material:{normalize_material_path(material_path)}"
+
+
+def texture_node(texture_path: str) -> str:
+    texture_path = normalize_material_path(texture_path)
+    return f"texture:{texture_path[:-len('.vtf')] if texture_path.endswith('.vtf') else texture_path}"
+
+
+def split_node(node: str) -> tuple[str, str]:
+    kind, path = node.split(":", 1)
+    return kind, path
+
+
+def node_for_file(path: Path | str) -> Optional[str]:
+    # Content file (as relative to a content root) to the node it belongs to, .vvd/.vtx/.phy are part of their model
+    if Path(path).suffix.lower() == ".vmf":
+        return map_node(path)
+    path = Path(path).as_posix().lower()
+    name = path.rsplit("/", 1)[-1]
+    if name.endswith(".vmt"):
+        return material_node(path)
+    if name.endswith(".vtf"):
+        return texture_node(path)
+    for extension in (".mdl", ".vvd", ".vtx", ".phy"):
+        if name.endswith(extension):
+            # Drops the ".dx90" of "crate.dx90.vtx" as well
+            return model_node(path[:len(path) - len(name)] + name.split(".", 1)[0] + ".mdl")
+    return None
+
+
+class DependencyGraph:
+    """Edges from every asset to the assets it uses: map -> model/material, model -> material, material -> texture.
+
+    Built once from the sources (see build_dependency_graph) and saved next to the output, so a later run can find
+    exactly the assets downstream of a changed file without parsing everything again.
+    """
+
+    def __init__(self):
+        self._dependencies: dict[str, set[str]] = {}
+        self._dependents: dict[str, set[str]] = {}
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._dependencies
+
+    def __len__(self) -> int:
+        return len(self._dependencies)
+
+    @property
+    def nodes(self) -> Iterable[str]:
+        return self._dependencies.keys()
+
+    def add_node(self, node: str):
+        self._dependencies.setdefault(node, set())
+        self._dependents.setdefault(node, set())
+
+    def add_edge(self, node: str, dependency: str):
+        self.add_node(node)
+        self.add_node(dependency)
+        self._dependencies[node].add(dependency)
+        self._dependents[dependency].add(node)
+
+    def remove_dependencies(self, node: str):
+        for dependency in self._dependencies.get(node, ()):
+            self._dependents[dependency].discard(node)
+        if node in self._dependencies:
+            self._dependencies[node] = set()
+
+    def dependencies(self, node: str) -> set[str]:
+        return self._dependencies.get(node, set())
+
+    def dependents(self, node: str) -> set[str]:
+        return self._dependents.get(node, set())
+
+    def downstream(self, nodes: Iterable[str]) -> set[str]:
+        # The given nodes and everything that uses them, directly or through other assets
+        affected = set()
+        pending = [node for node in nodes if node in self]
+        while pending:
+            node = pending.pop()
+            if node in affected:
+                continue
+            affected.add(node)
+            pending.extend(self._dependents[node])
+        return affected
+
+    def upstream(self, nodes: Iterable[str]) -> set[str]:
+        # The given nodes and everything they use
+        used = set()
+        pending = [node for node in nodes if node in self]
+        while pending:
+            node = pending.pop()
+            if node in used:
+                continue
+            used.add(node)
+            pending.extend(self._dependencies[node])
+        return used
+
+    def sorter(self, nodes: Iterable[str]) -> TopologicalSorter:
+        """Scheduler over a subset of the nodes, dependencies first.
+
+        Edges through nodes outside the subset are followed, a model still waits for a material it reaches through
+        an unscheduled node. Call prepare() on the result, then get_ready()/done() as jobs finish.
+        """
+        nodes = set(nodes)
+        sorter = TopologicalSorter()
+        for node in nodes:
+            sorter.add(node, *self._nearest(node, nodes))
+        return sorter
+
+    def _nearest(self, node: str, nodes: set[str]) -> set[str]:
+        found = set()
+        seen = set()
+        pending = list(self.dependencies(node))
+        while pending:
+            dependency = pending.pop()
+            if dependency in seen:
+                continue
+            seen.add(dependency)
+            if dependency in nodes:
+                found.add(dependency)
+            else:
+                pending.extend(self.dependencies(dependency))
+        return found
+
+    def save(self, path: Path):
+        data = {
+            "format": _GRAPH_FORMAT,
+            "edges": {node: sorted(dependencies) for node, dependencies in sorted(self._dependencies.items())}
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['DependencyGraph']:
+        if not path.exists():
+            return None
+        try:
+            data = json.loads(path.read_text(encoding="utf8"))
+        except (OSError, ValueError) as ex:
+            logger.warn(f"Could not read dependency graph {path}: {ex}")
+            return None
+        if data.get("format") != _GRAPH_FORMAT:
+            return None
+        graph = cls()
+        for node, dependencies in data["edges"].items():
+            graph.add_node(node)
+            for dependency in dependencies:
+                graph.add_edge(node, dependency)
+        return graph
+
+
+def build_dependency_graph(content_manager: ContentManager, vmf_paths: Iterable[Path] = (),
+                           model_paths: Iterable[Path | str] = (),
+                           material_paths: Iterable[str] = ()) -> DependencyGraph:
+    """Resolves maps, models and materials down to their textures, every asset is parsed once."""
+    graph = DependencyGraph()
+    nodes = [map_node(vmf_path) for vmf_path in vmf_paths]
+    nodes += [model_node(model_path) for model_path in model_paths]
+    nodes += [material_node(material_path) for material_path in material_paths]
+    update_dependency_graph(graph, nodes, content_manager)
+    logger.info(f"Dependency graph: {len(graph)} assets")
+    return graph
+
+
+def update_dependency_graph(graph: DependencyGraph, nodes: Iterable[str], content_manager: ContentManager):
+    # Parses the given assets again and replaces their edges, new dependencies are resolved as well
+    pending = list(nodes)
+    resolved = set()
+    while pending:
+        node = pending.pop()
+        if node in resolved:
+            continue
+        resolved.add(node)
+        graph.remove_dependencies(node)
+        graph.add_node(node)
+        for dependency in _resolve(node, content_manager):
+            graph.add_edge(node, dependency)
+            if dependency not in resolved:
+                pending.append(dependency)
+
+
+def _resolve(node: str, content_manager: ContentManager) -> list[str]:
+    kind, path = split_node(node)
+    if kind == "map":
+        with Path(path).open("r", encoding="utf8", errors="replace") as f:
+            map_dependencies = extract_vmf_dependencies(f)
+        return [model_node(model_path) for model_path in map_dependencies.models] + \
+            [material_node(material_path) for material_path in map_dependencies.materials]
+    if kind == "model":
+        return [material_node(material_path) for material_path in _model_materials(path, content_manager)]
+    if kind == "material":
+        return [texture_node(texture_path) for texture_path in _material_textures(path, content_manager)]
+    # Textures are leaves
+    return []
+
+
+def _model_materials(model_path: str, content_manager: ContentManager) -> list[str]:
+    buffer = content_manager.find_file(model_path)
+    if buffer is None:
+        logger.warn(f"Model {model_path} not found")
+        return []
+    try:
+        mdl = read_mdl_header(buffer)
+    except ValueError as ex:
+        logger.warn(f"Could not read materials of {model_path}: {ex}")
+        return []
+    full_material_names = collect_full_material_names(mdl.material_names, mdl.material_paths, content_manager)
+    return list(full_material_names.values())
+
+
+def _material_textures(material_path: str, content_manager: ContentManager) -> list[str]:
+    buffer = content_manager.find_material(material_path)
+    if buffer is None:
+        return []
+    material = VMT(buffer, material_path + ".vmt")
+    textures = []
+    for parameter in TEXTURE_PARAMETERS:
+        texture_path = material.get_string(parameter, None)
+        if texture_path:
+            textures.append(texture_path)
+    return textures
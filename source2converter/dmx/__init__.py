@@ -0,0 +1,127 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Optional, TYPE_CHECKING
+
+import numpy as np
+
+from source2converter.dmx.stream import export_dmx_stream
+from source2converter.output_writer import OutputWriter, get_output_writer, write_atomic
+from source2converter.utils import get_logger
+
+# SourceIO is imported by the datamodel writer itself, the stream writer and its tests work without it
+if TYPE_CHECKING:
+    from SourceIO.library.source1.dmx.source1_to_dmx import DmxModel2
+    from source2converter.model import Mesh
+    from source2converter.model.skeleton import Skeleton
+
+
+@dataclass
+class DmxExportJob:
+    model_name: str
+    sub_model_name: str
+    # (name, full_path) pairs, Material buffers are not picklable and not needed for export
+    materials: list[tuple[str, str]]
+    skeleton: Optional['Skeleton']
+    mesh: 'Mesh' = field(repr=False)
+    output_path: Path
+
+
+def export_dmx(job: DmxExportJob) -> 'DmxModel2':
+    from SourceIO.library.source1.dmx.source1_to_dmx import DmxModel2
+    from SourceIO.library.utils import datamodel
+    from SourceIO.library.utils.datamodel import Vector3, Vector2
+    from utils import sanitize_name, normalize_path
+
+    dm_model = DmxModel2(job.model_name)
+    attribute_names = dm_model.supported_attributes()
+    for material_name, material_path in job.materials:
+        dm_model.add_material(sanitize_name(material_name),
+                              normalize_path(material_path).with_suffix(""))
+    bone_names = []
+    if job.skeleton is not None:
+        dm_model.add_skeleton(sanitize_name(job.sub_model_name) + "_skeleton")
+        for bone in job.skeleton.bones:
+            bone_names.append(bone.name)
+            dm_model.add_bone(bone.name, bone.translation, bone.rotation, bone.parent_name)
+    mesh = job.mesh
+    dm_mesh = dm_model.add_mesh(job.sub_model_name, len(mesh.shape_keys) > 0)
+    for mat_id, indices in mesh.strips:
+        material_name, _ = job.materials[mat_id]
+        dm_model.mesh_add_faceset(dm_mesh, sanitize_name(material_name), indices)
+    tmp_vertices = mesh.get_vertex_attribute("positions")
+    dm_model.mesh_add_attribute(dm_mesh, "pos", tmp_vertices, Vector3)
+    dm_model.mesh_add_attribute(dm_mesh, "norm", mesh.get_vertex_attribute("normals"), Vector3)
+    dm_model.mesh_add_attribute(dm_mesh, "texco", mesh.get_vertex_attribute("uv0"), Vector2)
+    dimm = tmp_vertices.max() - tmp_vertices.min()
+    balance_width = dimm * (1 - (99.3 / 100))
+    balance = tmp_vertices[:, 0]
+    balance = np.clip((-balance / balance_width / 2) + 0.5, 0, 1)
+    dm_model.mesh_add_attribute(dm_mesh, "balance", balance, float)
+    flex_controllers = {}
+    for shape_key in mesh.shape_keys:
+        flex_controller = dm_model.add_flex_controller(shape_key.name, shape_key.stereo, False)
+        dm_model.flex_controller_add_delta_name(flex_controller, shape_key.name, 0)
+        flex_controllers[shape_key.name] = flex_controller
+
+        vertex_delta_data = dm_model.mesh_add_delta_state(dm_mesh, shape_key.name)
+
+        # datamodel wraps every element in its own object anyway, building them from plain lists skips the
+        # numpy scalar per component
+        delta_indices = shape_key.indices.tolist()
+        vertex_delta_data[attribute_names['pos']] = datamodel.make_array(
+            shape_key.delta_attributes["positions"].tolist(), Vector3)
+        vertex_delta_data[attribute_names['pos'] + "Indices"] = datamodel.make_array(delta_indices, int)
+        vertex_delta_data[attribute_names['norm']] = datamodel.make_array(
+            shape_key.delta_attributes["normals"].tolist(), Vector3)
+        vertex_delta_data[attribute_names['norm'] + "Indices"] = datamodel.make_array(delta_indices, int)
+    for flex_controller in flex_controllers.values():
+        dm_model.flex_controller_finish(flex_controller, len(flex_controller["rawControlNames"]))
+    if bone_names:
+        dm_model.mesh_add_bone_weights(dm_mesh, bone_names, mesh.get_vertex_attribute("blend_weights"),
+                                       mesh.get_vertex_attribute("blend_indices"))
+    vertex_data = dm_mesh["bindState"]
+    vertex_data["flipVCoordinates"] = False
+    vertex_data["jointCount"] = 3
+    return dm_model
+
+
+# Writers the pipeline may use. "datamodel" builds the file through SourceIO's DmxModel2. save_dmx also takes
+# "stream", which writes numpy buffers straight to disk; it joins this list once tests/test_dmx_writers.py has
+# confirmed it against DmxModel2 (tests/test_dmx_stream.py only checks its own layout).
+DMX_WRITERS = ("datamodel",)
+
+
+def save_dmx(job: DmxExportJob, writer: str = "datamodel", output_writer: Optional[OutputWriter] = None) -> Path:
+    # With an output_writer the file is written in the background, the caller flushes it
+    if writer == "stream":
+        dm_model = export_dmx_stream(job.model_name, job.sub_model_name, job.materials, job.skeleton, job.mesh)
+        save = dm_model.save
+    else:
+        dm_model = export_dmx(job)
+        save = partial(_save_binary, dm_model)
+    get_logger('DMX Export').info(f"Writting mesh file to {job.output_path}")
+    if output_writer is not None:
+        output_writer.submit(job.output_path, save, "dmx_write")
+    else:
+        get_output_writer().ensure_directory(job.output_path.parent)
+        write_atomic(job.output_path, save)
+    return job.output_path
+
+
+def _save_binary(dm_model: 'DmxModel2', path: Path):
+    dm_model.save(path, "binary", 9)
+
+
+def save_dmx_jobs(jobs: list[DmxExportJob], workers: int = 1, writer: str = "datamodel",
+                  output_writer: Optional[OutputWriter] = None) -> list[Path]:
+    # LODs and bodygroups do not depend on each other, so each job can be exported in its own process.
+    # Results are returned in job order, callers keep their bookkeeping deterministic by building it upfront.
+    # Process pool jobs write their files themselves, output_writer only takes the in-process writes.
+    if writer not in DMX_WRITERS:
+        raise ValueError(f"Unknown DMX writer {writer!r}, expected one of {DMX_WRITERS}")
+    if workers <= 1 or len(jobs) <= 1:
+        return [save_dmx(job, writer, output_writer) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        return list(executor.map(partial(save_dmx, writer=writer), jobs))
@@ -0,0 +1,247 @@
+import struct
+import uuid
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, BinaryIO, Optional
+
+import numpy as np
+
+
+class DmxType(IntEnum):
+    ELEMENT = 1
+    INT = 2
+    FLOAT = 3
+    BOOL = 4
+    STRING = 5
+    BINARY = 6
+    TIME = 7
+    COLOR = 8
+    VECTOR2 = 9
+    VECTOR3 = 10
+    VECTOR4 = 11
+    QANGLE = 12
+    QUATERNION = 13
+    MATRIX = 14
+    UINT64 = 15
+    UINT8 = 16
+
+
+ENCODING_VERSION = 9
+# Binary encoding 9 (Source 2) offsets array type ids by 32, the Source 1 encodings (1-5) only by 14
+ARRAY_TYPE_OFFSET = 32
+
+# Fixed size types: component dtype and component count of one value
+FIXED_LAYOUTS: dict[DmxType, tuple[np.dtype, int]] = {
+    DmxType.INT: (np.dtype("<i4"), 1),
+    DmxType.FLOAT: (np.dtype("<f4"), 1),
+    DmxType.BOOL: (np.dtype("u1"), 1),
+    DmxType.TIME: (np.dtype("<i4"), 1),
+    DmxType.COLOR: (np.dtype("u1"), 4),
+    DmxType.VECTOR2: (np.dtype("<f4"), 2),
+    DmxType.VECTOR3: (np.dtype("<f4"), 3),
+    DmxType.VECTOR4: (np.dtype("<f4"), 4),
+    DmxType.QANGLE: (np.dtype("<f4"), 3),
+    DmxType.QUATERNION: (np.dtype("<f4"), 4),
+    DmxType.MATRIX: (np.dtype("<f4"), 16),
+    DmxType.UINT64: (np.dtype("<u8"), 1),
+    DmxType.UINT8: (np.dtype("u1"), 1),
+}
+
+
+class DmxArray:
+    """Typed numeric DMX array backed by numpy chunks instead of one Python object per value.
+
+    Chunks appended with extend() are kept as they are and streamed one after another by the writer, so
+    accumulating deltas from many meshes never reallocates the whole array.
+    """
+
+    def __init__(self, dmx_type: DmxType, data: Optional[np.ndarray] = None):
+        if dmx_type not in FIXED_LAYOUTS:
+            raise TypeError(f"{dmx_type.name} is not a fixed size DMX type")
+        self.type = dmx_type
+        self.dtype, self.components = FIXED_LAYOUTS[dmx_type]
+        self._chunks: list[np.ndarray] = []
+        self._size = 0
+        if data is not None:
+            self.extend(data)
+
+    def extend(self, values):
+        chunk = np.asarray(values).reshape(-1, self.components)
+        if len(chunk):
+            self._chunks.append(chunk)
+            self._size += len(chunk)
+
+    def append(self, value):
+        self.extend(np.asarray(value, self.dtype)[None])
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def chunks(self) -> list[np.ndarray]:
+        return self._chunks
+
+
+@dataclass(slots=True)
+class DmxAttribute:
+    type: DmxType
+    value: Any
+    is_array: bool = False
+
+
+class DmxElement:
+    def __init__(self, type_name: str, name: str = ""):
+        self.type = type_name
+        self.name = name
+        self.guid = uuid.uuid4()
+        self.attributes: dict[str, DmxAttribute] = {}
+
+    def set(self, name: str, dmx_type: DmxType, value: Any, is_array: bool = False):
+        self.attributes[name] = DmxAttribute(dmx_type, value, is_array)
+        return value
+
+    def set_array(self, name: str, dmx_type: DmxType, data: Optional[np.ndarray] = None) -> DmxArray:
+        return self.set(name, dmx_type, DmxArray(dmx_type, data), True)
+
+    def __getitem__(self, name: str):
+        return self.attributes[name].value
+
+    def __setitem__(self, name: str, value: Any):
+        # Only for values whose type is unambiguous, numeric arrays and empty lists need set() with a type
+        if value is None or isinstance(value, DmxElement):
+            self.set(name, DmxType.ELEMENT, value)
+        elif isinstance(value, bool):
+            self.set(name, DmxType.BOOL, value)
+        elif isinstance(value, int):
+            self.set(name, DmxType.INT, value)
+        elif isinstance(value, float):
+            self.set(name, DmxType.FLOAT, value)
+        elif isinstance(value, str):
+            self.set(name, DmxType.STRING, value)
+        elif isinstance(value, list) and value and isinstance(value[0], DmxElement):
+            self.set(name, DmxType.ELEMENT, value, True)
+        elif isinstance(value, list) and value and isinstance(value[0], str):
+            self.set(name, DmxType.STRING, value, True)
+        else:
+            raise TypeError(f"Can't infer DMX type of {name!r}, use DmxElement.set with an explicit type")
+
+
+class DmxBinaryWriter:
+    """Writes a DmxElement tree as binary DMX (encoding 9).
+
+    Only the element graph is held as Python objects, numeric arrays are written straight from their numpy buffers,
+    a chunk of rows at a time, so converting them never needs a second full-size copy.
+    """
+
+    def __init__(self, file: BinaryIO, format_name: str = "model", format_version: int = 22,
+                 chunk_rows: int = 1 << 16):
+        self._file = file
+        self.format_name = format_name
+        self.format_version = format_version
+        self.chunk_rows = chunk_rows
+        self._string_ids: dict[str, int] = {}
+        self._element_ids: dict[int, int] = {}
+
+    def write(self, root: DmxElement):
+        elements = self._collect_elements(root)
+        self._string_ids = self._collect_strings(elements)
+        write = self._file.write
+
+        write(f"<!-- dmx encoding binary {ENCODING_VERSION} format {self.format_name} "
+              f"{self.format_version} -->\n".encode("ascii") + b"\0")
+        # Prefix element, we do not store any attributes in it
+        write(struct.pack("<ii", 1, 0))
+
+        write(struct.pack("<i", len(self._string_ids)))
+        for string in self._string_ids:
+            write(string.encode("utf8") + b"\0")
+
+        write(struct.pack("<i", len(elements)))
+        for element in elements:
+            write(struct.pack("<ii", self._string_ids[element.type], self._string_ids[element.name]))
+            write(element.guid.bytes_le)
+
+        for element in elements:
+            write(struct.pack("<i", len(element.attributes)))
+            for name, attribute in element.attributes.items():
+                type_id = attribute.type + (ARRAY_TYPE_OFFSET if attribute.is_array else 0)
+                write(struct.pack("<iB", self._string_ids[name], type_id))
+                if attribute.is_array:
+                    self._write_array(attribute)
+                else:
+                    self._write_value(attribute)
+
+    def _collect_elements(self, root: DmxElement) -> list[DmxElement]:
+        elements = [root]
+        self._element_ids = {id(root): 0}
+        # List iteration also visits elements appended during the loop
+        for element in elements:
+            for attribute in element.attributes.values():
+                if attribute.type != DmxType.ELEMENT:
+                    continue
+                children = attribute.value if attribute.is_array else (attribute.value,)
+                for child in children:
+                    if child is not None and id(child) not in self._element_ids:
+                        self._element_ids[id(child)] = len(elements)
+                        elements.append(child)
+        return elements
+
+    @staticmethod
+    def _collect_strings(elements: list[DmxElement]) -> dict[str, int]:
+        # "name" is always in the table, even though element names have their own slot in the header
+        strings = {"name": 0}
+        for element in elements:
+            strings.setdefault(element.type, len(strings))
+            strings.setdefault(element.name, len(strings))
+            for name, attribute in element.attributes.items():
+                strings.setdefault(name, len(strings))
+                if attribute.type == DmxType.STRING and not attribute.is_array:
+                    strings.setdefault(attribute.value, len(strings))
+        return strings
+
+    def _element_id(self, element: Optional[DmxElement]) -> int:
+        return -1 if element is None else self._element_ids[id(element)]
+
+    def _write_value(self, attribute: DmxAttribute):
+        value = attribute.value
+        if attribute.type == DmxType.ELEMENT:
+            self._file.write(struct.pack("<i", self._element_id(value)))
+        elif attribute.type == DmxType.STRING:
+            self._file.write(struct.pack("<i", self._string_ids[value]))
+        elif attribute.type == DmxType.BINARY:
+            self._file.write(struct.pack("<i", len(value)))
+            self._file.write(value)
+        else:
+            if attribute.type == DmxType.TIME:
+                value = round(value * 10000)
+            dtype, components = FIXED_LAYOUTS[attribute.type]
+            self._file.write(np.asarray(value, dtype).reshape(components).tobytes())
+
+    def _write_array(self, attribute: DmxAttribute):
+        value = attribute.value
+        if attribute.type == DmxType.ELEMENT:
+            self._file.write(struct.pack("<i", len(value)))
+            self._file.write(np.array([self._element_id(item) for item in value], np.dtype("<i4")).tobytes())
+        elif attribute.type == DmxType.STRING:
+            self._file.write(struct.pack("<i", len(value)))
+            self._file.write(b"".join(item.encode("utf8") + b"\0" for item in value))
+        elif attribute.type == DmxType.BINARY:
+            self._file.write(struct.pack("<i", len(value)))
+            for item in value:
+                self._file.write(struct.pack("<i", len(item)))
+                self._file.write(item)
+        elif isinstance(value, DmxArray):
+            self._file.write(struct.pack("<i", len(value)))
+            for chunk in value.chunks:
+                self._write_rows(chunk, value.dtype)
+        else:
+            dtype, components = FIXED_LAYOUTS[attribute.type]
+            array = np.asarray(value).reshape(-1, components)
+            self._file.write(struct.pack("<i", len(array)))
+            self._write_rows(array, dtype)
+
+    def _write_rows(self, array: np.ndarray, dtype: np.dtype):
+        for start in range(0, len(array), self.chunk_rows):
+            # No copy at all when the source is already contiguous and of the file dtype
+            chunk = np.ascontiguousarray(array[start:start + self.chunk_rows], dtype)
+            self._file.write(chunk.data)
@@ -0,0 +1,205 @@
+from pathlib import Path
+from typing import Optional, TYPE_CHECKING
+
+import numpy as np
+
+from source2converter.dmx.binary_writer import DmxElement, DmxType, DmxBinaryWriter
+
+if TYPE_CHECKING:
+    from source2converter.model import Mesh
+    from source2converter.model.skeleton import Skeleton
+
+# Same attribute names DmxModel2 uses for model format 22
+POSITION = "position$0"
+NORMAL = "normal$0"
+TEXCOORD = "texcoord$0"
+BALANCE = "balance$0"
+BLEND_WEIGHTS = "blendweights$0"
+BLEND_INDICES = "blendindices$0"
+JOINT_COUNT = 3
+
+
+def _element_array(element: DmxElement, name: str, items: Optional[list[DmxElement]] = None) -> list[DmxElement]:
+    return element.set(name, DmxType.ELEMENT, items if items is not None else [], True)
+
+
+def _make_transform(name: str, translation=(0.0, 0.0, 0.0), rotation=(0.0, 0.0, 0.0, 1.0)) -> DmxElement:
+    transform = DmxElement("DmeTransform", name)
+    transform.set("position", DmxType.VECTOR3, translation)
+    transform.set("orientation", DmxType.QUATERNION, rotation)
+    return transform
+
+
+def _make_dag(type_name: str, name: str, transform: DmxElement) -> DmxElement:
+    dag = DmxElement(type_name, name)
+    dag["transform"] = transform
+    dag["shape"] = None
+    dag["visible"] = True
+    _element_array(dag, "children")
+    return dag
+
+
+def _add_indexed_attribute(vertex_data: DmxElement, name: str, dmx_type: DmxType, data: np.ndarray):
+    vertex_data.set_array(name, dmx_type, data)
+    vertex_data.set_array(name + "Indices", DmxType.INT, np.arange(len(data), dtype=np.int32))
+
+
+class DmxStreamModel:
+    """DmeModel element graph with the layout DmxModel2 produces, whose vertex data stays in numpy arrays."""
+
+    def __init__(self, model_name: str):
+        self.root = DmxElement("DmElement", "root")
+        self.model = _make_dag("DmeModel", model_name, _make_transform(model_name))
+        self.joint_list = _element_array(self.model, "jointList", [self.model])
+        base_state = DmxElement("DmeTransformList", "base")
+        self.base_transforms = _element_array(base_state, "transforms", [_make_transform(model_name)])
+        _element_array(self.model, "baseStates", [base_state])
+        axis_system = DmxElement("DmeAxisSystem", "axisSystem")
+        axis_system["upAxis"] = 3
+        axis_system["forwardParity"] = 1
+        axis_system["coordSys"] = 0
+        self.model["axisSystem"] = axis_system
+        self.root["skeleton"] = self.model
+        self.root["model"] = self.model
+
+        self.materials: dict[str, DmxElement] = {}
+        self.bones: dict[str, DmxElement] = {}
+        self.combination_operator: Optional[DmxElement] = None
+
+    def add_skeleton(self, name: str):
+        # Same name DmxModel2.add_skeleton gives the DmeModel the joints hang off, export_dmx passes it
+        self.model.name = name
+
+    def add_material(self, name: str, material_path: Path):
+        material = DmxElement("DmeMaterial", name)
+        material["mtlName"] = material_path.as_posix()
+        self.materials[name] = material
+
+    def add_bone(self, name: str, translation, rotation, parent_name: Optional[str]):
+        joint = _make_dag("DmeJoint", name, _make_transform(name, translation, rotation))
+        parent = self.bones[parent_name] if parent_name is not None else self.model
+        parent["children"].append(joint)
+        self.joint_list.append(joint)
+        self.base_transforms.append(_make_transform(name, translation, rotation))
+        self.bones[name] = joint
+
+    def add_mesh(self, name: str) -> DmxElement:
+        mesh = DmxElement("DmeMesh", name)
+        mesh["visible"] = True
+        vertex_data = DmxElement("DmeVertexData", "bind")
+        vertex_data.set("vertexFormat", DmxType.STRING, [], True)
+        vertex_data["flipVCoordinates"] = False
+        vertex_data["jointCount"] = JOINT_COUNT
+        mesh["bindState"] = vertex_data
+        mesh["currentState"] = vertex_data
+        _element_array(mesh, "baseStates", [vertex_data])
+        _element_array(mesh, "deltaStates")
+        _element_array(mesh, "faceSets")
+        mesh.set_array("deltaStateWeights", DmxType.VECTOR2)
+        mesh.set_array("deltaStateWeightsLagged", DmxType.VECTOR2)
+
+        dag = _make_dag("DmeDag", name, _make_transform(name))
+        dag["shape"] = mesh
+        self.model["children"].append(dag)
+        self.joint_list.append(dag)
+        self.base_transforms.append(_make_transform(name))
+        return mesh
+
+    @staticmethod
+    def mesh_add_faceset(mesh: DmxElement, material: DmxElement, indices: np.ndarray):
+        # Triangles are terminated by -1, one int32 row per triangle written in one go
+        faces = np.full((len(indices) // 3, 4), -1, dtype=np.int32)
+        faces[:, :3] = np.asarray(indices).reshape(-1, 3)
+        face_set = DmxElement("DmeFaceSet", material.name)
+        face_set["material"] = material
+        face_set.set_array("faces", DmxType.INT, faces)
+        mesh["faceSets"].append(face_set)
+
+    @staticmethod
+    def mesh_add_attribute(mesh: DmxElement, name: str, dmx_type: DmxType, data: np.ndarray):
+        vertex_data = mesh["bindState"]
+        vertex_data["vertexFormat"].append(name)
+        _add_indexed_attribute(vertex_data, name, dmx_type, data)
+
+    def mesh_add_bone_weights(self, mesh: DmxElement, bone_names: list[str], weights: np.ndarray,
+                              indices: np.ndarray):
+        # Blend indices point into jointList, whose first entry is the model itself, like DmxModel2 remaps them
+        joint_ids = np.array([self.joint_list.index(self.bones[name]) for name in bone_names], np.int32)
+        vertex_data = mesh["bindState"]
+        vertex_data["vertexFormat"].extend((BLEND_WEIGHTS, BLEND_INDICES))
+        vertex_data.set_array(BLEND_WEIGHTS, DmxType.FLOAT, weights)
+        vertex_data.set_array(BLEND_INDICES, DmxType.INT, joint_ids[indices])
+
+    def mesh_add_delta_state(self, mesh: DmxElement, name: str, indices: np.ndarray, positions: np.ndarray,
+                             normals: np.ndarray):
+        delta = DmxElement("DmeVertexDeltaData", name)
+        delta.set("vertexFormat", DmxType.STRING, [POSITION, NORMAL], True)
+        delta["flipVCoordinates"] = False
+        delta["corrected"] = True
+        delta.set_array(POSITION, DmxType.VECTOR3, positions)
+        delta.set_array(POSITION + "Indices", DmxType.INT, indices)
+        delta.set_array(NORMAL, DmxType.VECTOR3, normals)
+        delta.set_array(NORMAL + "Indices", DmxType.INT, indices)
+        mesh["deltaStates"].append(delta)
+        mesh["deltaStateWeights"].append((0.0, 0.0))
+        mesh["deltaStateWeightsLagged"].append((0.0, 0.0))
+
+    def add_flex_controller(self, mesh: DmxElement, name: str, stereo: bool, eyelid: bool):
+        if self.combination_operator is None:
+            operator = self.combination_operator = DmxElement("DmeCombinationOperator", "combinationOperator")
+            _element_array(operator, "controls")
+            operator.set_array("controlValues", DmxType.VECTOR3)
+            operator.set_array("controlValuesLagged", DmxType.VECTOR3)
+            operator["usesLaggedValues"] = False
+            _element_array(operator, "dominators")
+            _element_array(operator, "targets", [mesh])
+            self.root["combinationOperator"] = operator
+        controller = DmxElement("DmeCombinationInputControl", name)
+        controller["rawControlNames"] = [name]
+        controller["stereo"] = stereo
+        controller["eyelid"] = eyelid
+        controller["flexMax"] = 1.0
+        controller["flexMin"] = 0.0
+        controller.set_array("wrinkleScales", DmxType.FLOAT, np.zeros(1, np.float32))
+        self.combination_operator["controls"].append(controller)
+        self.combination_operator["controlValues"].append((0.0, 0.0, 0.5))
+        self.combination_operator["controlValuesLagged"].append((0.0, 0.0, 0.5))
+
+    def save(self, path: Path):
+        with open(path, "wb", buffering=1 << 20) as f:
+            DmxBinaryWriter(f).write(self.root)
+
+
+def export_dmx_stream(model_name: str, sub_model_name: str, materials: list[tuple[str, str]],
+                      skeleton: Optional['Skeleton'], mesh: 'Mesh') -> DmxStreamModel:
+    # Imports SourceIO, DmxStreamModel itself does not
+    from utils import sanitize_name, normalize_path
+
+    dm_model = DmxStreamModel(model_name)
+    for material_name, material_path in materials:
+        dm_model.add_material(sanitize_name(material_name), normalize_path(material_path).with_suffix(""))
+    if skeleton is not None:
+        dm_model.add_skeleton(sanitize_name(sub_model_name) + "_skeleton")
+        for bone in skeleton.bones:
+            dm_model.add_bone(bone.name, bone.translation, bone.rotation, bone.parent_name)
+    dm_mesh = dm_model.add_mesh(sub_model_name)
+    for mat_id, indices in mesh.strips:
+        material_name, _ = materials[mat_id]
+        dm_model.mesh_add_faceset(dm_mesh, dm_model.materials[sanitize_name(material_name)], indices)
+    positions = mesh.get_vertex_attribute("positions")
+    dm_model.mesh_add_attribute(dm_mesh, POSITION, DmxType.VECTOR3, positions)
+    dm_model.mesh_add_attribute(dm_mesh, NORMAL, DmxType.VECTOR3, mesh.get_vertex_attribute("normals"))
+    dm_model.mesh_add_attribute(dm_mesh, TEXCOORD, DmxType.VECTOR2, mesh.get_vertex_attribute("uv0"))
+    dimm = positions.max() - positions.min()
+    balance_width = dimm * (1 - (99.3 / 100))
+    balance = np.clip((-positions[:, 0] / balance_width / 2) + 0.5, 0, 1)
+    dm_model.mesh_add_attribute(dm_mesh, BALANCE, DmxType.FLOAT, balance)
+    for shape_key in mesh.shape_keys:
+        dm_model.add_flex_controller(dm_mesh, shape_key.name, shape_key.stereo, False)
+        dm_model.mesh_add_delta_state(dm_mesh, shape_key.name, shape_key.indices,
+                                      shape_key.delta_attributes["positions"], shape_key.delta_attributes["normals"])
+    if skeleton is not None and skeleton.bones:
+        dm_model.mesh_add_bone_weights(dm_mesh, [bone.name for bone in skeleton.bones],
+                                       mesh.get_vertex_attribute("blend_weights"),
+                                       mesh.get_vertex_attribute("blend_indices"))
+    return dm_model
@@ -0,0 +1,145 @@
+import struct
+from dataclasses import dataclass
+
+from SourceIO.library.utils import Buffer
+
+# Fixed-size headers of the Source1 asset formats, read without touching vertex, strip or pixel data.
+# Offsets follow studiohdr_t (MDL 44-49), vertexFileHeader_t (VVD), FileHeader_t (VTX 7) and VTFFileHeader_t.
+
+_MDL_HEADER_SIZE = 268
+_MDL_TEXTURE_SIZE = 64
+_MDL_BODY_PART_SIZE = 16
+_VVD_HEADER = struct.Struct("<4sIiI8I4i")
+_VTX_HEADER = struct.Struct("<iiHHiiiiii")
+_VTF_HEADER = struct.Struct("<4s2IIHHIHH4x3f4xfiB")
+_VTF_DEPTH = struct.Struct("<H")
+_VTF_DEPTH_OFFSET = 63
+
+
+@dataclass(slots=True)
+class MdlHeader:
+    version: int
+    checksum: int
+    name: str
+    flags: int
+    bone_count: int
+    flex_count: int
+    skin_family_count: int
+    # Models (bodygroup choices) of every body part
+    body_parts: list[int]
+    material_names: list[str]
+    material_paths: list[str]
+
+
+@dataclass(slots=True)
+class VvdHeader:
+    version: int
+    checksum: int
+    lod_count: int
+    lod_vertex_counts: list[int]
+    fixup_count: int
+    fixup_offset: int
+    vertex_offset: int
+    tangent_offset: int
+
+
+@dataclass(slots=True)
+class VtxHeader:
+    version: int
+    checksum: int
+    lod_count: int
+    body_part_count: int
+
+
+@dataclass(slots=True)
+class VtfHeader:
+    version: tuple[int, int]
+    width: int
+    height: int
+    depth: int
+    frames: int
+    mip_count: int
+    image_format: int
+
+    @property
+    def texels(self) -> int:
+        # Top mip of the first frame, the only image the converters decode
+        return self.width * self.height * self.depth
+
+
+def _read_at(buffer: Buffer, offset: int, size: int) -> bytes:
+    buffer.seek(offset)
+    data = buffer.read(size)
+    if len(data) != size:
+        raise ValueError(f"Unexpected end of file reading {size} bytes at {offset}")
+    return data
+
+
+def _read_string(buffer: Buffer, offset: int) -> str:
+    buffer.seek(offset)
+    data = b""
+    while b"\0" not in data:
+        chunk = buffer.read(64)
+        if not chunk:
+            break
+        data += chunk
+    return data.split(b"\0", 1)[0].decode("utf8", errors="replace")
+
+
+def read_mdl_header(buffer: Buffer) -> MdlHeader:
+    header = _read_at(buffer, 0, _MDL_HEADER_SIZE)
+    ident, version, checksum = struct.unpack_from("<4sii", header, 0)
+    if ident != b"IDST":
+        raise ValueError(f"Not an MDL file ({ident!r})")
+    name = header[12:76].split(b"\0", 1)[0].decode("utf8", errors="replace")
+    flags, bone_count = struct.unpack_from("<ii", header, 152)
+    texture_count, texture_offset, cd_texture_count, cd_texture_offset = struct.unpack_from("<4i", header, 204)
+    skin_family_count, _, body_part_count, body_part_offset = struct.unpack_from("<4i", header, 224)
+    flex_count, = struct.unpack_from("<i", header, 260)
+
+    body_parts = []
+    if body_part_count:
+        data = _read_at(buffer, body_part_offset, body_part_count * _MDL_BODY_PART_SIZE)
+        body_parts = [struct.unpack_from("<i", data, n * _MDL_BODY_PART_SIZE + 4)[0] for n in range(body_part_count)]
+    material_names = []
+    if texture_count:
+        data = _read_at(buffer, texture_offset, texture_count * _MDL_TEXTURE_SIZE)
+        for n in range(texture_count):
+            # Name offsets are relative to their texture entry
+            name_offset, = struct.unpack_from("<i", data, n * _MDL_TEXTURE_SIZE)
+            material_names.append(_read_string(buffer, texture_offset + n * _MDL_TEXTURE_SIZE + name_offset))
+    material_paths = []
+    if cd_texture_count:
+        data = _read_at(buffer, cd_texture_offset, cd_texture_count * 4)
+        material_paths = [_read_string(buffer, offset) for offset in struct.unpack(f"<{cd_texture_count}i", data)]
+    return MdlHeader(version, checksum, name, flags, bone_count, flex_count, skin_family_count, body_parts,
+                     material_names, material_paths)
+
+
+def read_vvd_header(buffer: Buffer) -> VvdHeader:
+    ident, version, checksum, lod_count, *lod_vertex_counts, fixup_count, fixup_offset, vertex_offset, \
+        tangent_offset = _VVD_HEADER.unpack(_read_at(buffer, 0, _VVD_HEADER.size))
+    if ident != b"IDSV":
+        raise ValueError(f"Not a VVD file ({ident!r})")
+    return VvdHeader(version, checksum, lod_count, lod_vertex_counts[:lod_count], fixup_count, fixup_offset,
+                     vertex_offset, tangent_offset)
+
+
+def read_vtx_header(buffer: Buffer) -> VtxHeader:
+    version, _, _, _, _, checksum, lod_count, _, body_part_count, _ = _VTX_HEADER.unpack(
+        _read_at(buffer, 0, _VTX_HEADER.size))
+    if version != 7:
+        raise ValueError(f"Unsupported VTX version {version}")
+    return VtxHeader(version, checksum, lod_count, body_part_count)
+
+
+def read_vtf_header(buffer: Buffer) -> VtfHeader:
+    (ident, major, minor, _, width, height, _, frames, _, _, _, _, _, image_format,
+     mip_count) = _VTF_HEADER.unpack(_read_at(buffer, 0, _VTF_HEADER.size))
+    if ident != b"VTF\0":
+        raise ValueError(f"Not a VTF file ({ident!r})")
+    depth = 1
+    if (major, minor) >= (7, 2):
+        depth, = _VTF_DEPTH.unpack(_read_at(buffer, _VTF_DEPTH_OFFSET, _VTF_DEPTH.size))
+    return VtfHeader((major, minor), width, height, max(depth, 1), frames, mip_count, image_format)
+
@@ -1 +0,0 @@
-from .source1 import vertex_lit_generic
\ No newline at end of file
@@ -1,15 +1,18 @@
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, Optional, TYPE_CHECKING
 
-from SourceIO.library.shared.content_providers.content_manager import ContentManager
-from SourceIO.library.utils import Buffer
-from SourceIO.logger import SourceLogMan
-from source2converter.materials.types import ValveMaterial, ValveTexture
+from source2converter.converter_registry import ConverterRegistry, first_match
+from source2converter.utils import get_logger
 
-log_manager = SourceLogMan()
-logger = log_manager.get_logger('MDL Converter Tags')
+# Types only, SourceIO and Pillow (through materials.types) load with the first converter module
+if TYPE_CHECKING:
+    from SourceIO.library.shared.content_providers.content_manager import ContentManager
+    from SourceIO.library.utils import Buffer
+    from source2converter.materials.types import ValveMaterial, ValveTexture
+
+    MaterialConvertFunction = Callable[[Path, Buffer, ContentManager], tuple[ValveMaterial, list[ValveTexture]]]
 
 
 class SourceType(Enum):
@@ -31,36 +34,36 @@ class MaterialConverterTag:
     morph_support: bool
 
 
-MaterialConvertFunction = Callable[[Path, Buffer, ContentManager], tuple[ValveMaterial, list[ValveTexture]]]
-MATERIAL_CONVERTERS: list[tuple[MaterialConverterTag, MaterialConvertFunction]] = []
+def _parse_material_key(name: str) -> tuple[SourceType, GameType, str]:
+    # Entry point names look like "Source1Source:CS2:vertexlitgeneric"
+    source, game, mat_type = name.split(":")
+    return SourceType[source], GameType[game], mat_type.lower()
+
+
+MATERIAL_CONVERTERS: 'ConverterRegistry[MaterialConverterTag, MaterialConvertFunction]' = ConverterRegistry(
+    "source2converter.material_converters",
+    {(SourceType.Source1Source, GameType.CS2, "vertexlitgeneric"):
+         ["source2converter.materials.source1.vertex_lit_generic"],
+     (SourceType.Source1Source, GameType.CS2, "lightmappedgeneric"):
+         ["source2converter.materials.source1.lightmapped_generic"],
+     (SourceType.Source1Source, GameType.CS2, "worldvertextransition"):
+         ["source2converter.materials.source1.lightmapped_generic"]},
+    _parse_material_key)
 
 
 def register_material_converter(source: SourceType, game: GameType, type: str, morph_support: bool = False):
-    def inner(func: MaterialConvertFunction) -> MaterialConvertFunction:
-        MATERIAL_CONVERTERS.append((MaterialConverterTag(source, game, type, morph_support), func))
+    def inner(func: 'MaterialConvertFunction') -> 'MaterialConvertFunction':
+        MATERIAL_CONVERTERS.add((source, game, type), MaterialConverterTag(source, game, type, morph_support), func)
         return func
 
     return inner
 
 
 def choose_material_converter(source: SourceType, game: GameType, mat_type: str,
-                              morph_support: bool = False) -> Optional[MaterialConvertFunction]:
-    best_match = None
-    best_score = 0  # Start with a score lower than any possible match score
-
-    for handler_tag, handler_func in MATERIAL_CONVERTERS:
-        score = 0
-        # Check ident and version match
-        if handler_tag.source == source and handler_tag.game == game and handler_tag.type == mat_type:
-            if morph_support == handler_tag.morph_support:
-                score += 2
-            score += 2  # Base score for ident and version match
-
-        # Update best match if this handler has a higher score
-        if score > best_score:
-            best_score = score
-            best_match = handler_func
+                              morph_support: bool = False) -> Optional['MaterialConvertFunction']:
+    best_match = first_match(MATERIAL_CONVERTERS.lookup((source, game, mat_type)),
+                             lambda tag: tag.morph_support == morph_support)
     if best_match is None:
-        logger.error(f'Could not find converter from {source.value!r} {mat_type} '
+        get_logger('MDL Converter Tags').error(f'Could not find converter from {source.value!r} {mat_type} '
                      f'{"with morph support" if morph_support else "without morph support"} to {game.value!r}')
     return best_match
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+
+from SourceIO.logger import SourceLogMan
+from utils import normalize_path
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('Material registry')
+
+# How long a morph claim waits for a running plain conversion of the same material, a worker killed mid conversion
+# never completes or releases its claim
+CLAIM_WAIT_TIMEOUT = 300
+
+
+@dataclass
+class ConvertedMaterial:
+    vmat_path: Path
+    texture_paths: list[Path]
+
+
+class MaterialRegistry:
+    """Run-scoped record of converted materials, so a VMT shared by many models is only converted once.
+
+    Without a run_path the registry only covers the current process. With a run_path shared by all pool workers,
+    the first worker to atomically create a claim file for a material owns its conversion and every other worker
+    skips it.
+
+    Flexed models need the morph capable variant of a material, both variants write the same vmat. One claim file
+    per output path keeps two workers from writing it at once: morph wins, plain claims give way to a morph claim and
+    a morph claim waits for a plain conversion that is still running, then converts over it.
+    """
+
+    def __init__(self, run_path: Optional[Path] = None):
+        self.run_path = run_path
+        self._claimed: set[str] = set()
+        # Output path claims taken by morph claims of this registry, released with them
+        self._held: set[str] = set()
+        self._materials: dict[str, ConvertedMaterial] = {}
+        self._lock = threading.Lock()
+        if run_path is not None:
+            run_path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(material_path: Path | str, game: Enum, has_shape_keys: bool = False) -> str:
+        return f"{game.name}:{int(has_shape_keys)}:{normalize_path(material_path).with_suffix('').as_posix()}"
+
+    def claim(self, material_path: Path | str, game: Enum, has_shape_keys: bool = False) -> bool:
+        # The plain key's claim file stands for the output path, the morph key's one for the morph upgrade
+        key = self.make_key(material_path, game, False)
+        morph_key = self.make_key(material_path, game, True)
+        with self._lock:
+            if morph_key in self._claimed or (not has_shape_keys and key in self._claimed):
+                return False
+            if self.run_path is None:
+                self._claimed.add(morph_key if has_shape_keys else key)
+                return True
+            if not has_shape_keys:
+                if self._claim_path(morph_key).exists() or not self._create(key):
+                    return False
+                if self._claim_path(morph_key).exists():
+                    # A morph claim came in meanwhile and waits for this one, give way to it
+                    self._claim_path(key).unlink(missing_ok=True)
+                    return False
+                self._claimed.add(key)
+                return True
+            if not self._create(morph_key):
+                return False
+            self._claimed.add(morph_key)
+        # Only one worker gets here per material, it waits for a plain conversion in progress to finish
+        deadline = time.monotonic() + CLAIM_WAIT_TIMEOUT
+        while True:
+            if self._create(key):
+                with self._lock:
+                    self._held.add(key)
+                return True
+            try:
+                if self._claim_path(key).read_text(encoding="utf8"):
+                    return True
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                logger.warn(f"Gave up waiting for the plain conversion of {material_path}, keeping it")
+                self.release(material_path, game, True)
+                return False
+            time.sleep(0.05)
+
+    def release(self, material_path: Path | str, game: Enum, has_shape_keys: bool = False):
+        # Give up a claim after a failed conversion, so another model can try again.
+        key = self.make_key(material_path, game, has_shape_keys)
+        plain_key = self.make_key(material_path, game, False)
+        with self._lock:
+            self._claimed.discard(key)
+            if self.run_path is not None:
+                self._claim_path(key).unlink(missing_ok=True)
+                if plain_key in self._held:
+                    self._held.discard(plain_key)
+                    self._claim_path(plain_key).unlink(missing_ok=True)
+
+    def complete(self, material_path: Path | str, game: Enum, material: ConvertedMaterial,
+                 has_shape_keys: bool = False):
+        key = self.make_key(material_path, game, has_shape_keys)
+        plain_key = self.make_key(material_path, game, False)
+        with self._lock:
+            self._materials[key] = material
+            if self.run_path is not None:
+                data = json.dumps({"vmat_path": material.vmat_path.as_posix(),
+                                   "texture_paths": [path.as_posix() for path in material.texture_paths]})
+                self._write_claim(key, data)
+                if plain_key in self._held:
+                    self._held.discard(plain_key)
+                    self._write_claim(plain_key, data)
+
+    def get(self, material_path: Path | str, game: Enum, has_shape_keys: bool = False) -> Optional[ConvertedMaterial]:
+        # Returns None while the owning worker is still converting the material.
+        material = self._get(self.make_key(material_path, game, True))
+        if material is None and not has_shape_keys:
+            material = self._get(self.make_key(material_path, game, False))
+        return material
+
+    def _get(self, key: str) -> Optional[ConvertedMaterial]:
+        with self._lock:
+            material = self._materials.get(key)
+            if material is not None or self.run_path is None:
+                return material
+            try:
+                text = self._claim_path(key).read_text(encoding="utf8")
+            except FileNotFoundError:
+                return None
+        if not text:
+            return None
+        data = json.loads(text)
+        material = ConvertedMaterial(Path(data["vmat_path"]), [Path(path) for path in data["texture_paths"]])
+        with self._lock:
+            self._materials[key] = material
+        return material
+
+    def _create(self, key: str) -> bool:
+        try:
+            fd = os.open(self._claim_path(key), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        return True
+
+    def _write_claim(self, key: str, data: str):
+        claim_path = self._claim_path(key)
+        tmp_path = claim_path.with_suffix(".tmp")
+        tmp_path.write_text(data, encoding="utf8")
+        os.replace(tmp_path, claim_path)
+
+    def _claim_path(self, key: str) -> Path:
+        return self.run_path / (hashlib.blake2b(key.encode("utf8"), digest_size=16).hexdigest() + ".json")
@@ -1,34 +1,214 @@
 from pathlib import Path
+from typing import Callable, Optional, Union
 
 import numpy as np
 from PIL import Image
 
 from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.library.source1.vmt import VMT
 from SourceIO.logger import SourceLogMan
 from SourceIO.library.source1.vtf import load_texture as load_vtf
+from source2converter.cache import record_input, record_missing_input, texture_input, buffer_stat
+from source2converter.materials.texture_cache import get_texture_cache
+from source2converter.materials.texture_writer import get_texture_writer
 from source2converter.materials.types import ValveTexture
+from source2converter.timing import span, record_counts
 
 log_manager = SourceLogMan()
 logger = log_manager.get_logger('Material converter')
 
 
-def load_texture(texture_path, content_manager: ContentManager):
+# Rows converted per step when the decoder hands out floats, bounds the float temporary to a few hundred KiB
+_DECODE_BLOCK_ROWS = 64
+_RGBA_BANDS = "RGBA"
+
+
+def _to_rgba8(texture_data: np.ndarray, width: int, height: int) -> np.ndarray:
+    # Flipped, uint8, C-contiguous (rows, columns, 4) in a single allocation, without a full-size float temporary
+    source = texture_data.reshape(width, height, -1)[::-1]
+    rgba = np.empty(source.shape, np.uint8)
+    if source.dtype == np.uint8:
+        np.copyto(rgba, source)
+        return rgba
+    block = np.empty((min(_DECODE_BLOCK_ROWS, len(source)),) + source.shape[1:], np.float32)
+    for start in range(0, len(source), _DECODE_BLOCK_ROWS):
+        chunk = block[:len(source[start:start + _DECODE_BLOCK_ROWS])]
+        np.multiply(source[start:start + len(chunk)], 255, out=chunk)
+        np.copyto(rgba[start:start + len(chunk)], chunk, casting="unsafe")
+    return rgba
+
+
+def image_from_array(array: np.ndarray) -> Image.Image:
+    """PIL image over a uint8 (rows, columns[, channels]) array.
+
+    L and RGBA arrays are shared, not copied. Arrays nobody else holds (writable ones) give images Pillow can encode
+    in place, it copies read-only images before saving them.
+    """
+    if array.ndim == 3 and array.shape[2] == 1:
+        array = array[..., 0]
+    mode = "L" if array.ndim == 2 else {3: "RGB", 4: "RGBA"}[array.shape[2]]
+    if mode == "RGB":
+        # Pillow keeps RGB at 4 bytes per pixel, there is no layout to share
+        return Image.frombytes(mode, (array.shape[1], array.shape[0]), np.ascontiguousarray(array))
+    if not array.flags.c_contiguous:
+        array = np.ascontiguousarray(array)
+    image = Image.frombuffer(mode, (array.shape[1], array.shape[0]), array, "raw", mode, 0, 1)
+    if array.flags.writeable:
+        image.readonly = 0
+    return image
+
+
+def load_texture_array(texture_path, content_manager: ContentManager) -> Optional[np.ndarray]:
+    """Decoded texture as a read-only uint8 (rows, columns, 4) RGBA array, shared through the texture cache."""
+    texture_cache = get_texture_cache()
+    texture = texture_cache.get(texture_path)
+    texture_data = None
+    if texture is not None:
+        # Cache hits are checked against the VTF every time, a long-running daemon outlives texture edits.
+        # Loose files are compared by size and mtime, VPK entries by digest while a manifest is tracking inputs
+        # (the daemon clears the cache when VPKs change).
+        texture_data = content_manager.find_texture(texture_path)
+        cached_stat, cached_digest = texture_cache.source(texture_path)
+        stat = buffer_stat(texture_data) if texture_data is not None else None
+        if stat is not None and stat == cached_stat:
+            record_input(texture_input(texture_path), texture_data, cached_digest)
+            return texture
+        if stat is None:
+            digest = record_input(texture_input(texture_path), texture_data)
+            if digest is None or cached_digest is None or digest == cached_digest:
+                return texture
+        logger.info(f"Texture {texture_path} changed since it was cached")
     logger.info(f"Loading texture {texture_path}")
-    texture_data = content_manager.find_texture(texture_path)
-    if texture_path:
-        texture_data, width, height = load_vtf(texture_data)
-        texture_data = np.flipud(texture_data)
-        texture = Image.frombytes("RGBA", (height, width), (texture_data * 255).astype(np.uint8))
+    if texture_data is None:
+        texture_data = content_manager.find_texture(texture_path)
+    else:
+        texture_data.seek(0)
+    if texture_data is not None:
+        digest = record_input(texture_input(texture_path), texture_data)
+        stat = buffer_stat(texture_data)
+        with span("vtf_decode"):
+            texture_data, width, height = load_vtf(texture_data)
+            texture = _to_rgba8(texture_data, width, height)
+            texture.flags.writeable = False
+        record_counts(textures=1, texture_pixels=width * height)
+        texture_cache.put(texture_path, texture, digest, stat)
         return texture
     else:
+        record_missing_input(texture_input(texture_path))
         logger.error(f"Texture {texture_path} not found!")
     return None
 
 
-def write_texture(export_texture_list: list[ValveTexture], image: Image.Image, name: str, content_path: Path,
+def load_texture(texture_path, content_manager: ContentManager) -> Optional[Image.Image]:
+    # Read-only image over the cached pixels, no copy is made
+    texture = load_texture_array(texture_path, content_manager)
+    if texture is None:
+        return None
+    return image_from_array(texture)
+
+
+class LazyTexture:
+    """Texture reference that is only decoded when its pixels are first needed.
+
+    Derived textures are handles too and are shared, every getchannel('A') of the same texture resolves to the same
+    pixels. Channel operations run on uint8 arrays (getchannel is a view), mode conversions on PIL images, each side
+    is only materialized when asked for. A texture that could not be loaded resolves to None.
+    """
+
+    def __init__(self, name: str, array_loader: Callable[[], Optional[np.ndarray]] = None,
+                 image_loader: Callable[[], Optional[Image.Image]] = None):
+        self.name = name
+        self._array_loader = array_loader
+        self._image_loader = image_loader
+        self._array: Optional[np.ndarray] = None
+        self._image: Optional[Image.Image] = None
+        self._loaded = False
+        self._derived: dict[tuple[str, Optional[str]], LazyTexture] = {}
+
+    def _load(self):
+        if self._loaded:
+            return
+        if self._array_loader is not None:
+            self._array = self._array_loader()
+        else:
+            self._image = self._image_loader()
+        self._loaded = True
+        self._array_loader = self._image_loader = None
+
+    @property
+    def array(self) -> Optional[np.ndarray]:
+        self._load()
+        if self._array is None and self._image is not None:
+            self._array = np.asarray(self._image)
+        return self._array
+
+    @property
+    def image(self) -> Optional[Image.Image]:
+        self._load()
+        if self._image is None and self._array is not None:
+            self._image = image_from_array(self._array)
+        return self._image
+
+    def _derive(self, operation: str, argument: Optional[str], func: Callable, on_array: bool) -> 'LazyTexture':
+        key = (operation, argument)
+        derived = self._derived.get(key)
+        if derived is None:
+            def load():
+                source = self.array if on_array else self.image
+                return func(source) if source is not None else None
+
+            name = f"{self.name}:{operation}({argument or ''})"
+            derived = LazyTexture(name, array_loader=load) if on_array else LazyTexture(name, image_loader=load)
+            self._derived[key] = derived
+        return derived
+
+    def getchannel(self, band: str) -> 'LazyTexture':
+        return self._derive("channel", band, lambda array: _channel(array, band), True)
+
+    def invert(self, band: Optional[str] = None) -> 'LazyTexture':
+        # One new array: 255 - value for the given band, or for every channel
+        return self._derive("invert", band, lambda array: _invert(array, band), True)
+
+    def convert(self, mode: str) -> 'LazyTexture':
+        return self._derive("convert", mode, lambda image: image.convert(mode), False)
+
+
+def _channel(array: np.ndarray, band: str) -> np.ndarray:
+    if array.ndim == 2:
+        return array
+    return array[..., _RGBA_BANDS.index(band)]
+
+
+def _invert(array: np.ndarray, band: Optional[str]) -> np.ndarray:
+    if band is None or array.ndim == 2:
+        return np.invert(array)
+    inverted = array.copy()
+    index = _RGBA_BANDS.index(band)
+    np.invert(array[..., index], out=inverted[..., index])
+    return inverted
+
+
+TextureLike = Union[Image.Image, LazyTexture]
+
+
+def lazy_texture(texture_path: str, content_manager: ContentManager) -> LazyTexture:
+    return LazyTexture(texture_path, lambda: load_texture_array(texture_path, content_manager))
+
+
+def resolve_texture(texture: Optional[TextureLike]) -> Optional[Image.Image]:
+    if isinstance(texture, LazyTexture):
+        return texture.image
+    return texture
+
+
+def write_texture(export_texture_list: list[ValveTexture], image: TextureLike, name: str, content_path: Path,
                   **settings):
-    output_path = content_path / (name + ".png")
-    export_texture_list.append(ValveTexture(output_path, image, settings))
+    resolved = resolve_texture(image)
+    if resolved is None:
+        raise ValueError(f"Texture {getattr(image, 'name', name)} could not be loaded")
+    # The codec picks the extension here, the path ends up in the vmat before the texture is written
+    output_path = content_path / (name + get_texture_writer().settings.suffix)
+    export_texture_list.append(ValveTexture(output_path, resolved, settings))
     return output_path.as_posix()
 
 
@@ -43,3 +223,150 @@ def ensure_length(arr: list, length, filler):
     elif len(arr) > length:
         return arr[:length]
     return arr
+
+
+def apply_proxies(material: VMT):
+    # Only SelectFirstIfNonzero is evaluated, it picks which parameter the material actually uses
+    if material.get('proxies', None):
+        proxies = material.get('proxies')
+        for proxy_name, proxy_data in proxies.items():
+            if proxy_name == 'selectfirstifnonzero':
+                result_var = proxy_data.get('resultvar')
+                src1_var = proxy_data.get('srcvar1')
+                src2_var = proxy_data.get('srcvar2')
+                src1_value, src1_type = material.get_vector(src1_var, [0])
+                if not all(src1_value):
+                    material.data[result_var] = material.get(src2_var)
+                else:
+                    material.data[result_var] = material.get(src1_var)
+
+
+def collect_textures(material: VMT, content_manager: ContentManager,
+                     normal_alpha_phong_mask: bool = False) -> dict[str, TextureLike]:
+    """Textures of a Source1 generic material by role (color_map, normal_map, phong_map, ...), loaded lazily."""
+    textures = {}
+    base_texture_param = material.get_string('$basetexture', None)
+    if base_texture_param is not None:
+        base_texture = textures['color_map'] = lazy_texture(base_texture_param, content_manager)
+
+        if material.get_int('$basemapalphaphongmask', 0):
+            textures['phong_map'] = base_texture.getchannel('A')
+        if (material.get_int('$basemapalphaenvmapmask', 0) or
+                material.get_int('$basealphaenvmapmask', 0)):
+            textures['env_map'] = base_texture.getchannel('A')
+        if (material.get_int('$selfillum', 0) and
+                material.get_string('$selfillummask', None) is None):
+            textures['illum_mask'] = base_texture.getchannel('A')
+        if (material.get_int('$translucent', 0) or
+                material.get_int('$alphatest', 0)):
+            textures['alpha'] = base_texture.getchannel('A')
+        if material.get_int('$blendtintbybasealpha', 0):
+            textures['color_mask'] = base_texture.getchannel('A')
+
+    normal_texture_param = material.get_string('$bumpmap', None)
+    if normal_texture_param is None:
+        normal_texture_param = material.get_string('$normalmap', None)
+    if normal_texture_param is not None:
+        normal_texture = textures['normal_map'] = lazy_texture(normal_texture_param, content_manager)
+        if normal_alpha_phong_mask and material.get_int('$basemapalphaphongmask', 0):
+            textures['phong_map'] = normal_texture.getchannel('A')
+        if material.get_int('$normalmapalphaenvmapmask', 0):
+            textures['env_map'] = normal_texture.getchannel('A')
+
+    env_mask_texture_param = material.get_string('$envmapmask', None)
+    if material.get_string("$envmap", None) is not None and env_mask_texture_param is not None:
+        textures['env_map'] = lazy_texture(env_mask_texture_param, content_manager)
+
+    phong_exp_texture_param = material.get_string('$phongexponenttexture', None)
+    if phong_exp_texture_param is not None:
+        textures['phong_exp_map'] = lazy_texture(phong_exp_texture_param, content_manager)
+
+    selfillum_mask_texture_param = material.get_string('$selfillummask', None)
+    if selfillum_mask_texture_param is not None and material.get_int('$selfillum', 0):
+        textures['illum_mask'] = lazy_texture(selfillum_mask_texture_param, content_manager)
+
+    ao_texture_param = material.get_string('$ambientoccltexture', None)
+    if ao_texture_param is None:
+        ao_texture_param = material.get_string('$ambientocclusiontexture', None)
+    if ao_texture_param is not None:
+        textures['ao_map'] = lazy_texture(ao_texture_param, content_manager)
+    return textures
+
+
+def write_surface_params(material: VMT, textures: dict[str, TextureLike], params: dict,
+                         exported_textures: list[ValveTexture], material_path: Path):
+    # Color, normal and ambient occlusion, written before the shader specific specular parameters
+    texture_output_path = material_path.parent
+    if 'color_map' in textures:
+        params['TextureColor'] = write_texture(exported_textures, textures['color_map'].convert("RGB"),
+                                               material_path.stem + '_color', texture_output_path)
+
+    if 'normal_map' in textures and not material.get_int('$ssbump', 0):
+        # Green flipped on the uint8 pixels, alpha is dropped only when the RGB image is built
+        normal_map = textures['normal_map'].invert("G").convert("RGB")
+        params['TextureNormal'] = write_texture(exported_textures, normal_map, material_path.stem + '_normal',
+                                                texture_output_path)
+
+    if 'phong_map' in textures:
+        props = {}
+        if material.get_int('$phongboost', 0):
+            props['brightness'] = material.get_float('$phongboost')
+        params['TextureAmbientOcclusion'] = write_texture(exported_textures, textures['phong_map'],
+                                                          material_path.stem + '_ao',
+                                                          texture_output_path, **props)
+        params['g_vReflectanceRange'] = [0.0, 0.5]
+    elif 'env_map' in textures:
+        params['TextureAmbientOcclusion'] = write_texture(exported_textures, textures['env_map'],
+                                                          material_path.stem + '_ao',
+                                                          texture_output_path)
+        params['g_flAmbientOcclusionDirectSpecular'] = 0.0
+    elif 'ao_map' in textures:
+        params['TextureAmbientOcclusion'] = write_texture(exported_textures, textures['ao_map'],
+                                                          material_path.stem + '_ao',
+                                                          texture_output_path)
+        params['g_flAmbientOcclusionDirectSpecular'] = 0.0
+
+
+def write_mask_params(material: VMT, textures: dict[str, TextureLike], params: dict,
+                      exported_textures: list[ValveTexture], material_path: Path):
+    # Self illumination, translucency and tint, written after the shader specific specular parameters
+    texture_output_path = material_path.parent
+    if material.get_int('$selfillum', 0) and 'illum_mask' in textures:
+        params['F_SELF_ILLUM'] = 1
+        params['TextureSelfIllumMask'] = write_texture(exported_textures, textures['illum_mask'],
+                                                       material_path.stem + 'illum_mask',
+                                                       texture_output_path)
+        if material.get_vector('$selfillumtint', [0, 0, 0])[1] is not None:
+            value, vtype = material.get_vector('$selfillumtint')
+            if vtype is int:
+                value = [v / 255 for v in value]
+            params['g_vSelfIllumTint'] = write_vector(ensure_length(value, 3, 1.0))
+        if material.get_int('$selfillummaskscale', 0):
+            params['g_flSelfIllumScale'] = material.get_int('$selfillummaskscale')
+
+    if material.get_int('$translucent', 0) and material.get_int('$alphatest', 0):
+        if material.get_int('$translucent', 0):
+            params['F_TRANSLUCENT'] = 1
+        elif material.get_int('$alphatest', 0):
+            params['F_ALPHA_TEST'] = 1
+        if material.get_int('$additive', 0):
+            params['F_ADDITIVE_BLEND'] = 1
+        params['TextureTranslucency'] = write_texture(exported_textures, textures['alpha'],
+                                                      material_path.stem + 'trans',
+                                                      texture_output_path)
+
+    if material.get_vector('$color', None)[1] is not None:
+        value, vtype = material.get_vector('$color')
+        if vtype is int:
+            value = [v / 255 for v in value]
+        params['g_vColorTint'] = write_vector(ensure_length(value, 3, 1.0))
+    elif material.get_vector('$color2', None)[1] is not None:
+        if material.get_int('$blendtintbybasealpha', 0):
+            params['F_TINT_MASK'] = 1
+            params['TextureTintMask'] = write_texture(exported_textures, textures['color_mask'],
+                                                      material_path.stem + 'colormask',
+                                                      texture_output_path)
+        value, vtype = material.get_vector('$color2')
+        if vtype is int:
+            value = [v / 255 for v in value]
+        params['g_vColorTint'] = write_vector(ensure_length(value, 3, 1.0))
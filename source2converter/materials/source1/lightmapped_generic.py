@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.library.source1.vmt import VMT
+from SourceIO.library.utils import Buffer
+from source2converter.materials.material_converter_tags import register_material_converter, SourceType, GameType
+from source2converter.materials.source1.common import apply_proxies, collect_textures, write_surface_params, \
+    write_mask_params, write_texture, write_vector
+
+
+# Brush, displacement, overlay and decal materials. WorldVertexTransition only gets its first layer converted, like
+# the legacy shader_converters.LightmappedGeneric does.
+@register_material_converter(SourceType.Source1Source, GameType.CS2, "lightmappedgeneric")
+@register_material_converter(SourceType.Source1Source, GameType.CS2, "worldvertextransition")
+def convert_lightmapped_generic(material_path: Path, buffer: Buffer, content_manager: ContentManager):
+    material = VMT(buffer, material_path.as_posix())
+    texture_output_path = material_path.parent
+
+    apply_proxies(material)
+    textures = collect_textures(material, content_manager, normal_alpha_phong_mask=True)
+    params = {"shader": "csgo_complex.vfx"}
+    exported_textures = []
+    write_surface_params(material, textures, params, exported_textures, material_path)
+
+    if material.get_int('$phong', 0):
+        params['F_SPECULAR'] = 1
+        if 'phong_exp_map' in textures:
+            phong_exp_map_flip = textures['phong_exp_map'].invert().convert('RGB')
+            params['TextureRoughness'] = write_texture(exported_textures, phong_exp_map_flip,
+                                                       material_path.stem + '_rough',
+                                                       texture_output_path)
+        elif material.get_int('$phongexponent', 0):
+            spec_value = material.get_int('$phongexponent', 0)
+            spec_final = (-10642.28 + (254.2042 - -10642.28) / (1 + (spec_value / 2402433e6) ** 0.1705696)) / 255
+            spec_final *= 1.5
+            params['TextureRoughness'] = write_vector([spec_final, spec_final, spec_final, 0.0])
+        else:
+            params['TextureRoughness'] = write_vector([60.0, 60.0, 60.0, 0.0])
+
+    write_mask_params(material, textures, params, exported_textures, material_path)
+    return params, exported_textures
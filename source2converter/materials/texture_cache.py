@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+
+@dataclass
+class TextureCacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size: int
+    memory_budget: int
+
+
+def texture_size(texture: np.ndarray) -> int:
+    return texture.nbytes
+
+
+def normalize_texture_key(texture_path: str) -> str:
+    return texture_path.replace('\\', '/').strip('/').lower()
+
+
+class TextureCache:
+    """Process-wide LRU of decoded uint8 textures, arrays handed out are shared and read-only."""
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        # Stat and digest of the source each texture was decoded from, see source()
+        self._sources: dict[str, tuple[Optional[tuple[int, int]], Optional[str]]] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, texture_path: str) -> Optional[np.ndarray]:
+        key = normalize_texture_key(texture_path)
+        with self._lock:
+            texture = self._entries.get(key)
+            if texture is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return texture
+
+    def put(self, texture_path: str, texture: np.ndarray, source_digest: Optional[str] = None,
+            source_stat: Optional[tuple[int, int]] = None):
+        key = normalize_texture_key(texture_path)
+        size = texture_size(texture)
+        if size > self.memory_budget:
+            return
+        with self._lock:
+            old_texture = self._entries.pop(key, None)
+            if old_texture is not None:
+                self._size -= texture_size(old_texture)
+            self._entries[key] = texture
+            self._sources[key] = (source_stat, source_digest)
+            self._size += size
+            self._evict()
+
+    def source(self, texture_path: str) -> tuple[Optional[tuple[int, int]], Optional[str]]:
+        # (size, mtime_ns) of the loose VTF and its digest when the loader was tracking inputs, None if unknown
+        with self._lock:
+            return self._sources.get(normalize_texture_key(texture_path), (None, None))
+
+    def get_or_load(self, texture_path: str, loader: Callable[[], Optional[np.ndarray]]) -> Optional[np.ndarray]:
+        texture = self.get(texture_path)
+        if texture is None:
+            texture = loader()
+            if texture is not None:
+                self.put(texture_path, texture)
+        return texture
+
+    def set_memory_budget(self, memory_budget: int):
+        with self._lock:
+            self.memory_budget = memory_budget
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sources.clear()
+            self._size = 0
+
+    def stats(self) -> TextureCacheStats:
+        with self._lock:
+            return TextureCacheStats(self.hits, self.misses, self.evictions, len(self._entries), self._size,
+                                     self.memory_budget)
+
+    def _evict(self):
+        while self._size > self.memory_budget and self._entries:
+            key, texture = self._entries.popitem(last=False)
+            self._sources.pop(key, None)
+            self._size -= texture_size(texture)
+            self.evictions += 1
+
+
+_texture_cache = TextureCache()
+
+
+def get_texture_cache() -> TextureCache:
+    return _texture_cache
@@ -0,0 +1,95 @@
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from source2converter.output_writer import get_output_writer
+
+
+class TextureCodec(Enum):
+    PNG = "png"
+    TGA = "tga"
+
+
+@dataclass(frozen=True)
+class TextureOutputSettings:
+    codec: TextureCodec = TextureCodec.PNG
+    # PNG: zlib level 0-9. TGA: 0 writes raw pixels, anything else RLE.
+    # None is the codec's default, Pillow's level 6 for PNG and raw pixels for TGA.
+    compress_level: Optional[int] = None
+
+    @property
+    def suffix(self) -> str:
+        return "." + self.codec.value
+
+    def save_kwargs(self) -> dict:
+        if self.codec == TextureCodec.PNG:
+            return {"format": "PNG", "compress_level": 6 if self.compress_level is None else self.compress_level}
+        return {"format": "TGA", "compression": "tga_rle" if self.compress_level else None}
+
+
+class TextureWriter:
+    """Encodes and writes textures on the output writer threads while the caller keeps converting.
+
+    Pillow releases the GIL while deflating, so PNG encoding overlaps with mesh work. Images handed to submit()
+    must not be modified afterwards. Queueing, atomic renames and error reporting are the OutputWriter's.
+    """
+
+    def __init__(self, settings: TextureOutputSettings = TextureOutputSettings()):
+        self.settings = settings
+        # id() of images with a save in flight, Image.save stores its options on the image itself
+        self._in_flight: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, settings: TextureOutputSettings, workers: Optional[int] = None):
+        output_writer = get_output_writer()
+        if workers is not None:
+            output_writer.configure(workers, output_writer.max_pending)
+        else:
+            output_writer.flush(raise_errors=False)
+        self.settings = settings
+
+    def submit(self, image: Image.Image, output_path: Path,
+               settings: Optional[TextureOutputSettings] = None) -> Future:
+        settings = settings or self.settings
+        with self._lock:
+            if id(image) in self._in_flight:
+                image = image.copy()
+            self._in_flight[id(image)] = self._in_flight.get(id(image), 0) + 1
+
+        def write(tmp_path: Path):
+            image.save(tmp_path, **settings.save_kwargs())
+
+        try:
+            future = get_output_writer().submit(Path(output_path), write, "texture_encode")
+        except BaseException:
+            self._release(image)
+            raise
+        future.add_done_callback(lambda _: self._release(image))
+        return future
+
+    def _release(self, image: Image.Image):
+        with self._lock:
+            count = self._in_flight.pop(id(image)) - 1
+            if count:
+                self._in_flight[id(image)] = count
+
+    @staticmethod
+    def flush(raise_errors: bool = True):
+        # Textures share the output writer with every other file, this waits for all of them
+        get_output_writer().flush(raise_errors)
+
+    @staticmethod
+    def shutdown():
+        get_output_writer().shutdown()
+
+
+_writer = TextureWriter()
+
+
+def get_texture_writer() -> TextureWriter:
+    return _writer
@@ -1,3 +1 @@
-from . import v49
-
 from .model_converter_tags import choose_model_converter, register_model_converter
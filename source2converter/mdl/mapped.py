@@ -0,0 +1,67 @@
+import io
+import mmap
+from typing import Optional
+
+import numpy as np
+
+from SourceIO.library.utils import Buffer
+from SourceIO.logger import SourceLogMan
+from source2converter.headers import read_vvd_header
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('Mapped VVD')
+
+# mstudiovertex_t, field names as in SourceIO's Vvd so both can be used interchangeably
+VVD_VERTEX_DTYPE = np.dtype([
+    ("weight", "<f4", (3,)), ("bone_id", "u1", (3,)), ("bone_count", "u1"),
+    ("vertex", "<f4", (3,)), ("normal", "<f4", (3,)), ("uv", "<f4", (2,)),
+])
+# vertexFileFixup_t: lod, first vertex, vertex count
+VVD_FIXUP_DTYPE = np.dtype([("lod", "<i4"), ("source_vertex_id", "<i4"), ("vertex_count", "<i4")])
+
+_enabled = True
+
+
+def set_mapped_vvd(enabled: bool):
+    global _enabled
+    _enabled = enabled
+
+
+class MappedVvd:
+    """VVD vertices as read-only numpy views over a memory map of the file.
+
+    Workers converting from the same install share the mapped pages through the page cache instead of holding
+    private copies. Only LODs assembled from fixups are copied, like Vvd does. The views keep the mapping alive,
+    the file itself can be closed.
+    """
+
+    def __init__(self, mapping: mmap.mmap):
+        header = read_vvd_header(io.BytesIO(mapping[:64]))
+        self.checksum = header.checksum
+        vertex_count = header.lod_vertex_counts[0] if header.lod_vertex_counts else 0
+        vertices = np.frombuffer(mapping, VVD_VERTEX_DTYPE, vertex_count, header.vertex_offset)
+        if header.fixup_count:
+            fixups = np.frombuffer(mapping, VVD_FIXUP_DTYPE, header.fixup_count, header.fixup_offset)
+            self.lod_data = [
+                np.concatenate([vertices[fixup["source_vertex_id"]:fixup["source_vertex_id"] + fixup["vertex_count"]]
+                                for fixup in fixups if fixup["lod"] >= lod])
+                for lod in range(header.lod_count)
+            ]
+        else:
+            self.lod_data = [vertices[:lod_vertex_count] for lod_vertex_count in header.lod_vertex_counts]
+
+
+def map_vvd(buffer: Buffer) -> Optional[MappedVvd]:
+    # Loose files come as file objects, VPK entries are in memory already and are left to Vvd
+    if not _enabled:
+        return None
+    try:
+        fileno = buffer.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    try:
+        mapping = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as ex:
+        logger.warn(f"Could not map VVD file, reading it instead: {ex}")
+        return None
+    return MappedVvd(mapping)
@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+from typing import Iterable
+
+import numpy as np
+
+
+def smallest_index_dtype(max_value: int) -> np.dtype:
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+@dataclass
+class LodRemap:
+    # Presence mask over the vertex pool, True for every vertex referenced by the LOD strips
+    used_mask: np.ndarray
+    # Sorted pool indices of the used vertices, compacted index -> pool index
+    used_indices: np.ndarray
+    # Pool index -> compacted index, only meaningful where used_mask is set
+    lookup: np.ndarray
+
+    def remap(self, indices: np.ndarray) -> np.ndarray:
+        return self.lookup[indices]
+
+
+def build_lod_remap(index_arrays: Iterable[np.ndarray], pool_size: int) -> LodRemap:
+    # One pass to mark used vertices and one to number them, instead of sorting with np.unique
+    used_mask = np.zeros(pool_size, dtype=np.bool_)
+    for indices in index_arrays:
+        used_mask[indices] = True
+    used_indices = np.flatnonzero(used_mask).astype(smallest_index_dtype(max(pool_size - 1, 0)))
+    lookup = np.zeros(pool_size, dtype=smallest_index_dtype(max(used_indices.size - 1, 0)))
+    lookup[used_indices] = np.arange(used_indices.size, dtype=lookup.dtype)
+    return LodRemap(used_mask, used_indices, lookup)
@@ -0,0 +1,64 @@
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import numpy as np
+
+from source2converter.model import ShapeKey
+
+
+@dataclass
+class _Flex:
+    stereo: bool
+    index_chunks: list[np.ndarray] = field(default_factory=list)
+    position_chunks: list[np.ndarray] = field(default_factory=list)
+    normal_chunks: list[np.ndarray] = field(default_factory=list)
+    indices: Optional[np.ndarray] = None
+    positions: Optional[np.ndarray] = None
+    normals: Optional[np.ndarray] = None
+
+
+class FlexTable:
+    """Collects the flex chunks of every mesh of a model once, and hands out shape keys for any LOD.
+
+    Chunks are only concatenated on first use, so a flex spread over many meshes costs one copy instead of one
+    reallocation per mesh. Shape keys returned for different LODs share the same source arrays.
+    """
+
+    def __init__(self):
+        self._flexes: dict[str, _Flex] = {}
+        self._mesh_flexes: dict[int, list[str]] = {}
+
+    def add(self, name: str, mesh_index: int, indices: np.ndarray, positions: np.ndarray, normals: np.ndarray,
+            stereo: bool):
+        flex = self._flexes.get(name)
+        if flex is None:
+            flex = self._flexes[name] = _Flex(stereo)
+        flex.index_chunks.append(indices)
+        flex.position_chunks.append(positions)
+        flex.normal_chunks.append(normals)
+        self._mesh_flexes.setdefault(mesh_index, []).append(name)
+
+    def shape_keys_for(self, mesh_indices: Iterable[int]) -> list[ShapeKey]:
+        # Same order as accumulating the meshes one by one: by first appearance in the given meshes.
+        names = {}
+        for mesh_index in mesh_indices:
+            for name in self._mesh_flexes.get(mesh_index, ()):
+                names[name] = None
+        shape_keys = []
+        for name in names:
+            flex = self._build(name)
+            shape_key = ShapeKey(name, flex.indices, {"positions": flex.positions, "normals": flex.normals})
+            shape_key.stereo = flex.stereo
+            shape_keys.append(shape_key)
+        return shape_keys
+
+    def _build(self, name: str) -> _Flex:
+        flex = self._flexes[name]
+        if flex.indices is None:
+            flex.indices = np.concatenate(flex.index_chunks)
+            flex.positions = np.concatenate(flex.position_chunks)
+            flex.normals = np.concatenate(flex.normal_chunks)
+            flex.index_chunks.clear()
+            flex.position_chunks.clear()
+            flex.normal_chunks.clear()
+        return flex
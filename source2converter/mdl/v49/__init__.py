@@ -24,10 +24,14 @@ from SourceIO.library.utils import Buffer
 from SourceIO.library.utils.common import get_slice
 from SourceIO.library.utils.path_utilities import find_vtx_cm, path_stem, collect_full_material_names
 from SourceIO.logger import SourceLogMan
+from source2converter.mdl.mapped import map_vvd
 from source2converter.mdl.model_converter_tags import register_model_converter
-from source2converter.model import Model, Skeleton, Material, Mesh, Lod, SubModel, BodyGroup, ShapeKey, LoddedSubModel, \
+from source2converter.mdl.remap import build_lod_remap
+from source2converter.mdl.shape_keys import FlexTable
+from source2converter.model import Model, Skeleton, Material, Mesh, Lod, SubModel, BodyGroup, LoddedSubModel, \
     NullSubModel
 from source2converter.model.skeleton import Bone, Attachment, AttachmentParentType
+from source2converter.timing import span, record_counts
 from source2converter.utils.math_utils import decompose_matrix_to_rts, quaternion_to_euler
 
 log_manager = SourceLogMan()
@@ -47,35 +51,36 @@ def convert_skeleton(mdl: MdlV49):
     return skeleton
 
 
-def update_mesh_for_lod(mesh):
-    # Step 1: Identify all used vertices across strips
-    all_used_indices = np.unique(np.concatenate([strip[1] for strip in mesh.strips]))
+def update_mesh_for_lod(mesh: Mesh):
+    # Mark the pool vertices used by the strips, every index below is remapped through the same lookup table
+    remap = build_lod_remap([indices for _, indices in mesh.strips], mesh.vertex_count)
 
-    # Map old indices to new indices
-    index_mapping = np.full(np.max(all_used_indices) + 1, -1, dtype=int)
-    index_mapping[all_used_indices] = np.arange(all_used_indices.size)
+    mesh.strips = [(mat_idx, remap.remap(indices)) for mat_idx, indices in mesh.strips]
 
-    # Step 2: Remap indices in each strip
-    mesh.strips = [(mat_idx, index_mapping[indices]) for mat_idx, indices in mesh.strips]
-
-    # Step 3 & 4: Adjust and Remap Shape Key Indices
     for shape_key in mesh.shape_keys:
-        # Determine which indices in the shape key are also in the LOD
-        valid_indices_mask = np.isin(shape_key.indices, all_used_indices)
-        filtered_indices = shape_key.indices[valid_indices_mask]
-
-        # Remap these indices to the new indices in the LOD mesh
-        remapped_indices = index_mapping[filtered_indices]
-
-        # Filter and remap shape key indices
-        shape_key.indices = remapped_indices
-
-        # Step 5: Adjust delta_attributes only for valid (remaining) indices
+        # Keep only the deltas of vertices that are part of this LOD
+        valid_indices_mask = remap.used_mask[shape_key.indices]
+        shape_key.indices = remap.remap(shape_key.indices[valid_indices_mask])
         for attr, deltas in shape_key.delta_attributes.items():
             shape_key.delta_attributes[attr] = deltas[valid_indices_mask]
 
-    # Create new vertex attributes containing only used vertices
-    mesh.vertex_attributes = {attr: data[all_used_indices] for attr, data in mesh.vertex_attributes.items()}
+    # Keep the shared vertex pool, attributes are gathered with these indices at export time
+    mesh.vertex_indices = remap.used_indices
+
+
+def build_flex_table(mdl: MdlV49, mdl_model: MdlModel) -> FlexTable:
+    # Flex data does not depend on the LOD, gather it once per model and let every LOD pick its meshes.
+    flex_table = FlexTable()
+    for n, mdl_mesh in enumerate(mdl_model.meshes):
+        mdl_mesh: MdlMesh
+        for mdl_flex in mdl_mesh.flexes:
+            vertex_animations = mdl_flex.vertex_animations
+            flex_table.add(mdl.flex_names[mdl_flex.flex_desc_index], n,
+                           vertex_animations["index"].ravel().astype(np.uint32) + mdl_mesh.vertex_index_start,
+                           vertex_animations["vertex_delta"].reshape(-1, 3),
+                           vertex_animations["normal_delta"].reshape(-1, 3),
+                           mdl_flex.partner_index != 0)
+    return flex_table
 
 
 @register_model_converter(b"IDST", 44)
@@ -84,14 +89,18 @@ def update_mesh_for_lod(mesh):
 @register_model_converter(b"IDST", 47)
 @register_model_converter(b"IDST", 49)
 def convert_mdl_v49(model_path: Path, buffer: Buffer, content_manager: ContentManager) -> Optional[Model]:
-    mdl = MdlV49.from_buffer(buffer)
-    vtx_buffer = find_vtx_cm(model_path, content_manager)
-    vvd_buffer = content_manager.find_file(model_path.with_suffix(".vvd"))
-    if vtx_buffer is None or vvd_buffer is None:
-        logger.error(f"Could not find VTX and/or VVD file for {model_path}")
-        return None
-    vtx = open_vtx(vtx_buffer)
-    vvd = Vvd.from_buffer(vvd_buffer)
+    with span("mdl_parse"):
+        mdl = MdlV49.from_buffer(buffer)
+        vtx_buffer = find_vtx_cm(model_path, content_manager)
+        vvd_buffer = content_manager.find_file(model_path.with_suffix(".vvd"))
+        if vtx_buffer is None or vvd_buffer is None:
+            logger.error(f"Could not find VTX and/or VVD file for {model_path}")
+            return None
+        vtx = open_vtx(vtx_buffer)
+        # Loose files are mapped, the vertex arrays below are then views of the page cache
+        vvd = map_vvd(vvd_buffer) or Vvd.from_buffer(vvd_buffer)
+    record_counts(vertices=len(vvd.lod_data[0]), flexes=len(mdl.flex_names), materials=len(mdl.materials),
+                  lods=len(vvd.lod_data))
 
     mdl_name = path_stem(mdl.header.name)
 
@@ -116,56 +125,41 @@ def convert_mdl_v49(model_path: Path, buffer: Buffer, content_manager: ContentMa
             if mdl_model.vertex_count == 0:
                 submodels.append(NullSubModel())
                 continue
+            with span("shape_keys"):
+                flex_table = build_flex_table(mdl, mdl_model)
+            # Views into the VVD data, shared by all LODs of this model
+            model_vertices = get_slice(vvd.lod_data[0], mdl_model.vertex_offset, mdl_model.vertex_count)
+            vertex_attributes = {
+                "positions": model_vertices["vertex"],
+                "normals": model_vertices["normal"],
+                "uv0": model_vertices["uv"],
+                "blend_weights": model_vertices["weight"],
+                "blend_indices": model_vertices["bone_id"],
+            }
             for vtx_lod in vtx_model.model_lods:
-                lod_vertices = get_slice(vvd.lod_data[0], mdl_model.vertex_offset, mdl_model.vertex_count)
-                vertex_attributes = {
-                    "positions": lod_vertices["vertex"],
-                    "normals": lod_vertices["normal"],
-                    "uv0": lod_vertices["uv"],
-                    "blend_weights": lod_vertices["weight"],
-                    "blend_indices": lod_vertices["bone_id"],
-                }
                 strips = []
-                shape_keys = {}
-                for n, (vtx_mesh, mdl_mesh) in enumerate(zip(vtx_lod.meshes, mdl_model.meshes)):
-                    vtx_mesh: VtxMesh
-                    mdl_mesh: MdlMesh
-                    if not vtx_mesh.strip_groups:
-                        continue
-                    for mdl_flex in mdl_mesh.flexes:
-                        model.has_shape_keys = True
-                        flex_name = mdl.flex_names[mdl_flex.flex_desc_index]
-                        if flex_name in shape_keys:
-                            shape_key = shape_keys[flex_name]
-                            shape_key.indices = np.append(shape_key.indices,
-                                                          mdl_flex.vertex_animations[
-                                                              "index"] + mdl_mesh.vertex_index_start).ravel()
-                            shape_key.delta_attributes["positions"] = np.append(shape_key.delta_attributes["positions"],
-                                                                                mdl_flex.vertex_animations[
-                                                                                    "vertex_delta"]).reshape(-1, 3)
-                            shape_key.delta_attributes["normals"] = np.append(shape_key.delta_attributes["normals"],
-                                                                              mdl_flex.vertex_animations[
-                                                                                  "normal_delta"]).reshape(-1, 3)
-                        else:
-                            shape_key = ShapeKey(flex_name,
-                                                 mdl_flex.vertex_animations[
-                                                     "index"].ravel() + mdl_mesh.vertex_index_start,
-                                                 {
-                                                     "positions": mdl_flex.vertex_animations["vertex_delta"].reshape(-1,
-                                                                                                                     3),
-                                                     "normals": mdl_flex.vertex_animations["normal_delta"].reshape(-1,
-                                                                                                                   3),
-                                                 })
-                            shape_key.stereo = mdl_flex.partner_index != 0
-                            shape_keys[flex_name] = shape_key
-
-                    for strip_group in vtx_mesh.strip_groups:
-                        indices = np.add(
-                            strip_group.vertexes[strip_group.indices]["original_mesh_vertex_index"].astype(np.uint32),
-                            mdl_mesh.vertex_index_start)
-                        strips.append((mdl_mesh.material_index, indices.ravel()))
-                mesh = Mesh(mdl_model.name, strips, vertex_attributes, list(shape_keys.values()))
-                update_mesh_for_lod(mesh)
+                lod_mesh_indices = []
+                with span("vtx_strips"):
+                    for n, (vtx_mesh, mdl_mesh) in enumerate(zip(vtx_lod.meshes, mdl_model.meshes)):
+                        vtx_mesh: VtxMesh
+                        mdl_mesh: MdlMesh
+                        if not vtx_mesh.strip_groups:
+                            continue
+                        lod_mesh_indices.append(n)
+
+                        for strip_group in vtx_mesh.strip_groups:
+                            indices = np.add(
+                                strip_group.vertexes[strip_group.indices]["original_mesh_vertex_index"].astype(
+                                    np.uint32),
+                                mdl_mesh.vertex_index_start)
+                            strips.append((mdl_mesh.material_index, indices.ravel()))
+                with span("shape_keys"):
+                    shape_keys = flex_table.shape_keys_for(lod_mesh_indices)
+                if shape_keys:
+                    model.has_shape_keys = True
+                mesh = Mesh(mdl_model.name, strips, vertex_attributes, shape_keys)
+                with span("lod_remap"):
+                    update_mesh_for_lod(mesh)
                 lods.append(
                     Lod(
                         vtx_lod.switch_point,
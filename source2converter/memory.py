@@ -0,0 +1,262 @@
+import json
+import os
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+REPORT_VERSION = 1
+DEFAULT_SNAPSHOT_THRESHOLD = 64 * 1024 * 1024
+# Allocation sites are reported at the innermost frame outside of these, numpy internals say little about who asked
+_LIBRARY_PATHS = tuple({sysconfig.get_path(name) for name in ("stdlib", "platstdlib", "purelib", "platlib")})
+
+
+@dataclass(slots=True)
+class MemoryRecord:
+    stage: str
+    asset: Optional[str]
+    # Bytes. rss_peak is the high-water mark during the stage where the OS lets us reset it (Linux),
+    # otherwise the process peak up to the end of the stage.
+    rss_start: int
+    rss_peak: int
+    traced_start: int
+    traced_peak: int
+    # (file:line, size difference, block count difference) against the start of the asset
+    top_sites: list[tuple[str, int, int]] = field(default_factory=list)
+
+    @property
+    def traced_growth(self) -> int:
+        return self.traced_peak - self.traced_start
+
+
+if sys.platform == "win32":
+    import ctypes
+    from ctypes import wintypes
+
+
+    class _ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+
+    def read_rss() -> tuple[int, int]:
+        counters = _ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters),
+                                                 counters.cb)
+        return counters.WorkingSetSize, counters.PeakWorkingSetSize
+else:
+    import resource
+
+
+    def read_rss() -> tuple[int, int]:
+        # (current, peak) in bytes
+        try:
+            with open("/proc/self/status", "rb") as f:
+                status = dict(line.split(b":", 1) for line in f.read().splitlines() if b":" in line)
+            return int(status[b"VmRSS"].split()[0]) * 1024, int(status[b"VmHWM"].split()[0]) * 1024
+        except (OSError, KeyError, ValueError):
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak = peak if sys.platform == "darwin" else peak * 1024
+            return peak, peak
+
+
+# Linux resets VmHWM to the current RSS when "5" is written to clear_refs
+RSS_PEAK_RESETTABLE = os.access("/proc/self/clear_refs", os.W_OK)
+
+
+def reset_rss_peak():
+    if RSS_PEAK_RESETTABLE:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+
+
+class _Frame:
+    __slots__ = ("stage", "asset", "rss_start", "rss_peak", "traced_start", "traced_peak", "snapshot")
+
+    def __init__(self, stage: str, asset: Optional[str], rss: int, traced: int,
+                 snapshot: Optional[tracemalloc.Snapshot]):
+        self.stage = stage
+        self.asset = asset
+        self.rss_start = self.rss_peak = rss
+        self.traced_start = self.traced_peak = traced
+        self.snapshot = snapshot
+
+
+class MemoryRecorder:
+    """Peak RSS and tracemalloc peaks per stage, fed by timing.span and timing.asset_scope.
+
+    Peaks are reset when a stage starts and folded back into the enclosing stages when it ends, so nested stages
+    still report the peak of their whole body. The peaks are process wide while writer threads open stages of their
+    own, so before any reset the peak so far is folded into the open stage of every thread. Stages whose traced peak grows past snapshot_threshold also record
+    their top allocation sites, snapshots are too slow to take for every stage.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.top_sites = 5
+        self.snapshot_threshold = DEFAULT_SNAPSHOT_THRESHOLD
+        self._started_tracemalloc = False
+        self._records: list[MemoryRecord] = []
+        self._counts: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Stage stack of every thread that entered one, by thread id
+        self._stacks: dict[int, list[_Frame]] = {}
+
+    def start(self, top_sites: int = 5, snapshot_threshold: int = DEFAULT_SNAPSHOT_THRESHOLD, frames: int = 16):
+        self.top_sites = top_sites
+        self.snapshot_threshold = snapshot_threshold
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._started_tracemalloc = True
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _stack(self) -> list[_Frame]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+            with self._lock:
+                self._stacks[threading.get_ident()] = stack
+        return stack
+
+    def enter(self, stage: str, asset: Optional[str], asset_start: bool = False):
+        stack = self._stack()
+        with self._lock:
+            rss, rss_peak = read_rss()
+            _, traced_peak = tracemalloc.get_traced_memory()
+            # Fold the peaks seen so far into the innermost stage of every thread before they are reset, the
+            # enclosing stages get them when it exits
+            for thread_stack in self._stacks.values():
+                if thread_stack:
+                    thread_stack[-1].rss_peak = max(thread_stack[-1].rss_peak, rss_peak)
+                    thread_stack[-1].traced_peak = max(thread_stack[-1].traced_peak, traced_peak)
+            reset_rss_peak()
+            tracemalloc.reset_peak()
+            frame = _Frame(stage, asset, rss, tracemalloc.get_traced_memory()[0], None)
+            stack.append(frame)
+        if asset_start and self.top_sites:
+            frame.snapshot = tracemalloc.take_snapshot()
+
+    def exit(self):
+        stack = self._stack()
+        with self._lock:
+            # Under the lock, another thread's enter() may be folding into this frame
+            frame = stack.pop()
+            _, rss_peak = read_rss()
+            _, traced_peak = tracemalloc.get_traced_memory()
+            frame.rss_peak = max(frame.rss_peak, rss_peak)
+            frame.traced_peak = max(frame.traced_peak, traced_peak)
+            if stack:
+                stack[-1].rss_peak = max(stack[-1].rss_peak, frame.rss_peak)
+                stack[-1].traced_peak = max(stack[-1].traced_peak, frame.traced_peak)
+        top_sites = []
+        if frame.traced_peak - frame.traced_start >= self.snapshot_threshold:
+            top_sites = self._top_sites(stack + [frame])
+        with self._lock:
+            self._records.append(MemoryRecord(frame.stage, frame.asset, frame.rss_start, frame.rss_peak,
+                                              frame.traced_start, frame.traced_peak, top_sites))
+
+    def _top_sites(self, stack: list[_Frame]) -> list[tuple[str, int, int]]:
+        baseline = next((frame.snapshot for frame in reversed(stack) if frame.snapshot is not None), None)
+        if baseline is None or not self.top_sites:
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                                               tracemalloc.Filter(False, __file__)))
+        sites: dict[str, list[int]] = {}
+        for stat in snapshot.compare_to(baseline, "traceback"):
+            if stat.size_diff <= 0:
+                continue
+            frame = next((frame for frame in reversed(stat.traceback)
+                          if not frame.filename.startswith(_LIBRARY_PATHS)), stat.traceback[-1])
+            site = sites.setdefault(f"{frame.filename}:{frame.lineno}", [0, 0])
+            site[0] += stat.size_diff
+            site[1] += stat.count_diff
+        top = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)[:self.top_sites]
+        return [(site, size, count) for site, (size, count) in top]
+
+    def add_counts(self, asset: Optional[str], counts: dict[str, int]):
+        if asset is None:
+            return
+        with self._lock:
+            asset_counts = self._counts.setdefault(asset, {})
+            for name, value in counts.items():
+                asset_counts[name] = asset_counts.get(name, 0) + value
+
+    def take(self) -> tuple[list[MemoryRecord], dict[str, dict[str, int]]]:
+        with self._lock:
+            records, self._records = self._records, []
+            counts, self._counts = self._counts, {}
+        return records, counts
+
+    def merge(self, records: Iterable[MemoryRecord], counts: dict[str, dict[str, int]]):
+        with self._lock:
+            self._records.extend(records)
+        for asset, asset_counts in counts.items():
+            self.add_counts(asset, asset_counts)
+
+    def clear(self):
+        self.take()
+
+    def build_report(self, largest: int = 10) -> dict:
+        with self._lock:
+            records = list(self._records)
+            counts = {asset: dict(asset_counts) for asset, asset_counts in self._counts.items()}
+        assets: dict[str, dict] = {}
+        stages: dict[str, dict] = {}
+        for record in records:
+            stage = stages.setdefault(record.stage, {"calls": 0, "rss_peak": 0, "traced_growth": 0})
+            stage["calls"] += 1
+            stage["rss_peak"] = max(stage["rss_peak"], record.rss_peak)
+            stage["traced_growth"] = max(stage["traced_growth"], record.traced_growth)
+            if record.asset is None:
+                continue
+            asset = assets.setdefault(record.asset, {"counts": counts.get(record.asset, {}), "rss_peak": 0,
+                                                     "traced_growth": 0, "stages": {}})
+            asset["rss_peak"] = max(asset["rss_peak"], record.rss_peak)
+            asset["traced_growth"] = max(asset["traced_growth"], record.traced_growth)
+            asset_stage = asset["stages"].setdefault(record.stage, {"calls": 0, "rss_peak": 0, "traced_growth": 0,
+                                                                     "top_sites": []})
+            asset_stage["calls"] += 1
+            asset_stage["rss_peak"] = max(asset_stage["rss_peak"], record.rss_peak)
+            if record.traced_growth >= asset_stage["traced_growth"]:
+                asset_stage["traced_growth"] = record.traced_growth
+                asset_stage["top_sites"] = [{"site": site, "size": size, "count": count}
+                                            for site, size, count in record.top_sites] or asset_stage["top_sites"]
+        largest_assets = sorted(assets.items(), key=lambda item: item[1]["rss_peak"], reverse=True)[:largest]
+        return {
+            "version": REPORT_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "rss_peak_per_stage": RSS_PEAK_RESETTABLE,
+            "stages": stages,
+            "assets": assets,
+            "largest_assets": [{"asset": name, **data} for name, data in largest_assets],
+        }
+
+    def write_report(self, report_path: Path, largest: int = 10) -> dict:
+        report = self.build_report(largest)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = report_path.with_suffix(report_path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(report, indent=2), encoding="utf8")
+        os.replace(tmp_path, report_path)
+        return report
+
+
+_recorder = MemoryRecorder()
+
+
+def get_memory_recorder() -> MemoryRecorder:
+    return _recorder
@@ -19,8 +19,31 @@ class ShapeKey:
 class Mesh:
     name: str
     strips: list[tuple[int, np.ndarray]] = field(repr=False)
+    # Vertex pool, shared by every LOD of a sub model. Only vertex_indices is per LOD.
     vertex_attributes: dict[str, np.ndarray] = field(repr=False)
     shape_keys: list[ShapeKey]
+    # Pool vertices used by this mesh, strip and shape key indices point into this array. None means the whole pool.
+    vertex_indices: Optional[np.ndarray] = field(default=None, repr=False)
+
+    @property
+    def vertex_count(self) -> int:
+        if self.vertex_indices is None:
+            return len(next(iter(self.vertex_attributes.values())))
+        return len(self.vertex_indices)
+
+    def get_vertex_attribute(self, name: str) -> np.ndarray:
+        data = self.vertex_attributes[name]
+        if self.vertex_indices is None:
+            return data
+        return data[self.vertex_indices]
+
+    def __getstate__(self):
+        # Pickled meshes (process pool jobs) carry only the vertices they use, not the whole shared pool
+        state = self.__dict__.copy()
+        if self.vertex_indices is not None:
+            state["vertex_attributes"] = {name: self.get_vertex_attribute(name) for name in self.vertex_attributes}
+            state["vertex_indices"] = None
+        return state
 
 
 @dataclass
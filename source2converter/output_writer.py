@@ -0,0 +1,139 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from source2converter.timing import span
+from source2converter.utils import get_logger
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# Writes queued or in flight before submit() blocks, bounds the memory held by encoded files waiting for the disk
+DEFAULT_MAX_PENDING = 64
+
+
+def write_atomic(output_path: Path, write: Callable[[Path], None]):
+    # Readers (resourcecompiler, the next run) never see a half written file, write() gets a temporary path next to
+    # output_path that replaces it once complete
+    tmp_path = output_path.with_name(output_path.name + f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+class OutputWriter:
+    """Writes output files (DMX, VMAT, VMDL, textures) on background threads while the caller keeps converting.
+
+    submit() takes a function that writes one file to the path it is given. It runs on a writer thread against a
+    temporary name next to the destination, which is renamed into place once complete, so a failed or interrupted
+    write never leaves a truncated file for the manifest to trust. At most max_pending writes are queued or running,
+    further submits wait for one to finish instead of piling up encoded data. Directories are created once per
+    process. flush() waits for everything submitted and raises the first error, callers flush at the end of a job.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending: list[tuple[Path, Future]] = []
+        self._directories: set[Path] = set()
+        self._lock = threading.Lock()
+
+    def configure(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING):
+        self.flush(raise_errors=False)
+        with self._lock:
+            if workers != self.workers and self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            self.workers = workers
+            if max_pending != self.max_pending:
+                self._slots = threading.BoundedSemaphore(max_pending)
+                self.max_pending = max_pending
+
+    def ensure_directory(self, directory: Path):
+        if directory in self._directories:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._directories.add(directory)
+
+    def submit(self, output_path: Path, write: Callable[[Path], None], stage: str = "output_write") -> Future:
+        output_path = Path(output_path)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            # Backpressure, the writers are behind
+            with span("output_wait"):
+                slots.acquire()
+        # Asset scope of the caller carries over, write spans stay attributed to their model or material
+        context = contextvars.copy_context()
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max(1, self.workers), thread_name_prefix="output_writer")
+                future = self._executor.submit(context.run, self._write, output_path, write, stage)
+                self._pending.append((output_path, future))
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def write_text(self, output_path: Path, text: str, encoding: Optional[str] = None,
+                   stage: str = "output_write") -> Future:
+        def write(tmp_path: Path):
+            with tmp_path.open("w", encoding=encoding) as f:
+                f.write(text)
+
+        return self.submit(output_path, write, stage)
+
+    def write_bytes(self, output_path: Path, data: bytes, stage: str = "output_write") -> Future:
+        return self.submit(output_path, lambda tmp_path: tmp_path.write_bytes(data), stage)
+
+    def _write(self, output_path: Path, write: Callable[[Path], None], stage: str):
+        with span(stage):
+            self.ensure_directory(output_path.parent)
+            write_atomic(output_path, write)
+
+    def flush(self, raise_errors: bool = True):
+        # Waits for every submitted file, the first failure is raised once all of them are done
+        with self._lock:
+            pending, self._pending = self._pending, []
+        self._wait(pending, raise_errors)
+
+    def wait(self, futures: list[Future], raise_errors: bool = True):
+        # Like flush() for the given submits only, their failures are reported here and no longer by flush()
+        waited = set(futures)
+        with self._lock:
+            pending = [item for item in self._pending if item[1] in waited]
+            self._pending = [item for item in self._pending if item[1] not in waited]
+        self._wait(pending, raise_errors)
+
+    @staticmethod
+    def _wait(pending: list[tuple[Path, Future]], raise_errors: bool):
+        error = None
+        for output_path, future in pending:
+            exception = future.exception()
+            if exception is not None:
+                get_logger('Output writer').error(f"Failed to write {output_path}: {exception}")
+                error = error or exception
+        if error is not None and raise_errors:
+            raise error
+
+    def shutdown(self):
+        self.flush(raise_errors=False)
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+_writer = OutputWriter()
+
+
+def get_output_writer() -> OutputWriter:
+    return _writer
@@ -0,0 +1,302 @@
+import io
+import json
+from concurrent.futures import Future
+from enum import Enum
+from pathlib import Path
+from typing import Optional
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.library.source1.vmt import VMT
+from SourceIO.library.utils.s1_keyvalues import KVWriter
+from SourceIO.logger import SourceLogMan
+from source2converter.cache import ConversionManifest, track_inputs, record_input, hash_input, file_input, vtx_input, \
+    material_input
+from source2converter.dmx import DmxExportJob, save_dmx_jobs
+from source2converter.materials.registry import MaterialRegistry, ConvertedMaterial
+from source2converter.materials.material_converter_tags import choose_material_converter, SourceType, GameType
+from source2converter.materials.texture_writer import get_texture_writer
+from source2converter.mdl import choose_model_converter
+from source2converter.model import Model, NullSubModel, LoddedSubModel, Material
+from source2converter.model.skeleton import AttachmentParentType
+from source2converter.output_writer import get_output_writer
+from source2converter.timing import span, asset_scope
+from source2converter.utils.math_utils import quaternion_to_euler
+from source2converter.utils.vmdl import Vmdl, BodyGroupList, BodyGroup, BodyGroupChoice, RenderMeshList, RenderMeshFile, \
+    LODGroupList, LODGroup, BoneMarkupList, AnimationList, EmptyAnim, AttachmentList, Attachment
+from utils import sanitize_name, normalize_path
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('S2Conv')
+
+
+class ConversionStatus(Enum):
+    CONVERTED = "converted"
+    SKIPPED = "skipped"
+    # No converter for the material's shader, nothing was written
+    UNSUPPORTED = "unsupported"
+    FAILED = "failed"
+
+
+def load_model(model_path: Path, content_manager: ContentManager) -> Optional[Model]:
+    buffer = content_manager.find_file(model_path)
+    if buffer is None:
+        logger.error(f"Could not find {model_path}")
+        return None
+    ident, version = buffer.read_fmt("4sI")
+    cp = content_manager.get_content_provider_from_asset_path(model_path)
+    buffer.seek(0)
+    handler = choose_model_converter(ident, version, ((cp.steam_id or None) if cp else None))
+    if handler is None:
+        return None
+    return handler(model_path, buffer, content_manager)
+
+
+def build_vmdl(model: Model, model_path: Path, content_path: Path) -> tuple[Vmdl, list[DmxExportJob]]:
+    vmdl = Vmdl()
+    vmdl_bodygroups = vmdl.append(BodyGroupList())
+    vmdl_animation_list = vmdl.append(AnimationList())
+    vmdl_animation_list.append(EmptyAnim())
+    vmdl_lod_group_list = vmdl.append(LODGroupList())
+    vmdl_render_mesh_list = vmdl.append(RenderMeshList())
+    vmdl.append(BoneMarkupList())
+    lod_groups = {}
+    dmx_jobs = []
+    materials = [(material.name, material.full_path) for material in model.materials]
+    model_content_path = normalize_path(model_path.with_suffix(""))
+    for bodygroup in model.bodygroups:
+        vmld_bodygroup = BodyGroup(bodygroup.name)
+        vmdl_bodygroups.append(vmld_bodygroup)
+        for sub_model in bodygroup.sub_models:
+            if isinstance(sub_model, NullSubModel):
+                vmld_bodygroup.append(BodyGroupChoice([]))
+            elif isinstance(sub_model, LoddedSubModel):
+                sub_model_name = sanitize_name(sub_model.name)
+                vmdl_bodygroup_choice = BodyGroupChoice([])
+                vmld_bodygroup.append(vmdl_bodygroup_choice)
+
+                for i, lod in enumerate(sub_model.lods):
+                    if i in lod_groups:
+                        log_group = lod_groups[i]
+                    else:
+                        if lod.switch_point < 0:
+                            switch_point = 99999999.0
+                        else:
+                            switch_point = lod.switch_point
+                        log_group = lod_groups[i] = LODGroup(switch_point)
+                        vmdl_lod_group_list.append(log_group)
+
+                    if i == 0:
+                        mesh_filename = sub_model_name
+                    else:
+                        mesh_filename = f"{sub_model_name}_LOD{i}"
+                    vmdl_bodygroup_choice.meshes.append(mesh_filename)
+
+                    log_group.meshes.append(mesh_filename)
+                    render_mesh = RenderMeshFile(mesh_filename,
+                                                 (model_content_path / (mesh_filename + ".dmx")).as_posix())
+                    vmdl_render_mesh_list.append(render_mesh)
+
+                    dmx_path = content_path / model_content_path / (mesh_filename + ".dmx")
+                    dmx_jobs.append(DmxExportJob(model.name, sub_model.name, materials, model.skeleton,
+                                                 lod.mesh, dmx_path))
+            else:
+                logger.warn("Unknown submodel type")
+                continue
+    return vmdl, dmx_jobs
+
+
+# (material path, has_shape_keys, converted material, its queued writes), completed in the registry once written
+PendingMaterial = tuple[str, bool, ConvertedMaterial, list[Future]]
+
+
+def convert_material(material: Material, has_shape_keys: bool, content_manager: ContentManager, content_path: Path,
+                     game: GameType = GameType.CS2, manifest: Optional[ConversionManifest] = None,
+                     registry: Optional[MaterialRegistry] = None,
+                     pending: Optional[list[PendingMaterial]] = None) -> Optional[ConvertedMaterial]:
+    # The registry only learns about the material once its files are on disk, with a pending list the caller waits
+    # for them (see finish_materials) and keeps converting meanwhile
+    if not material.full_path.endswith(".vmt"):
+        return None
+    if material.buffer is None:
+        logger.warn(f"Material {material.full_path} not found")
+        return None
+    if registry is not None and not registry.claim(material.full_path, game, has_shape_keys):
+        return registry.get(material.full_path, game, has_shape_keys)
+    writes = []
+    try:
+        with asset_scope(material.full_path):
+            converted = _convert_material(material, has_shape_keys, content_manager, content_path, game, manifest,
+                                          writes)
+    except Exception:
+        if registry is not None:
+            registry.release(material.full_path, game, has_shape_keys)
+        raise
+    if registry is not None:
+        if converted is None:
+            registry.release(material.full_path, game, has_shape_keys)
+        elif pending is not None:
+            pending.append((material.full_path, has_shape_keys, converted, writes))
+        else:
+            finish_materials([(material.full_path, has_shape_keys, converted, writes)], registry, game)
+    return converted
+
+
+def finish_materials(pending: list[PendingMaterial], registry: MaterialRegistry, game: GameType):
+    # Completes the materials whose writes all succeeded, the others are released for another model to retry
+    error = None
+    for material_path, has_shape_keys, converted, writes in pending:
+        try:
+            get_output_writer().wait(writes)
+        except Exception as ex:
+            registry.release(material_path, game, has_shape_keys)
+            error = error or ex
+        else:
+            registry.complete(material_path, game, converted, has_shape_keys)
+    if error is not None:
+        raise error
+
+
+def convert_standalone_material(material_path: str, content_manager: ContentManager, content_path: Path,
+                                game: GameType = GameType.CS2, manifest: Optional[ConversionManifest] = None,
+                                registry: Optional[MaterialRegistry] = None) -> ConversionStatus:
+    # Materials no model references (map brushes, overlays, decals), material_path is relative to materials/
+    material = Material(Path(material_path).name, material_path + ".vmt", content_manager.find_material(material_path))
+    if registry is not None and not registry.claim(material.full_path, game):
+        # Converted, or being converted, for a model or an earlier map
+        return ConversionStatus.SKIPPED
+    output_writer = get_output_writer()
+    try:
+        with asset_scope(material.full_path):
+            converted = _convert_material(material, False, content_manager, content_path, game, manifest) \
+                if material.buffer is not None else None
+        output_writer.flush()
+    except Exception:
+        output_writer.flush(raise_errors=False)
+        if registry is not None:
+            registry.release(material.full_path, game)
+        raise
+    if converted is None:
+        if registry is not None:
+            registry.release(material.full_path, game)
+        if material.buffer is None:
+            logger.warn(f"Material {material.full_path} not found")
+            return ConversionStatus.FAILED
+        # _convert_material only gives up on a found material when its shader has no converter
+        return ConversionStatus.UNSUPPORTED
+    if registry is not None:
+        registry.complete(material.full_path, game, converted)
+    return ConversionStatus.CONVERTED
+
+
+def _convert_material(material: Material, has_shape_keys: bool, content_manager: ContentManager, content_path: Path,
+                      game: GameType, manifest: Optional[ConversionManifest],
+                      writes: Optional[list[Future]] = None) -> Optional[ConvertedMaterial]:
+    # Futures of the files this writes are added to writes
+    material_key = f"material:{material.full_path}:{game.name}:{int(has_shape_keys)}"
+    # Switching the texture format or compression writes other files, entries made with other settings are stale
+    settings = json.dumps(get_texture_writer().settings.save_kwargs(), sort_keys=True)
+    if manifest is not None and manifest.is_up_to_date(material_key, content_manager, settings):
+        logger.info(f"Material {material.full_path} is up to date")
+        vmat_path, *texture_paths = manifest.get(material_key).outputs
+        return ConvertedMaterial(Path(vmat_path), [Path(texture_path) for texture_path in texture_paths])
+
+    with track_inputs() as inputs:
+        record_input(material_input(material.full_path), material.buffer)
+        material_data = VMT(material.buffer, material.full_path)
+        material.buffer.seek(0)
+        logger.info(f"Processing Source1 material: {material.full_path}")
+        converter = choose_material_converter(SourceType.Source1Source, game, material_data.shader, has_shape_keys)
+        if converter is None:
+            logger.warn(f"No converter found for {material.full_path} material")
+            return None
+        with span("material_convert"):
+            vmat_props, textures = converter(Path(material.full_path), material.buffer, content_manager)
+
+    tmp = Path(material.full_path)
+    material_save_path = tmp.parent / (tmp.stem + ".vmat")
+    with span("vmat_write"):
+        vmat = io.StringIO()
+        vmat.write('// Generated by Source2Converter\r\n')
+        writer = KVWriter(vmat)
+        writer.write(('Layer0', vmat_props), 1, True)
+        vmat_write = get_output_writer().write_text(content_path / material_save_path, vmat.getvalue())
+    texture_writer = get_texture_writer()
+    texture_writes = [texture_writer.submit(texture.image, content_path / texture.filepath) for texture in textures]
+    if writes is not None:
+        writes.extend([vmat_write] + texture_writes)
+    texture_paths = [Path(texture.filepath) for texture in textures]
+    if manifest is not None:
+        manifest.record(material_key, inputs, [material_save_path] + texture_paths, settings)
+    return ConvertedMaterial(material_save_path, texture_paths)
+
+
+def convert_model(model_path: Path, content_manager: ContentManager, content_path: Path,
+                  game: GameType = GameType.CS2, export_workers: int = 1,
+                  manifest: Optional[ConversionManifest] = None,
+                  registry: Optional[MaterialRegistry] = None) -> ConversionStatus:
+    output_writer = get_output_writer()
+    try:
+        with asset_scope(model_path):
+            status = _convert_model(model_path, content_manager, content_path, game, export_workers, manifest,
+                                    registry)
+    except Exception:
+        output_writer.flush(raise_errors=False)
+        raise
+    # Textures, meshes and the vmdl are written in the background, the model is done once they are on disk
+    output_writer.flush()
+    return status
+
+
+def _convert_model(model_path: Path, content_manager: ContentManager, content_path: Path, game: GameType,
+                   export_workers: int, manifest: Optional[ConversionManifest],
+                   registry: Optional[MaterialRegistry]) -> ConversionStatus:
+    model_key = f"model:{model_path.as_posix()}:{game.name}"
+    if manifest is not None and manifest.is_up_to_date(model_key, content_manager):
+        logger.info(f"Model {model_path} is up to date")
+        entry = manifest.get(model_key)
+        for material_name, material_path in entry.extra["materials"]:
+            material = Material(material_name, material_path,
+                                content_manager.find_material(material_path[:-len(".vmt")]))
+            convert_material(material, entry.extra["has_shape_keys"], content_manager, content_path, game,
+                             manifest, registry)
+        return ConversionStatus.SKIPPED
+
+    with span("model_load"):
+        model = load_model(model_path, content_manager)
+    if model is None:
+        return ConversionStatus.FAILED
+
+    with span("vmdl_build"):
+        vmdl, dmx_jobs = build_vmdl(model, model_path, content_path)
+    # Materials go first so their textures encode on the texture writer threads during the DMX export
+    pending_materials = []
+    try:
+        for material in model.materials:
+            convert_material(material, model.has_shape_keys, content_manager, content_path, game, manifest, registry,
+                             pending_materials)
+        with span("dmx_export"):
+            save_dmx_jobs(dmx_jobs, export_workers, output_writer=get_output_writer())
+        with span("vmdl_write"):
+            vmdl_data = vmdl.write()
+            vmdl_path = model_path.with_suffix(".vmdl")
+            get_output_writer().write_text(content_path / vmdl_path, vmdl_data, "utf8")
+    finally:
+        if registry is not None:
+            finish_materials(pending_materials, registry, game)
+
+    vmdl_attachtments = vmdl.append(AttachmentList())
+    for attachment in model.attachments:
+        if attachment.parent_type != AttachmentParentType.SINGLE_BONE:
+            logger.warn(f"Non SINGLE_BONE attachments({attachment.name}) not supported")
+            continue
+        vmdl_attachment = Attachment(attachment.name, attachment.parent_name, attachment.translation,
+                                     quaternion_to_euler(attachment.rotation))
+        vmdl_attachtments.append(vmdl_attachment)
+
+    if manifest is not None:
+        input_keys = [file_input(model_path), file_input(model_path.with_suffix(".vvd")), vtx_input(model_path)]
+        outputs = [vmdl_path] + [job.output_path.relative_to(content_path) for job in dmx_jobs]
+        manifest.record(model_key, {key: hash_input(key, content_manager) for key in input_keys}, outputs,
+                        materials=[(material.name, material.full_path) for material in model.materials],
+                        has_shape_keys=model.has_shape_keys)
+    return ConversionStatus.CONVERTED
@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import sys
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.library.source1.vmt import VMT
+from SourceIO.library.utils.path_utilities import find_vtx_cm, collect_full_material_names
+from SourceIO.logger import SourceLogMan
+from source2converter.batch import read_manifest
+from source2converter.cache import ConversionManifest
+from source2converter.dependency_graph import TEXTURE_PARAMETERS
+from source2converter.headers import read_mdl_header, read_vvd_header, read_vtx_header, read_vtf_header
+from source2converter.materials.material_converter_tags import GameType
+from source2converter.vmf import collect_vmf_dependencies
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('Plan')
+
+PLAN_VERSION = 1
+# Inputs of the cost model, estimates are a weighted sum of these
+FEATURES = ("models", "materials", "lod_vertices", "flexes", "texels")
+
+
+@dataclass
+class AssetPlan:
+    # Asset names match the timing report: "models/....mdl" for models, "<material>.vmt" for materials
+    asset: str
+    kind: str
+    counts: dict[str, int] = field(default_factory=dict)
+    materials: list[str] = field(default_factory=list)
+    textures: dict[str, list[int]] = field(default_factory=dict)
+    missing: list[str] = field(default_factory=list)
+    problems: list[str] = field(default_factory=list)
+    estimated_seconds: float = 0.0
+    estimated_bytes: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing and not self.problems
+
+    def features(self) -> np.ndarray:
+        return np.array([self.kind == "model", self.kind == "material", self.counts.get("lod_vertices", 0),
+                         self.counts.get("flexes", 0), self.counts.get("texels", 0)], np.float64)
+
+
+def plan_model(model_path: str, content_manager: ContentManager) -> AssetPlan:
+    plan = AssetPlan(model_path, "model")
+    mdl_buffer = content_manager.find_file(model_path)
+    if mdl_buffer is None:
+        plan.missing.append(model_path)
+        return plan
+    try:
+        mdl = read_mdl_header(mdl_buffer)
+    except ValueError as ex:
+        plan.problems.append(f"{model_path}: {ex}")
+        return plan
+    plan.counts.update(bones=mdl.bone_count, flexes=mdl.flex_count, body_parts=len(mdl.body_parts),
+                       bodygroup_choices=sum(mdl.body_parts), skins=mdl.skin_family_count,
+                       materials=len(mdl.material_names))
+
+    vvd_path = Path(model_path).with_suffix(".vvd").as_posix()
+    vvd_buffer = content_manager.find_file(vvd_path)
+    vtx_buffer = find_vtx_cm(Path(model_path), content_manager)
+    if vvd_buffer is None:
+        plan.missing.append(vvd_path)
+    if vtx_buffer is None:
+        plan.missing.append(Path(model_path).with_suffix(".vtx").as_posix())
+    if vvd_buffer is not None and vtx_buffer is not None:
+        try:
+            vvd = read_vvd_header(vvd_buffer)
+            vtx = read_vtx_header(vtx_buffer)
+        except ValueError as ex:
+            plan.problems.append(f"{model_path}: {ex}")
+        else:
+            # Stale .vvd/.vtx next to a recompiled .mdl fail mid-run, the checksums tell early
+            if vvd.checksum != mdl.checksum or vtx.checksum != mdl.checksum:
+                plan.problems.append(f"{model_path}: VVD/VTX checksum does not match the MDL")
+            lod_vertex_counts = vvd.lod_vertex_counts[:vtx.lod_count] or vvd.lod_vertex_counts
+            plan.counts.update(vertices=lod_vertex_counts[0] if lod_vertex_counts else 0, lods=vtx.lod_count,
+                               lod_vertices=sum(lod_vertex_counts))
+
+    full_material_names = collect_full_material_names(mdl.material_names, mdl.material_paths, content_manager)
+    plan.materials = [material_path + ".vmt" for material_path in full_material_names.values()]
+    return plan
+
+
+def plan_material(material_path: str, content_manager: ContentManager) -> AssetPlan:
+    # material_path is relative to the materials folder, with or without extension
+    material_path = material_path[:-len(".vmt")] if material_path.lower().endswith(".vmt") else material_path
+    plan = AssetPlan(material_path + ".vmt", "material")
+    buffer = content_manager.find_material(material_path)
+    if buffer is None:
+        plan.missing.append(f"materials/{material_path}.vmt")
+        return plan
+    material = VMT(buffer, plan.asset)
+    texels = 0
+    for parameter in TEXTURE_PARAMETERS:
+        texture_path = material.get_string(parameter, None)
+        if not texture_path or texture_path in plan.textures:
+            continue
+        texture_buffer = content_manager.find_texture(texture_path)
+        if texture_buffer is None:
+            plan.missing.append(f"materials/{texture_path}.vtf")
+            continue
+        try:
+            vtf = read_vtf_header(texture_buffer)
+        except ValueError as ex:
+            plan.problems.append(f"{texture_path}: {ex}")
+            continue
+        plan.textures[texture_path] = [vtf.width, vtf.height]
+        texels += vtf.texels
+    plan.counts.update(textures=len(plan.textures), texels=texels)
+    return plan
+
+
+def plan_assets(model_paths: Iterable[Path | str], material_paths: Iterable[str],
+                content_manager: ContentManager) -> list[AssetPlan]:
+    # Every material is planned once, however many models use it, like the MaterialRegistry converts it once
+    plans = [plan_model(Path(model_path).as_posix(), content_manager) for model_path in model_paths]
+    materials = {}
+    for material_path in [material for plan in plans for material in plan.materials] + list(material_paths):
+        material_path = material_path[:-len(".vmt")] if material_path.lower().endswith(".vmt") else material_path
+        materials.setdefault(material_path.lower(), material_path)
+    plans += [plan_material(material_path, content_manager) for material_path in materials.values()]
+    return plans
+
+
+@dataclass
+class CostModel:
+    """Estimated conversion time and output size per asset, linear in FEATURES.
+
+    The defaults are rough figures for a desktop CPU writing PNG textures. calibrate() fits both to a timing report
+    (batch --report) and the outputs of an earlier run of the same content.
+    """
+    seconds: dict[str, float] = field(default_factory=lambda: {
+        "models": 0.05, "materials": 0.02, "lod_vertices": 4e-6, "flexes": 2e-3, "texels": 1e-7,
+    })
+    output_bytes: dict[str, float] = field(default_factory=lambda: {
+        "models": 16384, "materials": 1024, "lod_vertices": 120, "flexes": 4096, "texels": 2,
+    })
+
+    def estimate(self, plan: AssetPlan):
+        features = plan.features()
+        plan.estimated_seconds = float(features @ np.array([self.seconds[name] for name in FEATURES]))
+        plan.estimated_bytes = int(features @ np.array([self.output_bytes[name] for name in FEATURES]))
+
+    def calibrate(self, plans: list[AssetPlan], timing_report: Optional[dict] = None,
+                  manifest: Optional[ConversionManifest] = None, game: GameType = GameType.CS2):
+        plans = [plan for plan in plans if plan.ok]
+        if timing_report is not None:
+            assets = timing_report.get("assets", {})
+            measured = [(plan.features(), assets[plan.asset]["total"]) for plan in plans if plan.asset in assets]
+            self.seconds = _fit(measured, self.seconds, "time")
+        if manifest is not None:
+            measured = []
+            for plan in plans:
+                keys = [f"model:{plan.asset}:{game.name}"] if plan.kind == "model" else \
+                    [f"material:{plan.asset}:{game.name}:{shape_keys}" for shape_keys in (0, 1)]
+                entry = next((manifest.get(key) for key in keys if manifest.get(key) is not None), None)
+                if entry is None:
+                    continue
+                output_paths = [manifest.content_path / output for output in entry.outputs]
+                if all(path.exists() for path in output_paths):
+                    measured.append((plan.features(), sum(path.stat().st_size for path in output_paths)))
+            self.output_bytes = _fit(measured, self.output_bytes, "size")
+
+    def save(self, path: Path):
+        path.write_text(json.dumps(asdict(self), indent=2), encoding="utf8")
+
+    @classmethod
+    def load(cls, path: Path) -> 'CostModel':
+        return cls(**json.loads(path.read_text(encoding="utf8")))
+
+
+def _fit(measured: list[tuple[np.ndarray, float]], coefficients: dict[str, float], what: str) -> dict[str, float]:
+    # Least squares over the features the samples actually vary in, the others keep their previous value
+    if not measured:
+        logger.warn(f"No planned asset has a measured {what}, keeping the {what} model")
+        return coefficients
+    features = np.stack([sample for sample, _ in measured])
+    targets = np.array([target for _, target in measured], np.float64)
+    used = features.any(axis=0)
+    if len(measured) < used.sum():
+        logger.warn(f"{len(measured)} samples are too few to calibrate the {what} model")
+        return coefficients
+    solution, *_ = np.linalg.lstsq(features[:, used], targets, rcond=None)
+    coefficients = dict(coefficients)
+    for name, value in zip(np.array(FEATURES)[used], solution):
+        coefficients[str(name)] = max(float(value), 0.0)
+    logger.info(f"Calibrated the {what} model on {len(measured)} assets")
+    return coefficients
+
+
+def build_plan_report(plans: list[AssetPlan]) -> dict:
+    plans = sorted(plans, key=lambda plan: plan.estimated_seconds, reverse=True)
+    return {
+        "version": PLAN_VERSION,
+        "models": sum(plan.kind == "model" for plan in plans),
+        "materials": sum(plan.kind == "material" for plan in plans),
+        "estimated_seconds": sum(plan.estimated_seconds for plan in plans),
+        "estimated_bytes": sum(plan.estimated_bytes for plan in plans),
+        "problems": [plan.asset for plan in plans if not plan.ok],
+        "assets": [asdict(plan) for plan in plans],
+    }
+
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description='Estimate a conversion from the asset headers, without converting')
+    args.add_argument('-c', '--content', type=str, nargs='+', required=True, dest='content_roots',
+                      help='Source1 game/content folders to scan')
+    args.add_argument('-g', '--game', type=str, default=GameType.CS2.value, dest='game',
+                      help=f"Select a target game, supported: {', '.join(map(lambda a: a.value, list(GameType)))}")
+    args.add_argument('-m', '--manifest', type=str, dest='manifest',
+                      help='Text (one path per line) or JSON list of model paths')
+    args.add_argument('--maps', type=str, nargs='+', default=[], dest='maps',
+                      help='Plan every model and material these VMF files use')
+    args.add_argument('--cost-model', type=str, dest='cost_model', help='Cost model JSON to estimate with')
+    args.add_argument('--calibrate', type=str, dest='calibrate',
+                      help='Timing report (batch --report) of an earlier run, fits the time model to it')
+    args.add_argument('--calibrate-output', type=str, dest='calibrate_output',
+                      help='Add-on content folder of an earlier run, fits the size model to its outputs')
+    args.add_argument('--save-cost-model', type=str, dest='save_cost_model', help='Write the cost model here')
+    args.add_argument('--json', type=str, dest='json', help='Write the full plan to this file')
+    args.add_argument('--order', type=str, dest='order',
+                      help='Write the models, most expensive first, as a batch manifest (batch -m)')
+    args.add_argument('models', type=str, nargs='*', help='Model paths relative to the content roots')
+    args = args.parse_args()
+
+    content_manager = ContentManager()
+    for content_root in args.content_roots:
+        content_manager.scan_for_content(content_root)
+    model_paths = [Path(model) for model in args.models]
+    if args.manifest:
+        model_paths.extend(read_manifest(Path(args.manifest)))
+    material_paths = []
+    if args.maps:
+        map_dependencies = collect_vmf_dependencies(Path(vmf) for vmf in args.maps)
+        model_paths.extend(Path(model) for model in sorted(map_dependencies.models))
+        material_paths.extend(sorted(map_dependencies.materials))
+
+    asset_plans = plan_assets(model_paths, material_paths, content_manager)
+    cost_model = CostModel.load(Path(args.cost_model)) if args.cost_model else CostModel()
+    if args.calibrate or args.calibrate_output:
+        cost_model.calibrate(asset_plans,
+                             json.loads(Path(args.calibrate).read_text(encoding="utf8")) if args.calibrate else None,
+                             ConversionManifest(Path(args.calibrate_output)) if args.calibrate_output else None,
+                             GameType(args.game))
+    if args.save_cost_model:
+        cost_model.save(Path(args.save_cost_model))
+    for asset_plan in asset_plans:
+        cost_model.estimate(asset_plan)
+    report = build_plan_report(asset_plans)
+
+    for asset_plan in asset_plans:
+        for missing in asset_plan.missing:
+            logger.warn(f"{asset_plan.asset}: {missing} not found")
+        for problem in asset_plan.problems:
+            logger.warn(problem)
+    cpu_minutes = report['estimated_seconds'] / 60
+    workers = os.cpu_count() or 1
+    logger.info(f"{report['models']} models and {report['materials']} materials, estimated {cpu_minutes:.1f} CPU "
+                f"minutes ({cpu_minutes / workers:.1f} with {workers} workers) and "
+                f"{report['estimated_bytes'] / (1024 * 1024):.0f} MiB of output")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf8")
+    if args.order:
+        Path(args.order).write_text("".join(f"{plan['asset']}\n" for plan in report["assets"]
+                                            if plan["kind"] == "model"), encoding="utf8")
+    sys.exit(1 if report["problems"] else 0)
@@ -0,0 +1,167 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from source2converter.memory import get_memory_recorder
+
+# Span name of the whole conversion of one asset, nested stages are recorded next to it
+ASSET_TOTAL = "total"
+REPORT_VERSION = 1
+
+_current_asset: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("timing_asset", default=None)
+# Time spent in asset scopes nested in the current one (materials converted by a model), left out of its total
+_nested_total: contextvars.ContextVar[Optional[list[float]]] = contextvars.ContextVar("timing_nested_total",
+                                                                                      default=None)
+
+
+@dataclass(slots=True)
+class TimingRecord:
+    stage: str
+    asset: Optional[str]
+    elapsed: float
+
+
+class TimingRecorder:
+    """Collects stage timings of the current process, disabled until a caller asks for a report.
+
+    Worker processes hand their records to the parent with take(), like ConversionManifest.take_updates.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._records: list[TimingRecord] = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, asset: Optional[str], elapsed: float):
+        with self._lock:
+            self._records.append(TimingRecord(stage, asset, elapsed))
+
+    def take(self) -> list[TimingRecord]:
+        with self._lock:
+            records, self._records = self._records, []
+        return records
+
+    def merge(self, records: Iterable[TimingRecord]):
+        with self._lock:
+            self._records.extend(records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def build_report(self, slowest: int = 10) -> dict:
+        with self._lock:
+            records = list(self._records)
+        assets: dict[str, dict] = {}
+        stage_calls: dict[str, int] = {}
+        # Per stage: total time spent in it by every asset, percentiles are taken over these
+        stage_asset_totals: dict[str, dict[Optional[str], float]] = {}
+        for record in records:
+            stage_calls[record.stage] = stage_calls.get(record.stage, 0) + 1
+            per_asset = stage_asset_totals.setdefault(record.stage, {})
+            per_asset[record.asset] = per_asset.get(record.asset, 0.0) + record.elapsed
+            if record.asset is None:
+                continue
+            asset = assets.setdefault(record.asset, {"total": 0.0, "stages": {}})
+            if record.stage == ASSET_TOTAL:
+                asset["total"] += record.elapsed
+            else:
+                asset["stages"][record.stage] = asset["stages"].get(record.stage, 0.0) + record.elapsed
+
+        stages = {}
+        for stage, per_asset in stage_asset_totals.items():
+            totals = np.fromiter(per_asset.values(), np.float64, len(per_asset))
+            p50, p90, p99 = np.percentile(totals, (50, 90, 99))
+            stages[stage] = {
+                "calls": stage_calls[stage],
+                "assets": len(totals),
+                "total": float(totals.sum()),
+                "mean": float(totals.mean()),
+                "p50": float(p50),
+                "p90": float(p90),
+                "p99": float(p99),
+                "max": float(totals.max()),
+            }
+        slowest_assets = sorted(assets.items(), key=lambda item: item[1]["total"], reverse=True)[:slowest]
+        return {
+            "version": REPORT_VERSION,
+            "pid": os.getpid(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "stages": stages,
+            "assets": assets,
+            "slowest_assets": [{"asset": name, **data} for name, data in slowest_assets],
+        }
+
+    def write_report(self, report_path: Path, slowest: int = 10) -> dict:
+        report = self.build_report(slowest)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = report_path.with_suffix(report_path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(report, indent=2), encoding="utf8")
+        os.replace(tmp_path, report_path)
+        return report
+
+
+_recorder = TimingRecorder()
+
+
+def get_timing_recorder() -> TimingRecorder:
+    return _recorder
+
+
+@contextmanager
+def span(stage: str, asset: Optional[str] = None):
+    # Tagged with the innermost asset_scope unless an asset is given, also feeds the memory recorder
+    memory_recorder = get_memory_recorder()
+    timed, traced = _recorder.enabled, memory_recorder.enabled
+    if not timed and not traced:
+        yield
+        return
+    asset = asset if asset is not None else _current_asset.get()
+    is_total = stage == ASSET_TOTAL
+    if traced:
+        memory_recorder.enter(stage, asset, is_total)
+    if is_total:
+        nested = [0.0]
+        nested_token = _nested_total.set(nested)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if is_total:
+            _nested_total.reset(nested_token)
+            outer = _nested_total.get()
+            if outer is not None:
+                outer[0] += elapsed
+            # Totals are exclusive, the per asset totals add up to the wall time and fit CostModel.calibrate
+            elapsed -= nested[0]
+        if traced:
+            memory_recorder.exit()
+        if timed:
+            _recorder.add(stage, asset, elapsed)
+
+
+@contextmanager
+def asset_scope(asset: Path | str):
+    asset = Path(asset).as_posix()
+    token = _current_asset.set(asset)
+    try:
+        with span(ASSET_TOTAL, asset):
+            yield
+    finally:
+        _current_asset.reset(token)
+
+
+def record_counts(**counts: int):
+    # Source asset sizes (vertices, flexes, textures...) reported next to the memory peaks of the current asset
+    memory_recorder = get_memory_recorder()
+    if memory_recorder.enabled:
+        memory_recorder.add_counts(_current_asset.get(), counts)
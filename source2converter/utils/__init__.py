@@ -0,0 +1,8 @@
+from functools import cache
+
+
+@cache
+def get_logger(name: str):
+    # SourceIO is only imported once there is something to log, modules using this stay importable without it
+    from SourceIO.logger import SourceLogMan
+    return SourceLogMan().get_logger(name)
@@ -1,5 +1,6 @@
 import dataclasses
 from dataclasses import dataclass, field
+from functools import cache
 from typing import Any, TypeVar
 
 from SourceIO.library.utils.s2_keyvalues import KeyValues
@@ -10,11 +11,17 @@ class Node(dict[str, Any]):
     _class: str = field(init=False, default="")
 
     def dump(self):
-        data = dataclasses.asdict(self)
+        # One walk over the tree: field values go to KeyValues as they are, asdict would deep copy every list
+        data = {name: getattr(self, name) for name in _field_names(type(self))}
         data["_class"] = self.__class__.__name__
         return data
 
 
+@cache
+def _field_names(node_class: type) -> tuple[str, ...]:
+    return tuple(node_field.name for node_field in dataclasses.fields(node_class))
+
+
 T = TypeVar("T", bound=Node)
 
 
@@ -27,9 +34,8 @@ class ListNode(Node[T]):
         return self
 
     def dump(self):
-        data = dataclasses.asdict(self)
+        data = super().dump()
         data["children"] = [child.dump() for child in self.children]
-        data["_class"] = self.__class__.__name__
         return data
 
 
@@ -0,0 +1,203 @@
+import argparse
+import os
+import re
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, TextIO
+
+from SourceIO.library.shared.content_providers.content_manager import ContentManager
+from SourceIO.logger import SourceLogMan
+from source2converter.materials.material_converter_tags import GameType
+
+log_manager = SourceLogMan()
+logger = log_manager.get_logger('VMF')
+
+
+class TokenType(Enum):
+    STRING = "string"
+    OPEN = "{"
+    CLOSE = "}"
+
+
+# Quoted strings never span lines in VMFs, so the file is tokenized one line at a time
+_TOKEN_RE = re.compile(r'"([^"]*)"?|(\{)|(\})|//.*|([^\s{}"]+)')
+
+OVERLAY_CLASSES = ("info_overlay", "info_overlay_transition")
+DECAL_CLASSES = ("infodecal",)
+SPRITE_EXTENSIONS = (".vmt", ".spr")
+# Hammer-only materials, Source2 games ship their own
+SKIPPED_MATERIAL_FOLDERS = ("tools/",)
+
+
+def tokenize_vmf(stream: TextIO) -> Iterator[tuple[TokenType, str]]:
+    for line in stream:
+        for match in _TOKEN_RE.finditer(line):
+            quoted, open_brace, close_brace, bare = match.groups()
+            if quoted is not None:
+                yield TokenType.STRING, quoted
+            elif bare is not None:
+                yield TokenType.STRING, bare
+            elif open_brace:
+                yield TokenType.OPEN, open_brace
+            elif close_brace:
+                yield TokenType.CLOSE, close_brace
+
+
+@dataclass
+class VmfDependencies:
+    # Models as "models/....mdl", materials relative to the materials folder without extension, both lower case
+    models: set[str] = field(default_factory=set)
+    materials: set[str] = field(default_factory=set)
+
+    def update(self, other: 'VmfDependencies'):
+        self.models |= other.models
+        self.materials |= other.materials
+
+
+def normalize_model_path(model_path: str) -> str:
+    model_path = model_path.replace("\\", "/").strip("/").lower()
+    return model_path if model_path.startswith("models/") else "models/" + model_path
+
+
+def normalize_material_path(material_path: str) -> str:
+    material_path = material_path.replace("\\", "/").strip("/").lower()
+    if material_path.startswith("materials/"):
+        material_path = material_path[len("materials/"):]
+    for extension in SPRITE_EXTENSIONS:
+        if material_path.endswith(extension):
+            return material_path[:-len(extension)]
+    return material_path
+
+
+class _Block:
+    __slots__ = ("name", "keys")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.keys: dict[str, str] = {}
+
+
+def _collect_block(block: _Block, dependencies: VmfDependencies):
+    if block.name == "side":
+        material = block.keys.get("material")
+        if material:
+            _add_material(dependencies, material)
+    elif block.name == "entity":
+        class_name = block.keys.get("classname", "").lower()
+        model = block.keys.get("model", "")
+        # Brush entities use "*<index>" models, env_sprite and friends point at materials
+        if model.lower().endswith(".mdl"):
+            dependencies.models.add(normalize_model_path(model))
+        elif model.lower().endswith(SPRITE_EXTENSIONS):
+            _add_material(dependencies, model)
+        # Other entities use "material" for unrelated settings (func_breakable gibs), only take it where it is one
+        material = None
+        if class_name in OVERLAY_CLASSES:
+            material = block.keys.get("material")
+        elif class_name in DECAL_CLASSES:
+            material = block.keys.get("texture")
+        if material:
+            _add_material(dependencies, material)
+
+
+def _add_material(dependencies: VmfDependencies, material: str):
+    material = normalize_material_path(material)
+    if not material.startswith(SKIPPED_MATERIAL_FOLDERS):
+        dependencies.materials.add(material)
+
+
+def extract_vmf_dependencies(stream: TextIO) -> VmfDependencies:
+    dependencies = VmfDependencies()
+    blocks: list[_Block] = []
+    pending: Optional[str] = None
+    for token_type, value in tokenize_vmf(stream):
+        if token_type == TokenType.STRING:
+            if pending is None:
+                pending = value
+            else:
+                if blocks:
+                    blocks[-1].keys[pending.lower()] = value
+                pending = None
+        elif token_type == TokenType.OPEN:
+            blocks.append(_Block((pending or "").lower()))
+            pending = None
+        else:
+            if blocks:
+                _collect_block(blocks.pop(), dependencies)
+            pending = None
+    if blocks:
+        logger.warn(f"VMF ended inside {len(blocks)} unclosed block(s)")
+    return dependencies
+
+
+def collect_vmf_dependencies(vmf_paths: Iterable[Path]) -> VmfDependencies:
+    dependencies = VmfDependencies()
+    for vmf_path in vmf_paths:
+        with Path(vmf_path).open("r", encoding="utf8", errors="replace") as f:
+            map_dependencies = extract_vmf_dependencies(f)
+        logger.info(f"{vmf_path}: {len(map_dependencies.models)} models, "
+                    f"{len(map_dependencies.materials)} materials")
+        dependencies.update(map_dependencies)
+    return dependencies
+
+
+if __name__ == '__main__':
+    # Imported here, the batch and dependency graph modules use the parser above
+    from source2converter.batch import run_batch
+    from source2converter.dependency_graph import DependencyGraph, GRAPH_NAME, build_dependency_graph, map_node, \
+        node_for_file, split_node, update_dependency_graph
+
+    args = argparse.ArgumentParser(description='Convert every model and material used by a set of VMF maps')
+    args.add_argument('-c', '--content', type=str, nargs='+', required=True, dest='content_roots',
+                      help='Source1 game/content folders to scan')
+    args.add_argument('-o', '--output', type=str, required=True, dest='content_path',
+                      help='Source2 add-on content folder')
+    args.add_argument('-g', '--game', type=str, default=GameType.CS2.value, dest='game',
+                      help=f"Select a target game, supported: {', '.join(map(lambda a: a.value, list(GameType)))}")
+    args.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, dest='workers',
+                      help='Number of worker processes')
+    args.add_argument('--list', action='store_true', dest='list_only',
+                      help='Only print the models and materials the maps use')
+    args.add_argument('--changed', type=str, nargs='+', dest='changed',
+                      help='Only convert what uses these files (paths relative to a content root, or VMF files), '
+                           'according to the dependency graph saved by the last run')
+    args.add_argument('maps', type=str, nargs='+', help='VMF files')
+    args = args.parse_args()
+
+    if args.list_only:
+        map_dependencies = collect_vmf_dependencies(Path(vmf) for vmf in args.maps)
+        for dependency in sorted(map_dependencies.models) + sorted(map_dependencies.materials):
+            print(dependency)
+    else:
+        content_roots = [Path(root) for root in args.content_roots]
+        content_path = Path(args.content_path)
+        content_manager = ContentManager()
+        for content_root in content_roots:
+            content_manager.scan_for_content(content_root)
+        graph_path = content_path / GRAPH_NAME
+        map_nodes = [map_node(vmf) for vmf in args.maps]
+        dependency_graph = DependencyGraph.load(graph_path) if args.changed else None
+        if dependency_graph is None or not all(node in dependency_graph for node in map_nodes):
+            dependency_graph = build_dependency_graph(content_manager, [Path(vmf) for vmf in args.maps])
+            selected = dependency_graph.nodes
+        else:
+            changed = {node_for_file(path) for path in args.changed} - {None}
+            # Edges of the changed assets are read again, an edited VMT may use other textures now
+            update_dependency_graph(dependency_graph, changed & set(dependency_graph.nodes), content_manager)
+            selected = dependency_graph.downstream(changed)
+        dependency_graph.save(graph_path)
+
+        # Only what these maps use, the saved graph may cover other maps as well. Materials of models are converted
+        # with their model, which knows whether they need morph support, only those the maps reference themselves
+        # (brushes, overlays, decals, sprites) become jobs of their own.
+        used = dependency_graph.upstream(map_nodes)
+        map_materials = {dependency for node in map_nodes for dependency in dependency_graph.dependencies(node)
+                         if split_node(dependency)[0] == "material"}
+        jobs = [split_node(node) for node in sorted(used & set(selected))
+                if split_node(node)[0] == "model" or node in map_materials]
+        logger.info(f"{len(args.maps)} maps, {len(jobs)} assets to check")
+        run_batch([path for kind, path in jobs if kind == "model"], content_roots, content_path,
+                  GameType(args.game), args.workers,
+                  material_paths=[path for kind, path in jobs if kind == "material"],
+                  dependency_graph=dependency_graph)
@@ -0,0 +1,113 @@
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from source2converter.dmx.binary_writer import DmxType, ARRAY_TYPE_OFFSET, ENCODING_VERSION, FIXED_LAYOUTS
+from source2converter.dmx.stream import DmxStreamModel, BLEND_INDICES, POSITION
+
+
+class _Reader:
+    """Just enough of a binary DMX (encoding 9) reader to check what DmxBinaryWriter wrote, without SourceIO."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt: str):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def string(self) -> str:
+        end = self.data.index(b"\0", self.offset)
+        string = self.data[self.offset:end].decode("utf8")
+        self.offset = end + 1
+        return string
+
+    def numbers(self, dmx_type: DmxType, count: int) -> np.ndarray:
+        dtype, components = FIXED_LAYOUTS[dmx_type]
+        array = np.frombuffer(self.data, dtype, count * components, self.offset).reshape(count, components)
+        self.offset += array.nbytes
+        return array
+
+
+def _read_dmx(path: Path) -> tuple[str, list[str], list[dict]]:
+    reader = _Reader(path.read_bytes())
+    header = reader.string()
+    assert reader.unpack("<ii") == (1, 0)
+    strings = [reader.string() for _ in range(reader.unpack("<i")[0])]
+    elements = []
+    for _ in range(reader.unpack("<i")[0]):
+        type_id, name_id = reader.unpack("<ii")
+        reader.offset += 16
+        elements.append({"_type": strings[type_id], "_name": strings[name_id]})
+    # Element references are resolved once every element exists
+    references = []
+    for element in elements:
+        for _ in range(reader.unpack("<i")[0]):
+            name_id, type_id = reader.unpack("<iB")
+            name = strings[name_id]
+            is_array = type_id > ARRAY_TYPE_OFFSET
+            dmx_type = DmxType(type_id - ARRAY_TYPE_OFFSET if is_array else type_id)
+            count = reader.unpack("<i")[0] if is_array else 1
+            if dmx_type == DmxType.ELEMENT:
+                ids = reader.unpack(f"<{count}i")
+                references.append((element, name, ids if is_array else ids[0]))
+            elif dmx_type == DmxType.STRING:
+                element[name] = [reader.string() for _ in range(count)] if is_array else strings[reader.unpack("<i")[0]]
+            else:
+                values = reader.numbers(dmx_type, count)
+                element[name] = values if is_array else values[0]
+    for element, name, ids in references:
+        element[name] = [elements[i] for i in ids] if isinstance(ids, tuple) else \
+            (elements[ids] if ids != -1 else None)
+    return header, strings, elements
+
+
+def _build_model() -> tuple[DmxStreamModel, list[str]]:
+    dm_model = DmxStreamModel("test")
+    dm_model.add_skeleton("body_skeleton")
+    bone_names = ["root", "spine", "head"]
+    dm_model.add_bone("root", (0.0, 0.0, 0.0), (0.0, 0.0, 0.0, 1.0), None)
+    dm_model.add_bone("spine", (0.0, 0.0, 10.0), (0.0, 0.0, 0.0, 1.0), "root")
+    dm_model.add_bone("head", (0.0, 0.0, 5.0), (0.0, 0.7071068, 0.0, 0.7071068), "spine")
+    dm_model.add_material("skin", Path("models/test/skin"))
+    mesh = dm_model.add_mesh("body")
+    dm_model.mesh_add_faceset(mesh, dm_model.materials["skin"], np.array([0, 1, 2, 2, 1, 3], np.uint32))
+    dm_model.mesh_add_attribute(mesh, POSITION, DmxType.VECTOR3, np.arange(12, dtype=np.float32).reshape(4, 3))
+    weights = np.full((4, 3), 1 / 3, np.float32)
+    indices = np.array([[0, 1, 2], [2, 2, 2], [1, 0, 0], [0, 0, 0]], np.uint8)
+    dm_model.mesh_add_bone_weights(mesh, bone_names, weights, indices)
+    return dm_model, bone_names
+
+
+def test_stream_writer_layout(tmp_path: Path):
+    dm_model, bone_names = _build_model()
+    dm_model.save(tmp_path / "body.dmx")
+    header, strings, elements = _read_dmx(tmp_path / "body.dmx")
+
+    assert header == f"<!-- dmx encoding binary {ENCODING_VERSION} format model 22 -->\n"
+    assert strings[0] == "name"
+    root = elements[0]
+    assert (root["_type"], root["_name"]) == ("DmElement", "root")
+    skeleton = root["skeleton"]
+    assert skeleton is root["model"]
+    assert (skeleton["_type"], skeleton["_name"]) == ("DmeModel", "body_skeleton")
+
+    # jointList[0] is the model itself, the bones follow in skeleton order and the mesh dag comes last
+    joint_list = skeleton["jointList"]
+    assert [joint["_name"] for joint in joint_list] == ["body_skeleton"] + bone_names + ["body"]
+    assert len(skeleton["baseStates"][0]["transforms"]) == len(joint_list)
+
+    vertex_data = joint_list[-1]["shape"]["bindState"]
+    blend_indices = vertex_data[BLEND_INDICES].reshape(4, 3)
+    source_indices = np.array([[0, 1, 2], [2, 2, 2], [1, 0, 0], [0, 0, 0]])
+    joint_names = [[joint_list[joint_id]["_name"] for joint_id in row] for row in blend_indices]
+    assert joint_names == [[bone_names[bone_id] for bone_id in row] for row in source_indices]
+    np.testing.assert_array_equal(vertex_data[POSITION + "Indices"].ravel(), np.arange(4))
+
+    # Triangles keep the strip order and winding they were given, each terminated by -1
+    face_set = joint_list[-1]["shape"]["faceSets"][0]
+    assert face_set["material"]["mtlName"] == "models/test/skin"
+    np.testing.assert_array_equal(face_set["faces"].ravel(), [0, 1, 2, -1, 2, 1, 3, -1])
@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("SourceIO")
+
+from SourceIO.library.utils import datamodel
+from source2converter.dmx import DmxExportJob, save_dmx
+from source2converter.model import Mesh, ShapeKey
+from source2converter.model.skeleton import Skeleton, Bone
+
+VERTEX_COUNT = 64
+
+
+def _make_job(output_path: Path) -> DmxExportJob:
+    rng = np.random.default_rng(0)
+    triangles = rng.integers(0, VERTEX_COUNT, (40, 3)).astype(np.uint32)
+    weights = rng.random((VERTEX_COUNT, 3)).astype(np.float32)
+    attributes = {
+        "positions": rng.normal(size=(VERTEX_COUNT, 3)).astype(np.float32),
+        "normals": rng.normal(size=(VERTEX_COUNT, 3)).astype(np.float32),
+        "uv0": rng.random((VERTEX_COUNT, 2)).astype(np.float32),
+        "blend_weights": weights / weights.sum(axis=1, keepdims=True),
+        # Bone 0 is the root, the highest index the last bone
+        "blend_indices": rng.integers(0, 3, (VERTEX_COUNT, 3)).astype(np.uint8),
+    }
+    shape_keys = [
+        ShapeKey(name, np.sort(rng.choice(VERTEX_COUNT, 16, replace=False)).astype(np.uint32),
+                 {"positions": rng.normal(size=(16, 3)).astype(np.float32),
+                  "normals": rng.normal(size=(16, 3)).astype(np.float32)}, stereo)
+        for name, stereo in (("smile", False), ("blink", True))
+    ]
+    mesh = Mesh("body", [(0, triangles[:20].ravel()), (1, triangles[20:].ravel())], attributes, shape_keys)
+    skeleton = Skeleton([
+        Bone("root", None, (0.0, 0.0, 0.0), (0.0, 0.0, 0.0, 1.0)),
+        Bone("spine", "root", (0.0, 0.0, 10.0), (0.0, 0.0, 0.0, 1.0)),
+        Bone("head", "spine", (0.0, 0.0, 5.0), (0.0, 0.7071068, 0.0, 0.7071068)),
+    ])
+    materials = [("skin", "models/test/skin.vmt"), ("eyes", "models/test/eyes.vmt")]
+    return DmxExportJob("test", "body", materials, skeleton, mesh, output_path)
+
+
+def _compare(expected, actual, path: str, seen: set):
+    if isinstance(expected, datamodel.Element):
+        assert isinstance(actual, datamodel.Element), path
+        assert (actual.type, actual.name) == (expected.type, expected.name), path
+        # Elements are shared (bindState is currentState), each pair is compared once
+        if (id(expected), id(actual)) in seen:
+            return
+        seen.add((id(expected), id(actual)))
+        assert sorted(actual.keys()) == sorted(expected.keys()), path
+        for name in expected.keys():
+            _compare(expected[name], actual[name], f"{path}.{name}", seen)
+    elif isinstance(expected, (list, tuple)) and expected and isinstance(expected[0], datamodel.Element):
+        assert len(actual) == len(expected), path
+        for n, (expected_item, actual_item) in enumerate(zip(expected, actual)):
+            _compare(expected_item, actual_item, f"{path}[{n}]", seen)
+    elif isinstance(expected, str):
+        assert actual == expected, path
+    elif isinstance(expected, (list, tuple)) and expected and isinstance(expected[0], str):
+        assert list(actual) == list(expected), path
+    elif expected is None:
+        assert actual is None, path
+    else:
+        np.testing.assert_allclose(np.asarray(actual, np.float64), np.asarray(expected, np.float64),
+                                   rtol=1e-6, atol=1e-6, err_msg=path)
+
+
+def test_stream_writer_matches_datamodel(tmp_path: Path):
+    reference_path = save_dmx(_make_job(tmp_path / "datamodel" / "body.dmx"), "datamodel")
+    stream_path = save_dmx(_make_job(tmp_path / "stream" / "body.dmx"), "stream")
+
+    reference = datamodel.load(str(reference_path))
+    stream = datamodel.load(str(stream_path))
+    assert (stream.format, stream.format_ver) == (reference.format, reference.format_ver)
+    # Covers the joint list order, blend indices into it and the skeleton and mesh naming
+    _compare(reference.root, stream.root, "root", set())
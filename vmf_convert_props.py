@@ -1,32 +1,22 @@
-import sys
-from pathlib import Path
-from typing import Set
 import os
+from pathlib import Path
 
-from convert_model import convert_model, compile_model
+from convert_model import compile_model
 
 os.environ['NO_BPY'] = '1'
 
-from SourceIO.library.shared.content_providers.content_manager import ContentManager
-from SourceIO.library.utils.s1_keyvalues import KVParser
-from material_converter import convert_material, Material
-
-used_models: Set[str] = set()
+from source2converter.batch import run_batch
+from source2converter.vmf import collect_vmf_dependencies
 
 if __name__ == '__main__':
     mod_path = Path(r'F:\SteamLibrary\steamapps\common\Half-Life Alyx\content\hlvr_addons\half_life2')
 
-    ContentManager().scan_for_content(r'D:\GAMES\hl2_beta\hl2')
-    with open(r"D:\GAMES\hl2_beta\hl2\maps_src\d1_town\d1_town_01.vmf", 'r') as f:
-        for line in f.readlines():
-            if 'model' in line:
-                line = line.strip('\r\t\n ')
-                _, material_name = line.split(' ')
-                used_models.add(material_name.replace("\"", ""))
+    content_root = Path(r'D:\GAMES\hl2_beta\hl2')
+    vmf_path = Path(r"D:\GAMES\hl2_beta\hl2\maps_src\d1_town\d1_town_01.vmf")
+    used_models = collect_vmf_dependencies([vmf_path]).models
 
-    content_manager = ContentManager()
-    for model in used_models:
-        model = Path(model)
-        full_path = content_manager.find_path(model, extension='.mdl')
-        vmdl_file = convert_model(full_path, mod_path)
-        compile_model(vmdl_file, mod_path)
+    # The content is scanned once per worker and the models are converted in parallel, see run_batch
+    results = run_batch(sorted(used_models), [content_root], mod_path)
+    for result in results:
+        if result.success:
+            compile_model(mod_path / Path(result.asset_path).with_suffix('.vmdl'), mod_path)